@@ -0,0 +1,215 @@
+"""
+Batch generation of many landscapes, without Blender
+
+main.py makes one landscape per Blender launch, from the SEED and NUMBER
+constants. This runs the Blender-free parts (procedural values,
+heightmap, stl model, top-down preview) for lots of seeds at once over
+a process pool.
+
+Every job gets its own directory in the output directory, named after
+its number like NUMBER_PADDED, and is made with pipeline.py, so a job
+that was stopped halfway reuses the stages it had finished. Finished
+jobs are recorded in progress.jsonl with their seed and a fingerprint of
+the settings, so running the same command again carries on where it
+stopped, and a job whose number now has another seed or other settings
+is made again. A summary with the time each job took goes in
+summary.json.
+
+Usage:
+    python batch.py <output dir> --seeds test1 test2 test3
+    python batch.py <output dir> --range 0 500 [--prefix seed-]
+    python batch.py <output dir> --seed-file seeds.txt [--workers 8]
+"""
+
+from typing import *
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+from pipeline import Settings, EXPORT_STAGES
+from erosion import Erosion
+import pipeline
+
+
+PROGRESS_FILENAME = "progress.jsonl"
+SUMMARY_FILENAME = "summary.json"
+
+
+class Job(NamedTuple):
+    """One landscape to make"""
+    number: int
+    seed: str
+
+
+def job_directory(
+        output_dir: str,
+        job: Job
+) -> str:
+    """Where the files for a job go"""
+    return os.path.join(output_dir, str(job.number).rjust(2, "0"))
+
+
+def settings_fingerprint(
+        settings: Settings
+) -> str:
+    """Hash of the settings that change what a job makes (not where it caches)"""
+    description = {k: v for k, v in settings._asdict().items() if k not in ("cache_dir", "cache_max_bytes")}
+    if settings.erosion is not None:
+        description["erosion"] = settings.erosion._asdict()
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def run_job(
+        job: Job,
+        settings: Settings,
+        output_dir: str
+) -> Dict[str, Any]:
+    """Make everything for one job, returns how long it (and each stage) took"""
+    job_start = time.perf_counter()
+    reports = pipeline.run(job.seed, job_directory(output_dir, job), settings)
+    return {
+        "triangles": next(x.info["triangles"] for x in reports if x.name == "model"),
+        "wall_time": time.perf_counter() - job_start,
+        "timings": {x.name: x.time for x in reports},
+        "cached": [x.name for x in reports if x.hit]
+    }
+
+
+def load_progress(
+        output_dir: str
+) -> Dict[Tuple[int, str, Optional[str]], Dict[str, Any]]:
+    """Results of the jobs that already finished, by (number, seed, settings fingerprint)"""
+    path = os.path.join(output_dir, PROGRESS_FILENAME)
+    finished = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    if record["status"] == "ok":
+                        finished[record["number"], record["seed"], record.get("settings")] = record
+    return finished
+
+
+def run_batch(
+        jobs: Sequence[Job],
+        output_dir: str,
+        settings: Settings = Settings(),
+        workers: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Run jobs over a process pool, skipping ones that already finished
+
+    Returns one record per job (including ones finished earlier), which
+    is also saved as the batch summary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    fingerprint = settings_fingerprint(settings)
+    finished = load_progress(output_dir)
+    todo = [job for job in jobs if (job.number, job.seed, fingerprint) not in finished]
+    print(f"{len(jobs) - len(todo)} of {len(jobs)} jobs already done")
+
+    keys = [(job.number, job.seed, fingerprint) for job in jobs]
+    records = [finished[key] for key in keys if key in finished]
+    with open(os.path.join(output_dir, PROGRESS_FILENAME), "a") as progress, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_job, job, settings, output_dir): job for job in todo}
+
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            record = {"number": job.number, "seed": job.seed, "settings": fingerprint}
+            try:
+                record.update(future.result(), status="ok")
+                print(f"[{len(records) + 1}/{len(jobs)}] {job.number} ({job.seed}): "
+                      f"done in {record['wall_time']:.1f}s")
+            except Exception as error:
+                record.update(status="failed", wall_time=None, error=repr(error))
+                print(f"[{len(records) + 1}/{len(jobs)}] {job.number} ({job.seed}): failed, {error!r}")
+            progress.write(json.dumps(record) + "\n")
+            progress.flush()
+            records.append(record)
+
+    records.sort(key=lambda x: x["number"])
+    with open(os.path.join(output_dir, SUMMARY_FILENAME), "w") as file:
+        json.dump(records, file, indent=2)
+    return records
+
+
+def print_summary(
+        records: Sequence[Dict[str, Any]]
+) -> None:
+    """Print the time each job took"""
+    print(f"{'number':>8}  {'seed':<24}  {'status':<8}  {'time':>8}")
+    for record in records:
+        wall_time = "-" if record["wall_time"] is None else f"{record['wall_time']:.1f}s"
+        print(f"{record['number']:>8}  {record['seed']:<24}  {record['status']:<8}  {wall_time:>8}")
+    times = [x["wall_time"] for x in records if x["status"] == "ok"]
+    if times:
+        print(f"{len(times)} ok, mean {np.mean(times):.1f}s, max {np.max(times):.1f}s")
+
+
+def jobs_from_args(
+        args: argparse.Namespace
+) -> List[Job]:
+    """Make the list of jobs from the command line"""
+    if args.seeds:
+        seeds = args.seeds
+    elif args.seed_file:
+        with open(args.seed_file) as file:
+            seeds = [line.strip() for line in file if line.strip()]
+    else:
+        return [Job(i, f"{args.prefix}{i}") for i in range(*args.range)]
+    return [Job((args.first_number or 0) + i, seed) for i, seed in enumerate(seeds)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate lots of landscapes")
+    parser.add_argument("output_dir")
+    seeds = parser.add_mutually_exclusive_group(required=True)
+    seeds.add_argument("--seeds", nargs="+")
+    seeds.add_argument("--seed-file", help="file with one seed per line")
+    seeds.add_argument("--range", nargs=2, type=int, metavar=("START", "STOP"),
+                       help="seeds <prefix><n> for n in range(START, STOP)")
+    parser.add_argument("--prefix", default="", help="seed prefix for --range")
+    parser.add_argument("--first-number", type=int,
+                        help="number of the first seed (default 0), --range numbers them by n instead")
+    parser.add_argument("--workers", type=int, help="processes to use (default: all cores)")
+    defaults = Settings()
+    parser.add_argument("--map-size", type=int, default=defaults.map_size)
+    parser.add_argument("--level", type=int, default=defaults.subdivision_level)
+    parser.add_argument("--decimate-ratio", type=float, default=defaults.decimate_ratio)
+    parser.add_argument("--max-error", type=float)
+    parser.add_argument("--thumbnail-size", type=int, default=defaults.thumbnail_size)
+    parser.add_argument("--exports", nargs="+", default=[], choices=EXPORT_STAGES,
+                        help="also save the model in these formats")
+    parser.add_argument("--erode", action="store_true", help="erode the heightmaps (see erosion.py)")
+    parser.add_argument("--layers", action="store_true", help="also make the derived layers and textures")
+    parser.add_argument("--cache-dir", help="keep displacement maps here and reuse them")
+    parser.add_argument("--cache-gb", type=float, default=defaults.cache_max_bytes / 1024 ** 3)
+    args = parser.parse_args()
+    if args.range and args.first_number is not None:
+        parser.error("--first-number can't be used with --range, the jobs are numbered by n")
+
+    records = run_batch(
+        jobs_from_args(args),
+        args.output_dir,
+        Settings(
+            map_size=args.map_size,
+            subdivision_level=args.level,
+            decimate_ratio=args.decimate_ratio,
+            max_error=args.max_error,
+            thumbnail_size=args.thumbnail_size,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=int(args.cache_gb * 1024 ** 3),
+            exports=tuple(args.exports),
+            erosion=Erosion() if args.erode else None,
+            layers=args.layers
+        ),
+        args.workers
+    )
+    print_summary(records)
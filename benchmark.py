@@ -0,0 +1,380 @@
+"""
+Benchmarks for every stage of making a landscape
+
+Times the pieces of the pipeline on their own: hashing seeds, heightmap
+generation at different map sizes, resampling, simplification (RTIN)
+and stl writing at different subdivision levels, previews and derived
+layers. The mesh cases start from a map with at least as many samples
+as their vertex grid, so a level 12 mesh comes from a 4096+ map, not an
+upsampled small one. Every case runs in a fresh process, so the peak
+memory (RSS) it reports is just that case's. Everything benchmarked runs
+without Blender.
+
+Results (wall time, peak RSS and triangles or items per second) go in a
+JSON file. Given a baseline (an earlier results file), any case that got
+slower by more than the threshold is reported as a regression and the
+exit code is 1, so it can run in CI.
+
+Usage (no Blender needed):
+    python benchmark.py results.json [--full] [--only heightmap stl]
+    python benchmark.py results.json --baseline baseline.json [--threshold 0.15]
+"""
+
+from typing import *
+
+import os
+import sys
+import math
+import json
+import time
+import platform
+import tempfile
+import argparse
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from procedural import (
+    gen_data_from_hash,
+    gen_color_from_seed,
+    gen_noise_value_from_seed,
+    displacement_scale_value_from_seed,
+    adjacent_colors
+)
+from heightmap import generate_heightmap
+import params
+import mesh
+import rtin
+import camera
+import preview
+import layers
+from profiling import peak_rss
+
+
+# sizes benchmarked by default, and with --full
+MAP_SIZES = (512, 1024)
+FULL_MAP_SIZES = (512, 1024, 2048, 4096)
+LEVELS = (8, 9, 10)  # like MODEL_SUBDIVISION_QUALITY
+FULL_LEVELS = (8, 9, 10, 11, 12)
+
+# the map the preview, layers and camera cases use, and the smallest the
+# mesh cases start from (see input_map_size)
+INPUT_MAP_SIZE = 512
+SEED = "test2"
+
+HASH_CALLS = 100000
+PARAMS_SEEDS = 10000
+DECIMATE_RATIO = 0.25
+
+DEFAULT_THRESHOLD = 0.15  # 15% slower is a regression
+MIN_WALL_TIME = 0.05  # quicker cases are too noisy to call regressions
+
+
+class Case(NamedTuple):
+    """One thing to time"""
+    name: str
+    prepare: Callable[[str], Tuple]  # work dir -> arguments for run (not timed)
+    run: Callable[..., int]  # returns how many things it made
+    unit: str  # what run counts, e.g. "triangles"
+    maps: Tuple[int, ...] = (INPUT_MAP_SIZE,)  # sizes of the input maps prepare loads, made beforehand
+
+
+#  ------------------------------
+#  |           Cases            |
+#  ------------------------------
+
+
+def input_map_size(
+        level: int
+) -> int:
+    """Size of the map the mesh cases of a subdivision level start from
+
+    Big enough that the trimmed part has at least as many samples as the
+    vertex grid, so the mesh is made from real detail, not upsampled.
+    """
+    return max(INPUT_MAP_SIZE, math.ceil(2 ** level * mesh.PLANE_SIZE / mesh.TRIM_SIZE) + 1)
+
+
+def _input_map(
+        work_dir: str,
+        size: int = INPUT_MAP_SIZE
+) -> np.ndarray:
+    """A heightmap the cases use, made once per benchmark run"""
+    path = os.path.join(work_dir, f"input-{size}.npy")
+    if not os.path.exists(path):
+        np.save(path, generate_heightmap(gen_noise_value_from_seed(SEED), (size, size)))
+    return np.load(path)
+
+
+def _vertex_grid(
+        work_dir: str,
+        level: int
+) -> np.ndarray:
+    """Trimmed vertex heights for a subdivision level"""
+    samples = 2 ** level + 1
+    return mesh.resample(
+        _input_map(work_dir, input_map_size(level)), (samples, samples), mesh.TRIM_SIZE / mesh.PLANE_SIZE
+    )
+
+
+def _hash(
+        calls: int
+) -> int:
+    """gen_data_from_hash for lots of seeds"""
+    for i in range(calls):
+        gen_data_from_hash(str(i))
+    return calls
+
+
+def _params(
+        seeds: int
+) -> int:
+    """Every procedural value for lots of seeds"""
+    for i in range(seeds):
+        seed = str(i)
+        color = gen_color_from_seed(seed)
+        adjacent_colors(color, seed, 4)
+        gen_noise_value_from_seed(seed)
+        displacement_scale_value_from_seed(seed)
+    return seeds
+
+
+def _params_batch(
+        seeds: int
+) -> int:
+    """Every procedural value for lots of seeds, all at once"""
+    params.seed_params([str(i) for i in range(seeds)])
+    return seeds
+
+
+def _heightmap(
+        size: int
+) -> int:
+    """A displacement map"""
+    generate_heightmap(gen_noise_value_from_seed(SEED), (size, size))
+    return size * size
+
+
+def _resample(
+        heights: np.ndarray,
+        level: int
+) -> int:
+    """Heightmap to trimmed vertex heights"""
+    samples = 2 ** level + 1
+    mesh.resample(heights, (samples, samples), mesh.TRIM_SIZE / mesh.PLANE_SIZE)
+    return samples * samples
+
+
+def _decimate(
+        vertices: np.ndarray
+) -> int:
+    """RTIN errors and the max error for the decimate ratio"""
+    z = vertices * np.float32(displacement_scale_value_from_seed(SEED))
+    errors = rtin.midpoint_errors(z)
+    budget = int(2 * (len(z) - 1) ** 2 * DECIMATE_RATIO)
+    return rtin.triangle_count(errors, rtin.max_error_for_budget(errors, budget))
+
+
+def _adaptive_stl(
+        vertices: np.ndarray,
+        filepath: str
+) -> int:
+    """Simplified stl, like generate_stl"""
+    budget = int(2 * (len(vertices) - 1) ** 2 * DECIMATE_RATIO)
+    return mesh.write_adaptive_stl(
+        filepath, vertices, displacement_scale_value_from_seed(SEED), triangle_budget=budget
+    )
+
+
+def _dense_stl(
+        vertices: np.ndarray,
+        filepath: str
+) -> int:
+    """Full quality stl"""
+    return mesh.write_heightmap_stl(
+        filepath, vertices, displacement_scale_value_from_seed(SEED), mesh.TRIM_SIZE, mesh.TRIM_SIZE
+    )
+
+
+def _preview(
+        heights: np.ndarray,
+        filepath: str
+) -> int:
+    """Top-down preview png"""
+    preview.render_preview(filepath, heights, SEED)
+    return heights.size
+
+
+def _layers(
+        heights: np.ndarray,
+        work_dir: str
+) -> int:
+    """Derived layers and their textures"""
+    layers.write_textures(work_dir, layers.derive(heights, SEED))
+    return heights.size
+
+
+def _camera(
+        heights: np.ndarray
+) -> int:
+    """Camera placement"""
+    return len(camera.best_poses(heights, displacement_scale_value_from_seed(SEED), SEED))
+
+
+def cases(
+        full: bool = False
+) -> List[Case]:
+    """Every benchmark case, --full adds the big (slow) ones"""
+    result = [
+        Case("hash", lambda work_dir: (HASH_CALLS,), _hash, "calls", ()),
+        Case("params", lambda work_dir: (PARAMS_SEEDS,), _params, "seeds", ()),
+        Case("params-batch", lambda work_dir: (PARAMS_SEEDS,), _params_batch, "seeds", ()),
+    ]
+    for size in FULL_MAP_SIZES if full else MAP_SIZES:
+        result.append(Case(f"heightmap-{size}", lambda work_dir, size=size: (size,), _heightmap, "pixels", ()))
+    for level in FULL_LEVELS if full else LEVELS:
+        stl_path = lambda work_dir, level=level: os.path.join(work_dir, f"model-{level}.stl")
+        maps = (input_map_size(level),)
+        result += [
+            Case(f"resample-{level}",
+                 lambda work_dir, level=level: (_input_map(work_dir, input_map_size(level)), level),
+                 _resample, "vertices", maps),
+            Case(f"decimate-{level}", lambda work_dir, level=level: (_vertex_grid(work_dir, level),),
+                 _decimate, "triangles", maps),
+            Case(f"stl-adaptive-{level}",
+                 lambda work_dir, level=level: (_vertex_grid(work_dir, level), stl_path(work_dir, level)),
+                 _adaptive_stl, "triangles", maps),
+            Case(f"stl-dense-{level}",
+                 lambda work_dir, level=level: (_vertex_grid(work_dir, level), stl_path(work_dir, level)),
+                 _dense_stl, "triangles", maps),
+        ]
+    result += [
+        Case("preview", lambda work_dir: (_input_map(work_dir), os.path.join(work_dir, "preview.png")),
+             _preview, "pixels"),
+        Case("layers", lambda work_dir: (_input_map(work_dir), work_dir), _layers, "pixels"),
+        Case("camera", lambda work_dir: (_input_map(work_dir),), _camera, "poses"),
+    ]
+    return result
+
+
+#  ------------------------------
+#  |          Running           |
+#  ------------------------------
+
+
+def _run_case(
+        name: str,
+        work_dir: str,
+        full: bool
+) -> Dict[str, Any]:
+    """Run one case (in a fresh process) and measure it"""
+    case = next(x for x in cases(full) if x.name == name)
+    args = case.prepare(work_dir)
+    rss_before = peak_rss()
+
+    start = time.perf_counter()
+    count = case.run(*args)
+    wall_time = time.perf_counter() - start
+
+    return {
+        "wall_time": wall_time,
+        "peak_rss": peak_rss(),
+        "rss_before": rss_before,
+        "count": count,
+        "unit": case.unit,
+        f"{case.unit}_per_second": count / wall_time if wall_time > 0 else None
+    }
+
+
+def run_benchmarks(
+        full: bool = False,
+        only: Optional[Sequence[str]] = None,
+        repeat: int = 1
+) -> Dict[str, Any]:
+    """Run the cases (names starting with any of `only`), returns the results
+
+    With repeat, every case runs that many times and the quickest is kept.
+    """
+    selected = [x for x in cases(full) if not only or any(x.name.startswith(y) for y in only)]
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        # made here, so making them doesn't count towards a case's peak rss
+        for size in sorted({y for x in selected for y in x.maps}):
+            _input_map(work_dir, size)
+        for name in (x.name for x in selected):
+            runs = []
+            for _ in range(repeat):
+                # a new process every time, for a clean peak rss
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    runs.append(executor.submit(_run_case, name, work_dir, full).result())
+            results[name] = min(runs, key=lambda x: x["wall_time"])
+            print(f"{name:<20}  {results[name]['wall_time']:8.3f}s  {_format_rss(results[name]['peak_rss'])}")
+
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__
+        },
+        "results": results
+    }
+
+
+def _format_rss(
+        rss: Optional[int]
+) -> str:
+    """Memory in MB, or - if unknown"""
+    return "-" if rss is None else f"{rss / 1024 ** 2:8.1f}MB"
+
+
+def compare(
+        results: Dict[str, Any],
+        baseline: Dict[str, Any],
+        threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """Print how the results compare to a baseline, returns the regressions
+
+    A case is a regression if its wall time went up by more than
+    threshold (a fraction, 0.15 is 15%) and it takes long enough to
+    measure. Cases missing from either side are skipped.
+    """
+    regressions = []
+    print(f"{'case':<20}  {'baseline':>9}  {'now':>9}  {'change':>8}")
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["wall_time"], result["wall_time"]
+        change = after / before - 1 if before > 0 else 0.0
+        regressed = change > threshold and after >= MIN_WALL_TIME
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<20}  {before:8.3f}s  {after:8.3f}s  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every stage of making a landscape")
+    parser.add_argument("output", help="where to save the results (.json)")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown (as a fraction) that counts as a regression")
+    parser.add_argument("--full", action="store_true", help="also run the big sizes (4096 maps, level 12)")
+    parser.add_argument("--only", nargs="+", help="only run cases starting with these, e.g. heightmap stl")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, the quickest is kept")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.full, args.only, args.repeat)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,568 @@
+"""
+The Blender side of making a landscape: baking, the terrain and camera
+
+Everything here needs bpy, so this is only imported (by main.py) when
+running inside Blender. The rest of the code (procedural values, the
+NumPy heightmap, meshing, previews) doesn't import this, so it can be
+used without Blender.
+
+The terrain material and bake image are made once and reused by every
+run in the same Blender (see Resources), so one Blender can make
+hundreds of seeds without its memory growing.
+
+The terrain is coloured and shaded from the derived layer textures
+(layers.py): band colours from the seed palette, rougher on steep
+slopes, darker in hollows, with the normals from the normal map. So
+none of that is worked out with nodes for every sample.
+"""
+
+from typing import *
+
+import bpy
+import numpy as np
+
+from procedural import gen_noise_value_from_seed, displacement_scale_value_from_seed
+from heightmap import heightmap_from_seed
+from pipeline import Settings
+from preview import palette, ELEVATION_BANDS
+import mesh
+import layers
+import cache
+import camera
+import profiling
+
+
+CAMERA_HEIGHTMAP_DIMENSIONS = 1024, 1024  # the layer heightmap is resampled to this to place the camera
+LAYER_DIMENSIONS = 2048, 2048  # heightmap the layer textures are made from
+HOLLOW_DARKEN = 0.5  # how much darker the deepest hollows are
+
+# names of the things Resources keeps between runs
+MATERIAL_NAME = "TerrainMaterial"
+BAKE_IMAGE_NAME = "BakedDisplacement"
+NOISE_VALUE_NODE = "noise_value"
+DISPLACEMENT_SCALE_NODE = "displacement_scale"
+BSDF_NODE = "bsdf"
+OUTPUT_NODE = "output"
+DISPLACEMENT_NODE = "displacement"
+EMISSION_NODE = "emission"
+BAKE_IMAGE_NODE = "bake_image"
+LAYER_IMAGE_NAMES = {"normals": "TerrainNormals", "surface": "TerrainSurface", "bands": "TerrainBands"}
+LAYER_IMAGE_NODE = "{name}_image"
+BAND_COLOR_NODE = "band_color_{band}"
+
+
+# ---------------------------------------
+#                Main code
+# ---------------------------------------
+
+
+def setup():
+    """Delete objects and set rendering settings"""
+    # delete objects
+    for obj in bpy.context.scene.objects:
+        obj.select_set(True)
+    bpy.ops.object.delete()
+
+    # delete materials, apart from the one kept between runs
+    for material in list(bpy.data.materials):
+        if material.name != MATERIAL_NAME:
+            material.user_clear()
+            bpy.data.materials.remove(material)
+    resources.free_orphans()
+
+    # setup rendering stuff
+    bpy.context.scene.render.engine = "CYCLES"
+    bpy.context.scene.cycles.feature_set = "EXPERIMENTAL"
+
+    # set the device type
+    bpy.context.scene.cycles.device = "GPU"
+
+    # set cuda rendering (you can change this to opengl)
+    bpy.context.preferences.addons[
+        "cycles"
+    ].preferences.compute_device_type = "CUDA"
+
+
+def mesh_counts(
+        obj: bpy.types.Object
+) -> Tuple[int, int]:
+    """Vertex and face count of an object, after its modifiers"""
+    evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    evaluated_mesh = evaluated.to_mesh()
+    counts = len(evaluated_mesh.vertices), len(evaluated_mesh.polygons)
+    evaluated.to_mesh_clear()
+    return counts
+
+
+#  ------------------------------
+#  |         Resources          |
+#  ------------------------------
+
+
+class Resources:
+    """The material and bake image, made once per Blender session
+
+    Making a new material and a 4096 x 4096 float image for every seed
+    leaves the old ones behind, and Blender renames the new ones
+    TerrainMaterial.001 and so on. These are made once (kept with a fake
+    user), looked up by name, and only the values that depend on the seed
+    change between runs. Everything else left over from a run is freed
+    by free_orphans. The NumPy heightmap of the last seed is kept too, so
+    the layers and the camera share it.
+    """
+
+    def __init__(self) -> None:
+        self.pixels = None  # buffer the bake is read into, kept between runs
+        self.heights = None  # (seed, cache dir, heightmap) of the last seed
+
+    def material(self) -> bpy.types.Material:
+        """The terrain material, made the first time"""
+        material = bpy.data.materials.get(MATERIAL_NAME)
+        if material is not None and BAND_COLOR_NODE.format(band=0) not in material.node_tree.nodes:
+            bpy.data.materials.remove(material)  # same name, but not made here (or made before layers)
+            material = None
+        if material is None:
+            material = _build_terrain_material()
+            material.use_fake_user = True
+        return material
+
+    def set_seed(
+            self,
+            seed: str
+    ) -> bpy.types.Material:
+        """Point the material at a seed's noise, returns it"""
+        material = self.material()
+        nodes = material.node_tree.nodes
+        nodes[NOISE_VALUE_NODE].outputs["Value"].default_value = gen_noise_value_from_seed(seed)
+        nodes[DISPLACEMENT_SCALE_NODE].outputs["Value"].default_value = displacement_scale_value_from_seed(seed)
+        for band, color in enumerate(palette(seed)):
+            nodes[BAND_COLOR_NODE.format(band=band)].outputs[0].default_value = tuple(_linear(color)) + (1,)
+        return material
+
+    def set_baking(
+            self,
+            baking: bool
+    ) -> None:
+        """Switch the material between baking heights (emission) and displacement"""
+        material = self.material()
+        nodes, links = material.node_tree.nodes, material.node_tree.links
+        output_node = nodes[OUTPUT_NODE]
+        if baking:
+            links.new(nodes[EMISSION_NODE].outputs[0], output_node.inputs[0])
+            for link in list(output_node.inputs[2].links):
+                links.remove(link)
+            nodes.active = nodes[BAKE_IMAGE_NODE]
+        else:
+            links.new(nodes[BSDF_NODE].outputs[0], output_node.inputs[0])
+            links.new(nodes[DISPLACEMENT_NODE].outputs[0], output_node.inputs[2])
+
+    def bake_image(
+            self,
+            dimensions: Tuple[int, int]
+    ) -> bpy.types.Image:
+        """The image to bake into, cleared, resized only if the size changed"""
+        width, height = dimensions
+        image = bpy.data.images.get(BAKE_IMAGE_NAME)
+        if image is not None and tuple(image.size) != (width, height):
+            bpy.data.images.remove(image)
+            image = None
+        if image is None:
+            image = bpy.data.images.new(BAKE_IMAGE_NAME, width=width, height=height, float_buffer=True, alpha=True)
+            image.use_fake_user = True
+
+        if self.pixels is None or self.pixels.size != width * height * 4:
+            self.pixels = np.empty(width * height * 4, np.float32)
+        self.pixels.fill(0)
+        image.pixels.foreach_set(self.pixels)
+        self.material().node_tree.nodes[BAKE_IMAGE_NODE].image = image
+        return image
+
+    def set_layers(
+            self,
+            derived: np.ndarray
+    ) -> None:
+        """Put the textures of the derived layers in the material's images"""
+        nodes = self.material().node_tree.nodes
+        height, width = derived.shape[:2]
+        for name in layers.TEXTURES:
+            texture = layers.encode(derived, [name])[name]
+            image = bpy.data.images.get(LAYER_IMAGE_NAMES[name])
+            if image is not None and tuple(image.size) != (width, height):
+                bpy.data.images.remove(image)
+                image = None
+            if image is None:
+                image = bpy.data.images.new(
+                    LAYER_IMAGE_NAMES[name], width=width, height=height, float_buffer=True, alpha=True
+                )
+                image.use_fake_user = True
+                image.colorspace_settings.name = "Non-Color"
+                image.alpha_mode = "CHANNEL_PACKED"
+
+            # bottom row first, like the layers
+            image.pixels.foreach_set(texture.ravel())
+            nodes[LAYER_IMAGE_NODE.format(name=name)].image = image
+
+    def heightmap(
+            self,
+            seed: str,
+            settings: Settings
+    ) -> np.ndarray:
+        """The NumPy heightmap of a seed (the same as the baked one), made once per seed"""
+        key = seed, settings.cache_dir
+        if self.heights is None or self.heights[:2] != key:
+            self.heights = None  # let the old one go first
+            if settings.cache_dir is None:
+                heights = heightmap_from_seed(seed, LAYER_DIMENSIONS)
+            else:
+                heights = cache.cached_heightmap(
+                    settings.cache_dir, seed, LAYER_DIMENSIONS, settings.cache_max_bytes
+                )
+            self.heights = key + (heights,)
+        return self.heights[2]
+
+    def read_image(
+            self,
+            image: bpy.types.Image
+    ) -> np.ndarray:
+        """Red channel of an image (r, g and b of the bake are the same), a copy"""
+        width, height = image.size
+        image.pixels.foreach_get(self.pixels)
+        return self.pixels.reshape(height, width, 4)[:, :, 0].copy()
+
+    def free_orphans(self) -> None:
+        """Free meshes, cameras etc. that nothing uses any more"""
+        bpy.data.orphans_purge(do_recursive=True)
+
+
+# shared by every run in this Blender session
+resources = Resources()
+
+
+def _linear(
+        color: np.ndarray
+) -> np.ndarray:
+    """A 0 to 255 palette colour as Blender's linear 0 to 1 (roughly)"""
+    return (np.asarray(color, np.float32) / 255) ** 2.2
+
+
+def _build_terrain_material() -> bpy.types.Material:
+    """Make the terrain material and its nodes
+
+    Both outputs are there: emission for baking the heights and
+    displacement for rendering, Resources.set_baking picks one. The
+    surface comes from the layer textures (Resources.set_layers), so
+    the displacement only moves the vertices and isn't bump mapped too.
+    """
+    terrain_material = bpy.data.materials.new(name=MATERIAL_NAME)
+    terrain_material.use_nodes = True
+    terrain_material.cycles.displacement_method = "DISPLACEMENT"
+
+    nodes = terrain_material.node_tree.nodes
+    node_tree = terrain_material.node_tree
+    links = node_tree.links
+
+    # terrain nodes
+    bsdf_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeBsdfPrincipled)][0]
+    output_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeOutputMaterial)][0]
+    bsdf_node.name = BSDF_NODE
+    output_node.name = OUTPUT_NODE
+    bsdf_node.location = 2000, 1000
+    output_node.location = 2400, 0
+
+    texture_coordinate_node = node_tree.nodes.new("ShaderNodeTexCoord")
+    texture_coordinate_node.location = 200, 0
+
+    shader_mapping_node = node_tree.nodes.new("ShaderNodeMapping")
+    shader_mapping_node.location = 600, 0
+    value_node_set_1_0 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_0.name = NOISE_VALUE_NODE
+    value_node_set_1_0.location = 400, -400
+
+    musgrave_1_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
+    musgrave_1_node.location = 800, 0
+    musgrave_1_node.musgrave_dimensions = "4D"
+    musgrave_1_node.musgrave_type = "FBM"
+    value_node_set_1_1 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_1.location = 600, -600
+    value_node_set_1_1.outputs["Value"].default_value = 0.15
+    value_node_set_1_2 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_2.location = 600, -800
+    value_node_set_1_2.outputs["Value"].default_value = 16
+    value_node_set_1_3 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_3.location = 600, -1000
+    value_node_set_1_3.outputs["Value"].default_value = 0.95
+
+    voronoi_1_node = node_tree.nodes.new("ShaderNodeTexVoronoi")
+    voronoi_1_node.location = 1000, 0
+    voronoi_1_node.feature = "SMOOTH_F1"
+    value_node_set_1_4 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_4.location = 800, -400
+    value_node_set_1_4.outputs["Value"].default_value = 0.3
+
+    musgrave_2_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
+    musgrave_2_node.location = 1200, 0
+    musgrave_2_node.musgrave_dimensions = "3D"
+    musgrave_2_node.musgrave_type = "FBM"
+    value_node_set_1_5 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_5.location = 1100, -600
+    value_node_set_1_5.outputs["Value"].default_value = 9
+    value_node_set_1_6 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_6.location = 1100, -800
+    value_node_set_1_6.outputs["Value"].default_value = 14
+    value_node_set_1_7 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_7.location = 1100, -1000
+    value_node_set_1_7.outputs["Value"].default_value = 1.05
+
+    displacement_node = node_tree.nodes.new("ShaderNodeDisplacement")
+    displacement_node.name = DISPLACEMENT_NODE
+    displacement_node.location = 2200, 0
+
+    # for baking, the heights are emitted instead of displacing
+    emission_node = node_tree.nodes.new("ShaderNodeEmission")
+    emission_node.name = EMISSION_NODE
+    emission_node.location = 2200, -200
+
+    math_multiply_node_1 = node_tree.nodes.new("ShaderNodeMath")
+    math_multiply_node_1.operation = "ADD"
+    math_multiply_node_1.location = 1600, 0
+    value_node_set_1_8 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_8.outputs["Value"].default_value = 0.75
+    value_node_set_1_8.location = 1600, -400
+
+    value_node_set_1_9 = node_tree.nodes.new("ShaderNodeValue")
+    value_node_set_1_9.name = DISPLACEMENT_SCALE_NODE
+    value_node_set_1_9.location = 1800, -400
+
+    image_node = node_tree.nodes.new("ShaderNodeTexImage")
+    image_node.name = BAKE_IMAGE_NODE
+    image_node.location = 2000, -400
+
+    links.new(texture_coordinate_node.outputs[0], shader_mapping_node.inputs[0])
+    links.new(shader_mapping_node.outputs[0], musgrave_1_node.inputs[0])
+    links.new(value_node_set_1_0.outputs[0], musgrave_1_node.inputs[1])
+    links.new(value_node_set_1_1.outputs[0], musgrave_1_node.inputs[2])
+    links.new(value_node_set_1_2.outputs[0], musgrave_1_node.inputs[3])
+    links.new(value_node_set_1_3.outputs[0], musgrave_1_node.inputs[4])
+    links.new(musgrave_1_node.outputs[0], voronoi_1_node.inputs[0])
+    links.new(value_node_set_1_4.outputs[0], voronoi_1_node.inputs[2])
+    links.new(voronoi_1_node.outputs[1], musgrave_2_node.inputs[0])
+    links.new(value_node_set_1_5.outputs[0], musgrave_2_node.inputs[2])
+    links.new(value_node_set_1_6.outputs[0], musgrave_2_node.inputs[3])
+    links.new(value_node_set_1_7.outputs[0], musgrave_2_node.inputs[4])
+    links.new(musgrave_2_node.outputs[0], math_multiply_node_1.inputs[0])
+    links.new(value_node_set_1_8.outputs[0], math_multiply_node_1.inputs[1])
+    links.new(math_multiply_node_1.outputs[0], displacement_node.inputs[0])
+    links.new(math_multiply_node_1.outputs[0], emission_node.inputs[0])
+    links.new(value_node_set_1_9.outputs[0], displacement_node.inputs[2])
+    links.new(displacement_node.outputs[0], output_node.inputs[2])
+
+    # surface nodes, from the layer textures (the plane's UVs line up with the heightmap)
+    images = {}
+    for i, name in enumerate(layers.TEXTURES):
+        images[name] = node_tree.nodes.new("ShaderNodeTexImage")
+        images[name].name = LAYER_IMAGE_NODE.format(name=name)
+        images[name].location = 800, 1600 - i * 300
+
+    normal_map_node = node_tree.nodes.new("ShaderNodeNormalMap")
+    normal_map_node.space = "OBJECT"
+    normal_map_node.location = 1600, 1600
+    separate_surface_node = node_tree.nodes.new("ShaderNodeSeparateRGB")
+    separate_surface_node.location = 1100, 1300
+    separate_bands_node = node_tree.nodes.new("ShaderNodeSeparateRGB")
+    separate_bands_node.location = 1100, 1000
+
+    # roughness 0.5 on the flat to 0.9 on cliffs
+    roughness_node = node_tree.nodes.new("ShaderNodeMath")
+    roughness_node.operation = "MULTIPLY_ADD"
+    roughness_node.location = 1600, 1300
+    roughness_node.inputs[1].default_value = 0.4
+    roughness_node.inputs[2].default_value = 0.5
+
+    # how far into a hollow, the positive half of the curvature
+    hollow_node = node_tree.nodes.new("ShaderNodeMath")
+    hollow_node.operation = "MULTIPLY_ADD"
+    hollow_node.use_clamp = True
+    hollow_node.location = 1400, 1100
+    hollow_node.inputs[1].default_value = 2
+    hollow_node.inputs[2].default_value = -1
+
+    # the band colours, each mixed over the ones below by its mask
+    band_outputs = [separate_bands_node.outputs[i] for i in range(3)] + [images["bands"].outputs["Alpha"]]
+    color_output = None
+    for band in range(ELEVATION_BANDS):
+        color_node = node_tree.nodes.new("ShaderNodeRGB")
+        color_node.name = BAND_COLOR_NODE.format(band=band)
+        color_node.location = 1300 + band * 150, 800
+        if color_output is None:
+            color_output = color_node.outputs[0]
+            continue
+        mix_node = node_tree.nodes.new("ShaderNodeMixRGB")
+        mix_node.location = 1300 + band * 150, 1000
+        links.new(band_outputs[band - 1], mix_node.inputs[0])
+        links.new(color_output, mix_node.inputs[1])
+        links.new(color_node.outputs[0], mix_node.inputs[2])
+        color_output = mix_node.outputs[0]
+
+    hollow_mix_node = node_tree.nodes.new("ShaderNodeMixRGB")
+    hollow_mix_node.blend_type = "MULTIPLY"
+    hollow_mix_node.location = 1800, 1100
+    hollow_mix_node.inputs[2].default_value = (1 - HOLLOW_DARKEN,) * 3 + (1,)
+
+    links.new(images["normals"].outputs[0], normal_map_node.inputs["Color"])
+    links.new(images["surface"].outputs[0], separate_surface_node.inputs[0])
+    links.new(images["bands"].outputs[0], separate_bands_node.inputs[0])
+    links.new(separate_surface_node.outputs[0], roughness_node.inputs[0])
+    links.new(separate_surface_node.outputs[1], hollow_node.inputs[0])
+    links.new(hollow_node.outputs[0], hollow_mix_node.inputs[0])
+    links.new(color_output, hollow_mix_node.inputs[1])
+    links.new(hollow_mix_node.outputs[0], bsdf_node.inputs["Base Color"])
+    links.new(roughness_node.outputs[0], bsdf_node.inputs["Roughness"])
+    links.new(normal_map_node.outputs[0], bsdf_node.inputs["Normal"])
+    return terrain_material
+
+
+#  ------------------------------
+#  |      Procedural stuff      |
+#  ------------------------------
+
+
+def bake_heightmap(
+        seed: str,
+        dimensions: Tuple[int, int],
+        profiler: Optional[profiling.Profiler] = None
+) -> np.ndarray:
+    """Bake the displacement map for the terrain"""
+    if profiler is None:
+        profiler = profiling.Profiler()
+
+    # add the plane in
+    bpy.ops.mesh.primitive_plane_add(location=[0, 0, 0], size=50)
+    bpy.context.selected_objects[0].name = "terrain"
+
+    # don't subdivide when baking displacement, and emit the heights
+    terrain_material = resources.set_seed(seed)
+    resources.set_baking(True)
+    bpy.context.active_object.data.materials.append(terrain_material)
+    baked_image = resources.bake_image(dimensions)
+
+    # setup things for baking displacement, and put the render samples
+    # back afterwards (renders later in the session use them)
+    samples = bpy.context.scene.cycles.samples
+    bpy.context.scene.cycles.samples = 1
+
+    # bake displacement
+    width, height = dimensions
+    try:
+        with profiler.stage("bake", width=width, height=height):
+            bpy.ops.object.bake(type="EMIT")
+    finally:
+        bpy.context.scene.cycles.samples = samples
+
+    # read the baked heights back
+    with profiler.stage("read bake"):
+        heights = resources.read_image(baked_image)
+
+    # yeet everything out
+    for x in bpy.context.scene.objects:
+        x.select_set(True)
+    bpy.ops.object.delete()
+    resources.free_orphans()
+    return heights
+
+
+def generate_stl(
+        seed: str,
+        filepath: str,
+        settings: Settings = Settings(),
+        profiler: Optional[profiling.Profiler] = None
+) -> None:
+    """Generate just the stl file for the terrain"""
+    if profiler is None:
+        profiler = profiling.Profiler()
+    displacement_scale_value = displacement_scale_value_from_seed(seed)
+    dimensions = settings.map_size, settings.map_size
+
+    # bake the displacement map, unless it's been baked before
+    with profiler.stage("heightmap") as counters:
+        if settings.cache_dir is None:
+            heights = bake_heightmap(seed, dimensions, profiler)
+        else:
+            key = cache.heightmap_key(seed, dimensions, source="cycles")
+            heights = cache.load(settings.cache_dir, key)
+            counters["cache_hit"] = heights is not None
+            if heights is None:
+                heights = cache.store(
+                    settings.cache_dir, key, bake_heightmap(seed, dimensions, profiler), settings.cache_max_bytes
+                )
+
+    # time to make the final 3d model
+    # sample the heights at the vertices of the subdivided plane (only
+    # the part the boolean mask used to keep, to get rid of the rim) and
+    # write a simplified mesh straight to the stl file
+    samples = 2 ** settings.subdivision_level + 1
+    with profiler.stage("resample", vertices=samples * samples):
+        vertex_heights = mesh.resample(heights, (samples, samples), mesh.TRIM_SIZE / mesh.PLANE_SIZE)
+    with profiler.stage("stl", vertices_before=samples * samples, faces_before=2 * (samples - 1) ** 2) as counters:
+        counters["faces_after"] = mesh.write_adaptive_stl(
+            filepath,
+            vertex_heights,
+            displacement_scale_value,
+            max_error=settings.max_error,
+            triangle_budget=int(2 * (samples - 1) ** 2 * settings.decimate_ratio)
+        )
+
+
+def generate_terrain(
+        seed: str,
+        settings: Settings = Settings(),
+        profiler: Optional[profiling.Profiler] = None
+) -> None:
+    """Add the displaced terrain for rendering, shaded from the derived layers"""
+    if profiler is None:
+        profiler = profiling.Profiler()
+
+    # add the plane in
+    bpy.ops.mesh.primitive_plane_add(location=[0, 0, 0], size=50)
+    bpy.context.selected_objects[0].name = "terrain"
+
+    # subdivide it
+    vertices, faces = mesh_counts(bpy.context.selected_objects[0])
+    with profiler.stage("subsurf", vertices_before=vertices, faces_before=faces) as counters:
+        bpy.ops.object.modifier_add(type="SUBSURF")
+        bpy.context.selected_objects[0].modifiers[0].name = "SUBSURF"
+        bpy.context.selected_objects[0].modifiers[0].levels = 8
+        bpy.context.selected_objects[0].modifiers[0].subdivision_type = "SIMPLE"
+        counters["vertices_after"], counters["faces_after"] = mesh_counts(bpy.context.selected_objects[0])
+
+    # other stuff
+    bpy.context.selected_objects[0].cycles.use_adaptive_subdivision = True
+
+    # the layer textures, from the numpy heightmap (the same as the baked one)
+    heights = resources.heightmap(seed, settings)
+    with profiler.stage("layers", width=LAYER_DIMENSIONS[0], height=LAYER_DIMENSIONS[1]):
+        resources.set_layers(layers.derive(heights, seed))
+
+    # assign material to terrain
+    terrain_material = resources.set_seed(seed)
+    resources.set_baking(False)
+    bpy.context.active_object.data.materials.append(terrain_material)
+
+
+def add_camera(
+        seed: str,
+        settings: Settings = Settings(),
+        profiler: Optional[profiling.Profiler] = None
+) -> None:
+    """Add the camera for render 1, placed from the heightmap"""
+    if profiler is None:
+        profiler = profiling.Profiler()
+
+    # the numpy heightmap the layers were made from, smaller
+    heights = mesh.resample(resources.heightmap(seed, settings), CAMERA_HEIGHTMAP_DIMENSIONS)
+    with profiler.stage("camera placement") as counters:
+        pose = camera.best_poses(heights, displacement_scale_value_from_seed(seed), seed, count=1)[0]
+        counters["score"] = pose.score
+
+    bpy.ops.object.camera_add(location=pose.location, rotation=pose.rotation)
+    bpy.context.selected_objects[0].name = "camera"
+    bpy.context.scene.camera = bpy.context.selected_objects[0]
@@ -0,0 +1,178 @@
+"""
+On-disk cache for displacement maps
+
+Making a displacement map (baking or with heightmap.py) is by far the
+slowest part of making a model, and it only depends on the seed, the map
+size and the node graph constants. Changing the subdivision level,
+decimate ratio etc. doesn't change it, so maps get saved here as .npy
+files named after a hash of everything they depend on, and read back
+memory-mapped (no copy) next time.
+
+When the cache gets bigger than its budget, the least recently used maps
+are deleted. A file's modification time is its "last used" time.
+"""
+
+from typing import *
+
+import os
+import json
+import hashlib
+import tempfile
+
+import numpy as np
+
+from procedural import gen_noise_value_from_seed
+import heightmap
+
+
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+
+# bump this if the heightmap code changes in a way that changes the output
+CACHE_VERSION = 2
+
+
+# every constant in heightmap.py that changes the heights
+GRAPH_CONSTANTS = (
+    "MUSGRAVE_1_SCALE",
+    "MUSGRAVE_1_DETAIL",
+    "MUSGRAVE_1_DIMENSION",
+    "VORONOI_SCALE",
+    "VORONOI_SMOOTHNESS",
+    "VORONOI_RANDOMNESS",
+    "MUSGRAVE_2_SCALE",
+    "MUSGRAVE_2_DETAIL",
+    "MUSGRAVE_2_DIMENSION",
+    "MUSGRAVE_LACUNARITY",
+    "HEIGHT_OFFSET",
+    "GENERATED_Z"
+)
+
+
+def heightmap_key(
+        seed: str,
+        dimensions: Tuple[int, int],
+        source: str = "numpy"
+) -> str:
+    """Hash of everything a displacement map depends on
+
+    source is what made the map ("numpy" or "cycles"), as the two aren't
+    guaranteed to be identical.
+    """
+    description = json.dumps({
+        "version": CACHE_VERSION,
+        "seed": seed,
+        "dimensions": list(dimensions),
+        "source": source,
+        "constants": {name: getattr(heightmap, name) for name in GRAPH_CONSTANTS}
+    }, sort_keys=True)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def _path(
+        cache_dir: str,
+        key: str
+) -> str:
+    """Where the map for a key lives"""
+    return os.path.join(cache_dir, f"{key}.npy")
+
+
+def load(
+        cache_dir: str,
+        key: str
+) -> Optional[np.ndarray]:
+    """Memory-map a cached map (read only), or None if it isn't cached"""
+    path = _path(cache_dir, key)
+    try:
+        heights = np.load(path, mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        return None
+    os.utime(path)  # mark as used
+    return heights
+
+
+def store(
+        cache_dir: str,
+        key: str,
+        heights: np.ndarray,
+        max_bytes: int = DEFAULT_MAX_BYTES
+) -> np.ndarray:
+    """Save a map in the cache, evict old maps and return the cached copy"""
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # write somewhere else first so a half written file never gets used
+    handle, temporary_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            np.save(file, np.asarray(heights, np.float32))
+        os.replace(temporary_path, _path(cache_dir, key))
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    evict(cache_dir, max_bytes, keep=key)
+    return load(cache_dir, key)
+
+
+def evict(
+        cache_dir: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        keep: Optional[str] = None
+) -> List[str]:
+    """Delete least recently used maps until the cache fits in max_bytes
+
+    Returns the keys that were deleted. The map for `keep` never is.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy"):
+            try:
+                stat = os.stat(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue  # evicted by another process
+            entries.append((stat.st_mtime, stat.st_size, name[:-len(".npy")]))
+
+    total = sum(x[1] for x in entries)
+    deleted = []
+    for _, size, key in sorted(entries):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        try:
+            os.remove(_path(cache_dir, key))
+        except OSError:
+            continue  # probably still mapped by someone (windows)
+        total -= size
+        deleted.append(key)
+    return deleted
+
+
+def cached_heightmap(
+        cache_dir: str,
+        seed: str,
+        dimensions: Tuple[int, int] = (4096, 4096),
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_memory: int = heightmap.MAX_MEMORY
+) -> np.ndarray:
+    """heightmap.heightmap_from_seed, but only generated if it isn't cached
+
+    The map is generated in tiles straight into the cache, so it never
+    has to fit in memory (see heightmap.write_heightmap_tiled).
+    """
+    key = heightmap_key(seed, dimensions)
+    heights = load(cache_dir, key)
+    if heights is None:
+        os.makedirs(cache_dir, exist_ok=True)
+        handle, temporary_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(handle)
+        try:
+            heightmap.write_heightmap_tiled(
+                gen_noise_value_from_seed(seed), dimensions, temporary_path, max_memory
+            )
+            os.replace(temporary_path, _path(cache_dir, key))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        evict(cache_dir, max_bytes, keep=key)
+        heights = load(cache_dir, key)
+    return heights
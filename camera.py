@@ -0,0 +1,231 @@
+"""
+Procedural camera placement
+
+Picks camera positions for render 1 (the "main" render) by looking at
+the heightmap. Lots of candidate cameras are placed over the terrain
+(where exactly comes from the seed), and every candidate is scored by
+how much of the terrain it can see, how much relief is in view and how
+much of the view is blocked by hills in the way. Visibility is worked
+out by sampling heights along the line of sight from each camera
+position to a grid of points on the terrain.
+
+The best few poses come back as blender locations and rotation eulers,
+so they can be put straight on a camera object.
+"""
+
+from typing import *
+
+import math
+import hashlib
+
+import numpy as np
+
+from mesh import resample, grid_positions, PLANE_SIZE
+
+
+# grid the terrain gets reduced to for scoring, and the points looked at
+ANALYSIS_SIZE = 128
+TARGET_SIZE = 32
+LINE_OF_SIGHT_STEPS = 24
+CAMERAS_PER_CHUNK = 16
+
+# candidates
+CANDIDATE_POSITIONS = 256
+CANDIDATE_HEADINGS = 24
+CANDIDATE_PITCHES = (10, 20, 35)  # degrees below horizontal
+POSITION_MARGIN = 5  # keep cameras this far inside the edge of the plane
+CLEARANCE = 2, 15  # camera height above the terrain under it
+
+# default blender camera (50mm lens, 36mm sensor) rendering 16:9
+HORIZONTAL_FOV = 2 * math.atan(18 / 50)
+VERTICAL_FOV = 2 * math.atan(18 * 9 / 16 / 50)
+
+# blender's displacement node default, heights are displaced by (h - midlevel) * scale
+DISPLACEMENT_MIDLEVEL = 0.5
+
+# how much each part of the score counts
+RELIEF_WEIGHT = 0.5
+RELIEF_COVERAGE = 0.1  # fraction of the terrain in view for relief to count fully
+OCCLUSION_WEIGHT = 0.5
+
+
+class Pose(NamedTuple):
+    """A camera pose, in blender units and radians"""
+    location: Tuple[float, float, float]
+    rotation: Tuple[float, float, float]  # rotation_euler (XYZ)
+    score: float
+    coverage: float  # fraction of the terrain visible
+    relief: float  # spread of visible heights, relative to the whole terrain
+    occlusion: float  # fraction of the view that's blocked
+
+
+def _rng(
+        seed: str
+) -> np.random.Generator:
+    """Random numbers for a seed, the same every time"""
+    digest = hashlib.sha256(f"{seed}-camera".encode("utf-8")).digest()
+    return np.random.default_rng(int.from_bytes(digest[:8], "big"))
+
+
+def _sample(
+        heights: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        size: float
+) -> np.ndarray:
+    """Nearest grid height at world positions"""
+    last = len(heights) - 1
+    col = np.clip(np.rint((x / size + 0.5) * last), 0, last).astype(np.intp)
+    row = np.clip(np.rint((y / size + 0.5) * last), 0, last).astype(np.intp)
+    return heights[row, col]
+
+
+def visibility(
+        heights: np.ndarray,
+        cameras: np.ndarray,
+        targets: np.ndarray,
+        size: float = PLANE_SIZE,
+        steps: int = LINE_OF_SIGHT_STEPS
+) -> np.ndarray:
+    """Which targets each camera can see, shape (cameras, targets)
+
+    heights is a square grid in world units covering the plane edge to
+    edge, cameras and targets are (n, 3) world positions.
+    """
+    last = len(heights) - 1
+    flat = heights.ravel()
+    fractions = ((np.arange(steps) + 0.5) / steps).astype(np.float32)
+
+    # work in grid units, so a point on a line of sight is a lerp and a
+    # round, and on the grid, so every point between two of them is too
+    def to_grid(points):
+        grid = np.empty_like(points, np.float32)
+        grid[:, :2] = np.clip((points[:, :2] / size + 0.5) * last, 0, last)
+        grid[:, 2] = points[:, 2]
+        return grid
+
+    cameras, targets = to_grid(cameras), to_grid(targets)
+    visible = np.empty((len(cameras), len(targets)), bool)
+    for first in range(0, len(cameras), CAMERAS_PER_CHUNK):
+        # points along every line of sight, shape (cameras, targets, steps) for each axis
+        x, y, z = [
+            start[:, None, None] + (targets[None, :, None, axis] - start[:, None, None]) * fractions
+            for axis, start in enumerate(cameras[first:first + CAMERAS_PER_CHUNK].T)
+        ]
+        x += 0.5  # so truncating rounds
+        y += 0.5
+        index = y.astype(np.int32)
+        index *= last + 1
+        index += x.astype(np.int32)
+        visible[first:first + CAMERAS_PER_CHUNK] = np.all(flat[index] <= z, axis=-1)
+    return visible
+
+
+def _score(
+        cameras: np.ndarray,
+        visible: np.ndarray,
+        targets: np.ndarray,
+        headings: np.ndarray,
+        pitches: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Score, coverage, relief and occlusion of every pose
+
+    All have shape (cameras, headings, pitches). A target is in view when
+    its bearing and elevation from the camera are both inside the field
+    of view, so the heading and pitch tests are separate, and the counts
+    for every heading and pitch pair are a batched matrix product.
+    Relief only counts fully once RELIEF_COVERAGE of the terrain is
+    visible, so a view of a few points can't win on their spread alone.
+    """
+    offsets = targets[None, :, :] - cameras[:, None, :]
+    distance = np.maximum(np.hypot(offsets[..., 0], offsets[..., 1]), np.float32(1e-6))
+    elevation = np.arctan2(offsets[..., 2], distance)
+
+    # shape (cameras, headings, targets), the bearing is inside the field
+    # of view when its cosine with the heading is big enough
+    cos_heading = np.cos(headings).astype(np.float32)[None, :, None]
+    sin_heading = np.sin(headings).astype(np.float32)[None, :, None]
+    along = (offsets[:, None, :, 0] / distance[:, None, :]) * cos_heading
+    along += (offsets[:, None, :, 1] / distance[:, None, :]) * sin_heading
+    in_heading = (along > math.cos(HORIZONTAL_FOV / 2)).astype(np.float32)
+
+    # shape (cameras, targets, pitches), then the same seen, times the
+    # heights and times their squares, all counted in one product
+    in_pitch = (np.abs(elevation[:, :, None] + pitches[None, None, :].astype(np.float32)) < VERTICAL_FOV / 2)
+    in_pitch = in_pitch.astype(np.float32)
+    seen_pitch = in_pitch * visible[:, :, None]
+    z = targets[:, 2]
+    counts = in_heading @ np.concatenate([
+        in_pitch, seen_pitch, seen_pitch * z[:, None], seen_pitch * (z * z)[:, None]
+    ], axis=-1)
+    in_view_count, seen_count, seen_sum, seen_squares = np.split(counts, 4, axis=-1)
+    coverage = seen_count / len(targets)
+    occlusion = 1 - seen_count / np.maximum(in_view_count, 1)
+
+    # spread of the heights in view, compared to the whole terrain
+    mean = seen_sum / np.maximum(seen_count, 1)
+    variance = seen_squares / np.maximum(seen_count, 1) - mean ** 2
+    relief = np.sqrt(np.maximum(variance, 0)) / max(float(z.std()), 1e-6)
+
+    score = coverage + RELIEF_WEIGHT * relief * np.minimum(coverage / RELIEF_COVERAGE, 1) \
+        - OCCLUSION_WEIGHT * occlusion
+    return score, coverage, relief, occlusion
+
+
+def best_poses(
+        heights: np.ndarray,
+        scale: float,
+        seed: str,
+        count: int = 3,
+        size: float = PLANE_SIZE,
+        midlevel: float = DISPLACEMENT_MIDLEVEL
+) -> List[Pose]:
+    """The best `count` camera poses for a terrain, best first
+
+    heights is a displacement map (any resolution, e.g. 1024 x 1024) and
+    scale the displacement strength. Poses are for different positions,
+    and are always the same for the same seed and heights.
+    """
+    rng = _rng(seed)
+    terrain = (resample(heights, (ANALYSIS_SIZE, ANALYSIS_SIZE)).astype(np.float32) - midlevel) * np.float32(scale)
+
+    # points on the terrain to look at
+    target_heights = (resample(heights, (TARGET_SIZE, TARGET_SIZE)).astype(np.float32) - midlevel) * np.float32(scale)
+    target_x, target_y = np.meshgrid(grid_positions(TARGET_SIZE, size), grid_positions(TARGET_SIZE, size))
+    targets = np.stack([target_x.ravel(), target_y.ravel(), target_heights.ravel()], axis=1)
+    targets[:, 2] += 0.01 * scale  # don't let a target hide itself
+
+    # candidate positions, above the terrain
+    half = size / 2 - POSITION_MARGIN
+    cameras = rng.uniform(-half, half, (CANDIDATE_POSITIONS, 3)).astype(np.float32)
+    cameras[:, 2] = _sample(terrain, cameras[:, 0], cameras[:, 1], size) + rng.uniform(*CLEARANCE, CANDIDATE_POSITIONS)
+    visible = visibility(terrain, cameras, targets, size)
+
+    # candidate directions, with a random offset so they aren't all lined up
+    headings = (np.arange(CANDIDATE_HEADINGS) + rng.uniform()) * 2 * math.pi / CANDIDATE_HEADINGS
+    pitches = np.radians(CANDIDATE_PITCHES)
+
+    # score every pose, a few cameras at a time
+    scores = [
+        _score(cameras[i:i + CAMERAS_PER_CHUNK], visible[i:i + CAMERAS_PER_CHUNK], targets, headings, pitches)
+        for i in range(0, len(cameras), CAMERAS_PER_CHUNK)
+    ]
+    score, coverage, relief, occlusion = [np.concatenate(x) for x in zip(*scores)]
+
+    # best direction for each position, then the best positions
+    flat = score.reshape(len(cameras), -1)
+    best_direction = np.argmax(flat, axis=1)
+    best_score = flat[np.arange(len(cameras)), best_direction]
+    poses = []
+    for camera_index in np.argsort(-best_score, kind="stable")[:count]:
+        heading_index, pitch_index = np.unravel_index(best_direction[camera_index], score.shape[1:])
+        pose_index = camera_index, heading_index, pitch_index
+        poses.append(Pose(
+            location=tuple(float(x) for x in cameras[camera_index]),
+            rotation=(math.pi / 2 - float(pitches[pitch_index]), 0.0, float(headings[heading_index]) - math.pi / 2),
+            score=float(score[pose_index]),
+            coverage=float(coverage[pose_index]),
+            relief=float(relief[pose_index]),
+            occlusion=float(occlusion[pose_index])
+        ))
+    return poses
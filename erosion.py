@@ -0,0 +1,319 @@
+"""
+Erosion of the displacement map, with NumPy
+
+The noise graph makes terrain with no erosion at all: no scree slopes,
+no gullies, no sediment filling the valleys. This adds two passes over
+the heightmap, both done a whole tile at a time with array operations:
+
+* thermal - wherever a slope is steeper than the talus angle, some of
+  the material slumps to the lower neighbours
+* hydraulic - rain falls (more in some places than others, the same for
+  a seed every time), flows to lower neighbours, picks up sediment where
+  it flows quickly and drops it where it slows down or evaporates
+
+Both only look at the 4 neighbours of a cell, so after k iterations a
+cell depends on nothing further than 2k cells away. The map is done in
+tiles with a border that wide, a few iterations at a time, and the
+result is the same as doing the whole map at once (and the same every
+time for a seed). Water and sediment are kept for the whole map between
+sweeps.
+
+Heights are in heightmap units, slopes are worked out in blender units
+from the displacement scale and the size of the plane.
+
+Usage (no Blender needed):
+    python erosion.py <heightmap.npy> <eroded.npy> --seed test2 [--thermal 20] [--hydraulic 40]
+"""
+
+from typing import *
+
+import math
+import time
+import hashlib
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+from procedural import displacement_scale_value_from_seed
+from mesh import PLANE_SIZE
+
+
+TILE_SIZE = 512
+ITERATIONS_PER_SWEEP = 8  # iterations per tile before the tiles are put back together
+
+# stands in for 0 in divisions, where the top is 0 too
+TINY = np.float32(1e-30)
+
+# the 4 neighbours, as (rows, columns) offsets
+NEIGHBOURS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class Erosion(NamedTuple):
+    """How much erosion to do"""
+    thermal_iterations: int = 20
+    talus_angle: float = 40.0  # degrees, steeper slopes slump
+    thermal_rate: float = 0.5  # fraction of the slump moved each iteration
+    hydraulic_iterations: int = 40
+    rain: float = 0.002  # water added each iteration, in heightmap units
+    rain_variation: float = 0.5  # how much the rain varies from place to place, 0 to 1
+    evaporation: float = 0.05  # fraction of the water lost each iteration
+    capacity: float = 4.0  # sediment moving water can carry, per unit of water moved
+    erosion_rate: float = 0.15  # fraction of the spare capacity picked up each iteration (0.3 makes stripes)
+    deposition_rate: float = 0.3  # fraction of the excess sediment dropped each iteration
+    budget: Optional[int] = None  # most cell updates to do, fewer iterations if over it
+
+
+#  ------------------------------
+#  |           Steps            |
+#  ------------------------------
+
+
+def _spread(
+        flows: Sequence[np.ndarray]
+) -> np.ndarray:
+    """What every cell gets from its neighbours, given what each cell
+    sends to each neighbour (in NEIGHBOURS order)"""
+    result = np.zeros_like(flows[0])
+    rows, cols = result.shape
+    for (dy, dx), flow in zip(NEIGHBOURS, flows):
+        result[max(dy, 0):rows + min(dy, 0), max(dx, 0):cols + min(dx, 0)] += \
+            flow[max(-dy, 0):rows - max(dy, 0), max(-dx, 0):cols - max(dx, 0)]
+    return result
+
+
+def _downhill(
+        surface: np.ndarray
+) -> Tuple[List[np.ndarray], np.ndarray, np.ndarray]:
+    """Drop to each neighbour (0 if it's higher or off the edge), their
+    total and the biggest"""
+    rows, cols = surface.shape
+    drops = []
+    for dy, dx in NEIGHBOURS:
+        drop = np.empty_like(surface)
+        drop[rows - 1 if dy > 0 else 0 if dy < 0 else slice(None),
+             cols - 1 if dx > 0 else 0 if dx < 0 else slice(None)] = 0  # the edge with no neighbour
+        inner = drop[max(-dy, 0):rows - max(dy, 0), max(-dx, 0):cols - max(dx, 0)]
+        np.subtract(
+            surface[max(-dy, 0):rows - max(dy, 0), max(-dx, 0):cols - max(dx, 0)],
+            surface[max(dy, 0):rows + min(dy, 0), max(dx, 0):cols + min(dx, 0)],
+            out=inner
+        )
+        np.maximum(inner, 0, out=inner)
+        drops.append(drop)
+    total = drops[0] + drops[1]
+    total += drops[2]
+    total += drops[3]
+    biggest = np.maximum(drops[0], drops[1])
+    np.maximum(biggest, drops[2], out=biggest)
+    np.maximum(biggest, drops[3], out=biggest)
+    return drops, total, biggest
+
+
+def thermal_step(
+        heights: np.ndarray,
+        talus: float,
+        rate: float
+) -> np.ndarray:
+    """One iteration of thermal erosion, talus is the steepest stable drop
+    between neighbours (heightmap units)"""
+    drops, _, biggest = _downhill(heights)
+    excess = [np.maximum(x - talus, 0, out=x) for x in drops]
+    total = excess[0] + excess[1]
+    total += excess[2]
+    total += excess[3]
+    moved = np.maximum(biggest - talus, 0)
+    moved *= rate * 0.5
+
+    # nothing moves where nothing is over the talus, so the total only needs to not be 0
+    share = moved / np.maximum(total, TINY)
+    for flow in excess:
+        flow *= share
+    return heights - moved + _spread(excess)
+
+
+def hydraulic_step(
+        heights: np.ndarray,
+        water: np.ndarray,
+        sediment: np.ndarray,
+        rain: np.ndarray,
+        erosion: Erosion
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One iteration of hydraulic erosion, returns the new (heights, water, sediment)"""
+    water = water + rain
+    drops, total, biggest = _downhill(heights + water)
+
+    # water flows to lower neighbours, as much as levels them out, and
+    # takes its share of the sediment with it
+    # (the totals are only 0 where nothing flows)
+    biggest *= 0.5
+    outflow = np.minimum(water, biggest)
+    np.maximum(total, TINY, out=total)
+    share = outflow / total
+    concentration = sediment / np.maximum(water, TINY)
+    for flow in drops:
+        flow *= share
+    water -= outflow
+    water += _spread(drops)
+    for flow in drops:
+        flow *= concentration
+    sediment = sediment - outflow * concentration
+    sediment += _spread(drops)
+
+    # fast water picks sediment up, slow water drops it, without digging
+    # below the neighbours
+    spare = outflow * np.float32(erosion.capacity) - sediment
+    spare *= np.where(spare < 0, np.float32(erosion.deposition_rate), np.float32(erosion.erosion_rate))
+    np.minimum(spare, biggest, out=spare)
+    heights = heights - spare
+    sediment += spare
+    water *= np.float32(1 - erosion.evaporation)
+    return heights, water, sediment
+
+
+#  ------------------------------
+#  |           Tiles            |
+#  ------------------------------
+
+
+def _tiles(
+        shape: Tuple[int, int],
+        tile_size: int,
+        border: int
+) -> Iterator[Tuple[slice, slice, slice, slice]]:
+    """Every tile: the rows and columns to read (with the border), and
+    where in those the tile itself is"""
+    for top in range(0, shape[0], tile_size):
+        for left in range(0, shape[1], tile_size):
+            bottom, right = min(top + tile_size, shape[0]), min(left + tile_size, shape[1])
+            read_top, read_left = max(top - border, 0), max(left - border, 0)
+            read_bottom, read_right = min(bottom + border, shape[0]), min(right + border, shape[1])
+            yield (
+                slice(read_top, read_bottom), slice(read_left, read_right),
+                slice(top - read_top, bottom - read_top), slice(left - read_left, right - read_left)
+            )
+
+
+def _sweep(
+        arrays: Sequence[np.ndarray],
+        step: Callable[..., Tuple[np.ndarray, ...]],
+        iterations: int,
+        tile_size: int,
+        workers: Optional[int]
+) -> List[np.ndarray]:
+    """Run some iterations of a step over the map, a tile at a time"""
+    results = [np.empty_like(x) for x in arrays]
+
+    def run_tile(tile):
+        rows, cols, inner_rows, inner_cols = tile
+        state = [x[rows, cols] for x in arrays]
+        for _ in range(iterations):
+            state = step(*state)
+        for result, x in zip(results, state):
+            result[rows.start + inner_rows.start:rows.start + inner_rows.stop,
+                   cols.start + inner_cols.start:cols.start + inner_cols.stop] = x[inner_rows, inner_cols]
+
+    tiles = list(_tiles(arrays[0].shape, tile_size, 2 * iterations))
+    if workers == 1:
+        for tile in tiles:
+            run_tile(tile)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run_tile, tiles))
+    return results
+
+
+def rain_map(
+        seed: str,
+        shape: Tuple[int, int],
+        variation: float
+) -> np.ndarray:
+    """How much of the rain falls on each cell (mean 1), smooth and the
+    same every time for a seed"""
+    rng = np.random.default_rng(list(hashlib.sha256(f"erosion {seed}".encode("utf-8")).digest()))
+    coarse = rng.random((9, 9))
+
+    # bilinear upsample of a coarse grid of random values
+    rows, cols = np.linspace(0, 8, shape[0]), np.linspace(0, 8, shape[1])
+    r0, c0 = np.minimum(rows.astype(int), 7), np.minimum(cols.astype(int), 7)
+    fr, fc = (rows - r0)[:, None], (cols - c0)[None, :]
+    top = coarse[r0][:, c0] * (1 - fc) + coarse[r0][:, c0 + 1] * fc
+    bottom = coarse[r0 + 1][:, c0] * (1 - fc) + coarse[r0 + 1][:, c0 + 1] * fc
+    field = top * (1 - fr) + bottom * fr
+    return (1 + variation * (2 * field - 1)).astype(np.float32)
+
+
+def iterations_for_budget(
+        erosion: Erosion,
+        cells: int
+) -> Tuple[int, int]:
+    """Thermal and hydraulic iterations, both cut down evenly to fit the budget"""
+    thermal, hydraulic = erosion.thermal_iterations, erosion.hydraulic_iterations
+    if erosion.budget is None or (thermal + hydraulic) * cells <= erosion.budget:
+        return thermal, hydraulic
+    fraction = erosion.budget / ((thermal + hydraulic) * cells)
+    return int(thermal * fraction), int(hydraulic * fraction)
+
+
+def erode(
+        heights: np.ndarray,
+        seed: str,
+        erosion: Erosion = Erosion(),
+        scale: Optional[float] = None,
+        size: float = PLANE_SIZE,
+        tile_size: int = TILE_SIZE,
+        workers: Optional[int] = 1
+) -> np.ndarray:
+    """Eroded copy of a heightmap (thermal, then hydraulic)
+
+    scale is the displacement strength (the seed's, if not given) and
+    size is how wide the heightmap is in blender units, which together
+    turn the talus angle into a drop between neighbouring cells. workers
+    is how many threads do tiles at once (None for one per core).
+    """
+    if scale is None:
+        scale = displacement_scale_value_from_seed(seed)
+    heights = np.asarray(heights, np.float32)
+    thermal_iterations, hydraulic_iterations = iterations_for_budget(erosion, heights.size)
+
+    talus = math.tan(math.radians(erosion.talus_angle)) * (size / heights.shape[1]) / scale
+    thermal = lambda h: (thermal_step(h, talus, erosion.thermal_rate),)
+    for done in range(0, thermal_iterations, ITERATIONS_PER_SWEEP):
+        iterations = min(ITERATIONS_PER_SWEEP, thermal_iterations - done)
+        heights, = _sweep([heights], thermal, iterations, tile_size, workers)
+
+    if hydraulic_iterations:
+        rain = rain_map(seed, heights.shape, erosion.rain_variation) * np.float32(erosion.rain)
+        water = np.zeros_like(heights)
+        sediment = np.zeros_like(heights)
+        hydraulic = lambda h, w, s, r: hydraulic_step(h, w, s, r, erosion) + (r,)
+        for done in range(0, hydraulic_iterations, ITERATIONS_PER_SWEEP):
+            iterations = min(ITERATIONS_PER_SWEEP, hydraulic_iterations - done)
+            heights, water, sediment, rain = _sweep(
+                [heights, water, sediment, rain], hydraulic, iterations, tile_size, workers
+            )
+        heights = heights + sediment  # what the water was still carrying settles
+    return heights
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Erode a heightmap")
+    parser.add_argument("source", help="heightmap (.npy)")
+    parser.add_argument("output", help="where to save the eroded heightmap (.npy)")
+    parser.add_argument("--seed", required=True, help="seed the heightmap is for (rain and scale)")
+    defaults = Erosion()
+    parser.add_argument("--thermal", type=int, default=defaults.thermal_iterations, help="thermal iterations")
+    parser.add_argument("--hydraulic", type=int, default=defaults.hydraulic_iterations,
+                        help="hydraulic iterations")
+    parser.add_argument("--budget", type=int, help="most cell updates to do")
+    parser.add_argument("--workers", type=int, default=1, help="threads to use")
+    args = parser.parse_args()
+
+    heights = np.load(args.source)
+    start = time.perf_counter()
+    eroded = erode(heights, args.seed, Erosion(
+        thermal_iterations=args.thermal, hydraulic_iterations=args.hydraulic, budget=args.budget
+    ), workers=args.workers)
+    np.save(args.output, eroded)
+    print(f"eroded {heights.shape[1]} x {heights.shape[0]} in {time.perf_counter() - start:.1f}s, "
+          f"mean change {np.mean(np.abs(eroded - heights)):.5f}")
@@ -0,0 +1,256 @@
+"""
+Smaller model files than stl
+
+An stl file is a triangle soup: every triangle has its own copy of its
+three vertices and a normal, so each grid vertex is stored about six
+times. These formats store each vertex once and the triangles as
+indices into them:
+
+* PLY (binary) - float32 vertices, int32 indices, opens in most tools
+* glTF (.glb) - vertices quantized to int16 (KHR_mesh_quantization):
+  x and y are grid indices and z is the height in 65536 steps, with the
+  node transform turning them back into blender units
+* a compact 16 bit heightmap (.npz) - just the trimmed vertex heights
+  and what's needed to make the mesh again, which is the smallest by
+  far (make_mesh / the command below turn it back into any of these)
+
+Usage (no Blender needed):
+    python formats.py <model.npz> <output.ply|.glb|.stl> [--max-error 0.05 | --triangle-budget 500000]
+"""
+
+from typing import *
+
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+
+import mesh
+import rtin
+
+
+# glTF constants
+GLTF_SHORT = 5122
+GLTF_UNSIGNED_INT = 5125
+GLTF_ARRAY_BUFFER = 34962
+GLTF_ELEMENT_ARRAY_BUFFER = 34963
+GLTF_TRIANGLES = 4
+
+# rotates blender's z up to glTF's y up
+Z_UP_TO_Y_UP = [-0.5 ** 0.5, 0, 0, 0.5 ** 0.5]
+
+# ply layout
+PLY_VERTEX = np.dtype([("x", "<f4"), ("y", "<f4"), ("z", "<f4")])
+PLY_FACE = np.dtype([("count", "u1"), ("indices", "<i4", (3,))])
+
+
+class IndexedMesh(NamedTuple):
+    """A mesh of grid vertices, each stored once"""
+    grid: np.ndarray  # (n, 2) row and column of each vertex
+    heights: np.ndarray  # (n,) height of each vertex, in model units
+    faces: np.ndarray  # (m, 3) vertex indices of each triangle, anticlockwise
+    positions: np.ndarray  # x (and y) position of each grid column (and row)
+
+
+def adaptive_mesh(
+        heights: np.ndarray,
+        scale: float,
+        max_error: Optional[float] = None,
+        triangle_budget: Optional[int] = None,
+        size: float = mesh.TRIM_SIZE,
+        errors: Optional[np.ndarray] = None
+) -> IndexedMesh:
+    """The mesh mesh.write_adaptive_stl writes, as vertices and indices"""
+    z = heights.astype(np.float32) * np.float32(scale)
+    if errors is None:
+        errors = rtin.midpoint_errors(z)
+    if max_error is None:
+        max_error = 0.0 if triangle_budget is None else rtin.max_error_for_budget(errors, triangle_budget)
+    corners = np.concatenate(list(rtin.triangles(errors, max_error)))
+
+    # number the grid points that get used
+    flat = corners[..., 0].astype(np.int64) * len(z) + corners[..., 1]
+    used, faces = np.unique(flat, return_inverse=True)
+    grid = np.stack([used // len(z), used % len(z)], axis=1)
+    return IndexedMesh(
+        grid,
+        z[grid[:, 0], grid[:, 1]],
+        faces.reshape(-1, 3).astype(np.uint32),
+        mesh.grid_positions(len(z), size)
+    )
+
+
+def write_ply(
+        filepath: str,
+        indexed: IndexedMesh
+) -> None:
+    """Write a binary PLY file"""
+    vertices = np.empty(len(indexed.grid), PLY_VERTEX)
+    vertices["x"] = indexed.positions[indexed.grid[:, 1]]
+    vertices["y"] = indexed.positions[indexed.grid[:, 0]]
+    vertices["z"] = indexed.heights
+    faces = np.empty(len(indexed.faces), PLY_FACE)
+    faces["count"] = 3
+    faces["indices"] = indexed.faces
+
+    header = "\n".join([
+        "ply",
+        "format binary_little_endian 1.0",
+        "comment landscapes-thing",
+        f"element vertex {len(vertices)}",
+        "property float x",
+        "property float y",
+        "property float z",
+        f"element face {len(faces)}",
+        "property list uchar int vertex_indices",
+        "end_header"
+    ]) + "\n"
+    with open(filepath, "wb") as file:
+        file.write(header.encode("ascii"))
+        vertices.tofile(file)
+        faces.tofile(file)
+
+
+def _pad(
+        data: bytes,
+        fill: bytes
+) -> bytes:
+    """Pad to a multiple of 4 bytes, as glb chunks must be"""
+    return data + fill * (-len(data) % 4)
+
+
+def write_glb(
+        filepath: str,
+        indexed: IndexedMesh
+) -> None:
+    """Write a binary glTF file with int16 vertex positions
+
+    Positions are (column, row, quantized height), which the node's
+    scale and translation turn back into blender units (z up, rotated to
+    glTF's y up by a parent node).
+    """
+    low, high = float(indexed.heights.min()), float(indexed.heights.max())
+    step = (high - low) / 65535 or 1.0
+    quantized = np.rint((indexed.heights - low) / step) - 32768
+
+    # positions padded to 8 bytes, as vertex attributes must be 4 byte aligned
+    positions = np.zeros((len(indexed.grid), 4), np.int16)
+    positions[:, 0] = indexed.grid[:, 1]
+    positions[:, 1] = indexed.grid[:, 0]
+    positions[:, 2] = quantized
+    indices = indexed.faces.astype("<u4")
+    binary = positions.astype("<i2").tobytes() + indices.tobytes()
+
+    spacing = float(indexed.positions[1] - indexed.positions[0])
+    document = {
+        "asset": {"version": "2.0", "generator": "landscapes-thing"},
+        "extensionsUsed": ["KHR_mesh_quantization"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [
+            {"rotation": Z_UP_TO_Y_UP, "children": [1]},
+            {
+                "mesh": 0,
+                "translation": [float(indexed.positions[0]), float(indexed.positions[0]), low + 32768 * step],
+                "scale": [spacing, spacing, step]
+            }
+        ],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1, "mode": GLTF_TRIANGLES}]}],
+        "accessors": [
+            {
+                "bufferView": 0,
+                "componentType": GLTF_SHORT,
+                "count": len(positions),
+                "type": "VEC3",
+                "min": [int(x) for x in positions[:, :3].min(axis=0)],
+                "max": [int(x) for x in positions[:, :3].max(axis=0)]
+            },
+            {
+                "bufferView": 1,
+                "componentType": GLTF_UNSIGNED_INT,
+                "count": indices.size,
+                "type": "SCALAR"
+            }
+        ],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": positions.nbytes, "byteStride": 8,
+             "target": GLTF_ARRAY_BUFFER},
+            {"buffer": 0, "byteOffset": positions.nbytes, "byteLength": indices.nbytes,
+             "target": GLTF_ELEMENT_ARRAY_BUFFER}
+        ],
+        "buffers": [{"byteLength": len(binary)}]
+    }
+
+    json_chunk = _pad(json.dumps(document).encode("utf-8"), b" ")
+    binary_chunk = _pad(binary, b"\0")
+    with open(filepath, "wb") as file:
+        file.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + len(binary_chunk)))
+        file.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+        file.write(json_chunk)
+        file.write(struct.pack("<I4s", len(binary_chunk), b"BIN\0"))
+        file.write(binary_chunk)
+
+
+def save_heightmap16(
+        filepath: str,
+        heights: np.ndarray,
+        scale: float,
+        size: float = mesh.TRIM_SIZE
+) -> None:
+    """Save trimmed vertex heights as 16 bit steps between their lowest
+    and highest, with the displacement scale and the size they cover"""
+    heights = np.asarray(heights, np.float32)
+    low, high = float(heights.min()), float(heights.max())
+    step = (high - low) / 65535 or 1.0
+    np.savez_compressed(
+        filepath,
+        heights=np.rint((heights - low) / step).astype(np.uint16),
+        low=low,
+        step=step,
+        scale=scale,
+        size=size
+    )
+
+
+def load_heightmap16(
+        filepath: str
+) -> Tuple[np.ndarray, float, float]:
+    """Load a 16 bit heightmap, returns (heights, scale, size)"""
+    with np.load(filepath) as data:
+        heights = (data["low"] + data["heights"] * data["step"]).astype(np.float32)
+        return heights, float(data["scale"]), float(data["size"])
+
+
+def make_mesh(
+        source: str,
+        filepath: str,
+        max_error: Optional[float] = None,
+        triangle_budget: Optional[int] = None
+) -> None:
+    """Make a model from a 16 bit heightmap, the format is from the extension"""
+    heights, scale, size = load_heightmap16(source)
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == ".stl":
+        mesh.write_adaptive_stl(filepath, heights, scale, max_error, triangle_budget, size)
+        return
+    indexed = adaptive_mesh(heights, scale, max_error, triangle_budget, size)
+    if extension == ".ply":
+        write_ply(filepath, indexed)
+    elif extension == ".glb":
+        write_glb(filepath, indexed)
+    else:
+        raise ValueError(f"don't know how to write {extension} files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make a model from a 16 bit heightmap")
+    parser.add_argument("source", help="16 bit heightmap (.npz)")
+    parser.add_argument("output", help="where to save the model (.ply, .glb or .stl)")
+    parser.add_argument("--max-error", type=float, help="simplify, keeping the vertical error under this")
+    parser.add_argument("--triangle-budget", type=int, help="simplify down to this many triangles")
+    args = parser.parse_args()
+
+    make_mesh(args.source, args.output, args.max_error, args.triangle_budget)
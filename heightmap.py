@@ -0,0 +1,622 @@
+"""
+NumPy version of the terrain node graph
+
+generate_stl (in blender.py) gets its heights by building the node graph
+Musgrave (4D fBM) -> Voronoi (smooth F1) -> Musgrave (3D fBM) -> add 0.75
+and baking it with Cycles. This file evaluates the same graph with NumPy
+instead, so displacement maps can be made without Blender or a GPU.
+
+The noise follows Cycles (Blender 3.0): same hash, gradients, scale
+factors and single precision maths. It should match a bake closely, but
+it is not guaranteed to be bit-for-bit identical.
+
+Usage (no Blender needed):
+    python heightmap.py <seed> <output.npy> [--size 4096] [--max-memory 512]
+
+Big maps (16k and up) are made in tiles straight into the .npy file,
+so memory use stays under --max-memory (MB) whatever the size.
+"""
+
+from typing import *
+
+import argparse
+
+import numpy as np
+
+from procedural import gen_noise_value_from_seed
+
+
+# CONSTANTS FROM THE NODE GRAPH
+MUSGRAVE_1_SCALE = 0.15
+MUSGRAVE_1_DETAIL = 16
+MUSGRAVE_1_DIMENSION = 0.95
+VORONOI_SCALE = 0.3
+VORONOI_SMOOTHNESS = 1.0  # node default
+VORONOI_RANDOMNESS = 1.0  # node default
+MUSGRAVE_2_SCALE = 9
+MUSGRAVE_2_DETAIL = 14
+MUSGRAVE_2_DIMENSION = 1.05
+MUSGRAVE_LACUNARITY = 2.0  # node default
+HEIGHT_OFFSET = 0.75
+
+# generated coordinates of a flat plane have z in the middle of the box
+GENERATED_Z = 0.5
+
+# rows evaluated at once, keeps the temporary arrays small
+ROWS_PER_CHUNK = 128
+
+# for tiled generation: roughly how much working memory each pixel
+# evaluated at once takes, and the default ceiling
+BYTES_PER_PIXEL = 192
+MAX_MEMORY = 512 * 1024 ** 2
+
+
+#  ------------------------------
+#  |       Cycles hashing       |
+#  ------------------------------
+
+
+def _rot(
+        x: np.ndarray,
+        k: int
+) -> np.ndarray:
+    """Rotate uint32 bits left"""
+    return (x << np.uint32(k)) | (x >> np.uint32(32 - k))
+
+
+def _mix(
+        a: np.ndarray,
+        b: np.ndarray,
+        c: np.ndarray
+) -> None:
+    """Jenkins lookup3 mix, in place"""
+    a -= c
+    a ^= _rot(c, 4)
+    c += b
+    b -= a
+    b ^= _rot(a, 6)
+    a += c
+    c -= b
+    c ^= _rot(b, 8)
+    b += a
+    a -= c
+    a ^= _rot(c, 16)
+    c += b
+    b -= a
+    b ^= _rot(a, 19)
+    a += c
+    c -= b
+    c ^= _rot(b, 4)
+    b += a
+
+
+def _final(
+        a: np.ndarray,
+        b: np.ndarray,
+        c: np.ndarray
+) -> np.ndarray:
+    """Jenkins lookup3 final, returns c"""
+    c ^= b
+    c -= _rot(b, 14)
+    a ^= c
+    a -= _rot(c, 11)
+    b ^= a
+    b -= _rot(a, 25)
+    c ^= b
+    c -= _rot(b, 16)
+    a ^= c
+    a -= _rot(c, 4)
+    b ^= a
+    b -= _rot(a, 14)
+    c ^= b
+    c -= _rot(b, 24)
+    return c
+
+
+def _hash_start(
+        size: int,
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray
+) -> List[np.ndarray]:
+    """Initial a, b, c of a hash over `size` keys, broadcast together"""
+    start = np.uint32(0xDEADBEEF + (size << 2) + 13)
+    return [k + start for k in np.broadcast_arrays(kx, ky, kz)]
+
+
+def _hash_uint3(
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray
+) -> np.ndarray:
+    """Cycles hash_uint3"""
+    a, b, c = _hash_start(3, kx, ky, kz)
+    return _final(a, b, c)
+
+
+def _hash_uint4(
+        kx: np.ndarray,
+        ky: np.ndarray,
+        kz: np.ndarray,
+        kw: np.ndarray
+) -> np.ndarray:
+    """Cycles hash_uint4"""
+    kx, ky, kz, kw = np.broadcast_arrays(kx, ky, kz, kw)
+    a, b, c = _hash_start(4, kx, ky, kz)
+    _mix(a, b, c)
+    a += kw
+    return _final(a, b, c)
+
+
+def _uint_to_float(
+        x: np.ndarray
+) -> np.ndarray:
+    """Map a hash to [0, 1]"""
+    return x.astype(np.float32) / np.float32(0xFFFFFFFF)
+
+
+def _hash_float3_to_float3(
+        k: np.ndarray
+) -> np.ndarray:
+    """Cycles hash_float3_to_float3, k has shape (..., 3)"""
+    bits = np.ascontiguousarray(k, np.float32).view(np.uint32)
+    kx, ky, kz = bits[..., 0], bits[..., 1], bits[..., 2]
+    one = np.float32(1).view(np.uint32)
+    two = np.float32(2).view(np.uint32)
+    return np.stack([
+        _uint_to_float(_hash_uint3(kx, ky, kz)),
+        _uint_to_float(_hash_uint4(kx, ky, kz, one)),
+        _uint_to_float(_hash_uint4(kx, ky, kz, two))
+    ], axis=-1)
+
+
+#  ------------------------------
+#  |        Perlin noise        |
+#  ------------------------------
+
+
+def _floorfrac(
+        x: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer part (as uint32 bits, like the C cast) and fractional part"""
+    floor = np.floor(x)
+    return floor.astype(np.int32).view(np.uint32), x - floor
+
+
+def _fade(
+        t: np.ndarray
+) -> np.ndarray:
+    """Perlin fade curve"""
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def _gradient_table(
+        size: int,
+        axes: int,
+        pick: Callable[[int], Sequence[Tuple[int, int]]]
+) -> np.ndarray:
+    """Signs (-1, 0 or 1) of each axis in a gradient, per hash value
+
+    pick(h) gives the (axis, sign bit) of each term Cycles adds together.
+    Terms are summed in axis order, which is the same order Cycles uses,
+    so multiplying out with this table gives exactly the same floats.
+    """
+    table = np.zeros((axes, size), np.float32)
+    for h in range(size):
+        for axis, negate in pick(h):
+            table[axis, h] = -1 if h & negate else 1
+    return table
+
+
+# grad3 and grad4 from Cycles, as tables
+_GRAD3 = _gradient_table(16, 3, lambda h: [
+    (0 if h < 8 else 1, 1),
+    (1 if h < 4 else (0 if h in (12, 14) else 2), 2)
+])
+_GRAD4 = _gradient_table(32, 4, lambda h: [
+    (0 if h < 24 else 1, 1),
+    (1 if h < 16 else 2, 2),
+    (2 if h < 8 else 3, 4)
+])
+
+
+def _grad3(
+        hash_: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray
+) -> np.ndarray:
+    """Cycles grad3"""
+    h = hash_ & np.uint32(15)
+    return _GRAD3[0][h] * x + _GRAD3[1][h] * y + _GRAD3[2][h] * z
+
+
+def _grad4(
+        hash_: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        w: np.ndarray
+) -> np.ndarray:
+    """Cycles grad4"""
+    h = hash_ & np.uint32(31)
+    return _GRAD4[0][h] * x + _GRAD4[1][h] * y + _GRAD4[2][h] * z + _GRAD4[3][h] * w
+
+
+def _bi_mix(
+        v0: np.ndarray,
+        v1: np.ndarray,
+        v2: np.ndarray,
+        v3: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray
+) -> np.ndarray:
+    """Bilinear interpolation of the corners of a square"""
+    x1 = 1 - x
+    return (1 - y) * (v0 * x1 + v1 * x) + y * (v2 * x1 + v3 * x)
+
+
+def _perlin_3d(
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray
+) -> np.ndarray:
+    """Cycles perlin_3d at arbitrary points"""
+    xi, fx = _floorfrac(x)
+    yi, fy = _floorfrac(y)
+    zi, fz = _floorfrac(z)
+    u, v, w = _fade(fx), _fade(fy), _fade(fz)
+
+    layers = []
+    for dz in (0, 1):
+        corners = [
+            _grad3(
+                _hash_uint3(xi + np.uint32(dx), yi + np.uint32(dy), zi + np.uint32(dz)),
+                fx - dx, fy - dy, fz - dz
+            )
+            for dy in (0, 1) for dx in (0, 1)
+        ]
+        layers.append(_bi_mix(*corners, u, v))
+    return (1 - w) * layers[0] + w * layers[1]
+
+
+def _perlin_4d_grid(
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        w: np.ndarray
+) -> np.ndarray:
+    """Cycles perlin_4d on the grid x (columns) by y (rows), z and w fixed
+
+    x and y only change along one axis each, so the lattice hashes are
+    worked out once per lattice point and looked up for every pixel.
+    w can also have shape (seeds, 1, 1) for the same grid at several w,
+    which gives shape (seeds, rows, columns).
+    """
+    fx = x - np.floor(x)
+    fy = y - np.floor(y)
+    zi, fz = _floorfrac(z)
+    wi, fw = _floorfrac(w)
+    u, v = _fade(fx)[None, :], _fade(fy)[:, None]
+    fx, fy = fx[None, :], fy[:, None]
+
+    # lattice points used by the grid, and where each pixel's corners are
+    x_cells = np.floor(x).astype(np.int64)
+    y_cells = np.floor(y).astype(np.int64)
+    x_lattice = np.union1d(x_cells, x_cells + 1)
+    y_lattice = np.union1d(y_cells, y_cells + 1)
+    x_index = [np.searchsorted(x_lattice, x_cells + dx)[None, :] for dx in (0, 1)]
+    y_index = [np.searchsorted(y_lattice, y_cells + dy)[:, None] for dy in (0, 1)]
+    x_lattice = x_lattice.astype(np.int32).view(np.uint32)
+    y_lattice = y_lattice.astype(np.int32).view(np.uint32)
+
+    cubes = []
+    for dw in (0, 1):
+        layers = []
+        for dz in (0, 1):
+            table = _hash_uint4(
+                x_lattice[None, :], y_lattice[:, None],
+                np.add(zi, np.uint32(dz)), np.add(wi, np.uint32(dw))  # ufuncs wrap without warning
+            )
+            corners = [
+                _grad4(
+                    table[..., y_index[dy], x_index[dx]],
+                    fx - dx, fy - dy, fz - dz, fw - dw
+                )
+                for dy in (0, 1) for dx in (0, 1)
+            ]
+            layers.append(_bi_mix(*corners, u, v))
+        t = _fade(fz)
+        cubes.append((1 - t) * layers[0] + t * layers[1])
+    s = _fade(fw)
+    return (1 - s) * cubes[0] + s * cubes[1]
+
+
+def _snoise_3d(
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray
+) -> np.ndarray:
+    """Signed 3D noise, scaled to roughly [-1, 1]"""
+    noise = _perlin_3d(x, y, z)
+    return np.float32(0.9820) * np.where(np.isfinite(noise), noise, 0)
+
+
+def _snoise_4d_grid(
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        w: np.ndarray
+) -> np.ndarray:
+    """Signed 4D noise on a grid, scaled to roughly [-1, 1]"""
+    noise = _perlin_4d_grid(x, y, z, w)
+    return np.float32(0.8344) * np.where(np.isfinite(noise), noise, 0)
+
+
+#  ------------------------------
+#  |         Texture nodes      |
+#  ------------------------------
+
+
+def _fbm(
+        noise: Callable[..., np.ndarray],
+        coords: Sequence[np.ndarray],
+        detail: float,
+        dimension: float,
+        lacunarity: float = MUSGRAVE_LACUNARITY
+) -> np.ndarray:
+    """Musgrave fBM texture, as in Cycles' noise_musgrave_fBm_*d"""
+    detail = min(max(detail, 0.0), 16.0)
+    dimension = np.float32(max(dimension, 1e-5))
+    lacunarity = np.float32(max(lacunarity, 1e-5))
+
+    value = np.float32(0)
+    power = np.float32(1)
+    power_step = lacunarity ** -dimension
+    for _ in range(int(detail)):
+        value = value + noise(*coords) * power
+        power = power * power_step
+        coords = [c * lacunarity for c in coords]
+
+    remainder = detail - np.floor(detail)
+    if remainder != 0:
+        value = value + np.float32(remainder) * noise(*coords) * power
+    return value
+
+
+def _voronoi_smooth_f1_color(
+        value: np.ndarray
+) -> np.ndarray:
+    """Colour output of a 3D smooth F1 voronoi node, shape (n, 3)
+
+    The node is fed a float, which blender turns into the vector
+    (value, value, value), so every point is on the diagonal and only a
+    handful of cells ever get used. Their hashes are worked out once.
+    """
+    smoothness = np.float32(min(max(VORONOI_SMOOTHNESS / 2, 0.0), 0.5))
+    randomness = np.float32(min(max(VORONOI_RANDOMNESS, 0.0), 1.0))
+
+    coord = value.ravel() * np.float32(VORONOI_SCALE)
+    cell = np.floor(coord)
+    local = coord - cell
+    cells, cell_index = np.unique(cell, return_inverse=True)
+    cell_index = cell_index.ravel()
+
+    # neighbouring cells, in the same order as the loops in Cycles
+    offsets = np.array(
+        [(i, j, k) for k in range(-2, 3) for j in range(-2, 3) for i in range(-2, 3)],
+        np.float32
+    )
+    cell_colors = _hash_float3_to_float3(cells[:, None, None] + offsets[None, :, :])
+    cell_points = offsets + cell_colors * randomness
+
+    smooth_color = np.empty(coord.shape + (3,), np.float32)
+    for index in range(len(cells)):
+        in_cell = cell_index == index
+        position = local[in_cell]
+        distance_so_far = np.full(position.shape, 8, np.float32)
+        color_so_far = [np.zeros(position.shape, np.float32) for _ in range(3)]
+        for point, color in zip(cell_points[index], cell_colors[index]):
+            distance = np.sqrt(
+                (point[0] - position) ** 2
+                + (point[1] - position) ** 2
+                + (point[2] - position) ** 2
+            )
+            t = np.clip(0.5 + 0.5 * (distance_so_far - distance) / smoothness, 0, 1)
+            h = (3 - 2 * t) * (t * t)
+            correction = smoothness * h * (1 - h)
+            distance_so_far = distance_so_far + h * (distance - distance_so_far) - correction
+            correction = correction / (1 + 3 * smoothness)
+            color_so_far = [c + h * (color[i] - c) - correction for i, c in enumerate(color_so_far)]
+        smooth_color[in_cell] = np.stack(color_so_far, axis=-1)
+    return smooth_color
+
+
+#  ------------------------------
+#  |         Heightmaps         |
+#  ------------------------------
+
+
+def evaluate_grid(
+        noise_value: float,
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    """Evaluate the terrain at generated coordinates u (columns) by v (rows)
+
+    Returns a float32 array of shape (len(v), len(u)).
+    """
+    return evaluate_grids([noise_value], u, v)[0]
+
+
+def evaluate_grids(
+        noise_values: Sequence[float],
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    """evaluate_grid for several noise values at once
+
+    Returns a float32 array of shape (len(noise_values), len(v), len(u)),
+    exactly the same as evaluating each one on its own. For small grids
+    this is much quicker, as every step works on all of them together.
+    """
+    u = np.asarray(u, np.float32)
+    v = np.asarray(v, np.float32)
+    heights = np.empty((len(noise_values), len(v), len(u)), np.float32)
+
+    # the mapping node is left at its defaults, so this is just the scale
+    scale_1 = np.float32(MUSGRAVE_1_SCALE)
+    z = np.array([GENERATED_Z], np.float32) * scale_1
+    w = np.asarray(noise_values, np.float32).reshape(-1, 1, 1) * scale_1
+
+    for start in range(0, len(v), ROWS_PER_CHUNK):
+        rows = slice(start, start + ROWS_PER_CHUNK)
+        base = _fbm(
+            _snoise_4d_grid, [u * scale_1, v[rows] * scale_1, z, w],
+            MUSGRAVE_1_DETAIL, MUSGRAVE_1_DIMENSION
+        )
+        color = _voronoi_smooth_f1_color(base) * np.float32(MUSGRAVE_2_SCALE)
+        detail = _fbm(
+            _snoise_3d, [color[:, 0], color[:, 1], color[:, 2]],
+            MUSGRAVE_2_DETAIL, MUSGRAVE_2_DIMENSION
+        )
+        heights[:, rows] = (detail + np.float32(HEIGHT_OFFSET)).reshape(base.shape)
+    return heights
+
+
+def pixel_coordinates(
+        size: int
+) -> np.ndarray:
+    """Generated coordinates of the pixel centres along one side of a bake"""
+    return (np.arange(size) + 0.5) / size
+
+
+def generate_heightmap(
+        noise_value: float,
+        dimensions: Tuple[int, int] = (4096, 4096)
+) -> np.ndarray:
+    """Generate the displacement map that generate_stl would bake
+
+    dimensions is (width, height), like DISPLACEMENT_MAP_DIMENSIONS.
+    Row 0 is the bottom of the image (-Y side of the plane), same as
+    the pixel order of a blender image.
+    """
+    width, height = dimensions
+    return evaluate_grid(noise_value, pixel_coordinates(width), pixel_coordinates(height))
+
+
+def vertex_coordinates(
+        level: int,
+        footprint: float = 1.0
+) -> np.ndarray:
+    """Generated coordinates of the vertices along one side of a plane
+    subdivided `level` times (like the SUBSURF modifier in generate_stl)
+
+    footprint shrinks the grid around the middle of the plane, e.g.
+    49.8 / 50 to only cover what the boolean mask keeps.
+    """
+    return 0.5 + (np.arange(2 ** level + 1) / 2 ** level - 0.5) * footprint
+
+
+def vertex_heights(
+        noise_value: float,
+        level: int,
+        footprint: float = 1.0
+) -> np.ndarray:
+    """Heights at the vertices of a plane subdivided `level` times
+
+    This is what the DISPLACE modifier reads from the baked image, but
+    evaluated at each vertex directly instead of through the bake.
+    """
+    coordinates = vertex_coordinates(level, footprint)
+    return evaluate_grid(noise_value, coordinates, coordinates)
+
+
+def heightmap_from_seed(
+        seed: str,
+        dimensions: Tuple[int, int] = (4096, 4096)
+) -> np.ndarray:
+    """Generate the displacement map for a seed"""
+    return generate_heightmap(gen_noise_value_from_seed(seed), dimensions)
+
+
+#  ------------------------------
+#  |      Tiled generation      |
+#  ------------------------------
+
+
+def tile_shape(
+        shape: Tuple[int, int],
+        max_memory: int = MAX_MEMORY
+) -> Tuple[int, int]:
+    """Rows and columns of the tiles to evaluate a (rows, cols) grid in"""
+    rows, cols = shape
+    pixels = max(max_memory // BYTES_PER_PIXEL, 1)
+    tile_cols = min(cols, pixels)
+    return max(min(rows, pixels // tile_cols, ROWS_PER_CHUNK), 1), tile_cols
+
+
+def iter_bands(
+        noise_value: float,
+        u: np.ndarray,
+        v: np.ndarray,
+        max_memory: int = MAX_MEMORY
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """evaluate_grid, a band of rows at a time
+
+    Each band is evaluated in tiles small enough to stay under
+    max_memory. The terrain only depends on the coordinates of each
+    pixel, so the tiles join up exactly. Yields (first row, band).
+    """
+    tile_rows, tile_cols = tile_shape((len(v), len(u)), max_memory)
+    for start in range(0, len(v), tile_rows):
+        rows = v[start:start + tile_rows]
+        band = np.empty((len(rows), len(u)), np.float32)
+        for col in range(0, len(u), tile_cols):
+            band[:, col:col + tile_cols] = evaluate_grid(noise_value, u[col:col + tile_cols], rows)
+        yield start, band
+
+
+def write_tiled(
+        noise_value: float,
+        u: np.ndarray,
+        v: np.ndarray,
+        filepath: str,
+        max_memory: int = MAX_MEMORY
+) -> None:
+    """evaluate_grid, straight into a .npy file without holding it in memory
+
+    Open the result with np.load(filepath, mmap_mode="r").
+    """
+    heights = np.lib.format.open_memmap(filepath, mode="w+", dtype=np.float32, shape=(len(v), len(u)))
+    for start, band in iter_bands(noise_value, u, v, max_memory):
+        heights[start:start + len(band)] = band
+    heights.flush()
+    del heights
+
+
+def write_heightmap_tiled(
+        noise_value: float,
+        dimensions: Tuple[int, int],
+        filepath: str,
+        max_memory: int = MAX_MEMORY
+) -> None:
+    """generate_heightmap, for maps too big to fit in memory"""
+    width, height = dimensions
+    write_tiled(noise_value, pixel_coordinates(width), pixel_coordinates(height), filepath, max_memory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a displacement map without Blender")
+    parser.add_argument("seed")
+    parser.add_argument("output", help="where to save the heightmap (.npy)")
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--max-memory", type=int, default=MAX_MEMORY // 1024 ** 2, help="in MB")
+    args = parser.parse_args()
+
+    write_heightmap_tiled(
+        gen_noise_value_from_seed(args.seed),
+        (args.size, args.size),
+        args.output,
+        args.max_memory * 1024 ** 2
+    )
@@ -0,0 +1,267 @@
+"""
+Derived layers of the heightmap, for materials and previews
+
+Shading by slope, curvature or elevation band with nodes means working
+them out again for every sample Cycles takes, and the preview works out
+the slopes for itself too. This works them all out once, in one pass
+over the heightmap: every band of rows is read with one row of its
+neighbours, and the normals, slope, curvature and band masks all come
+from the same 4 neighbour differences. They are kept as float16:
+
+    normal_x, normal_y, normal_z  unit surface normal, in blender axes
+    slope                         0 flat to 1 vertical
+    curvature                     -1 on ridges to 1 in hollows (tanh of
+                                  the Laplacian, see CURVATURE_SCALE)
+    band_1 ... band_4             0 below the edge of that elevation
+                                  band, 1 above it (preview.band_edges)
+
+and saved as 16 bit RGBA png textures, bottom row of the heightmap at
+the bottom of the image (like Blender's UVs):
+
+    normals.png  0.5 + 0.5 * normal (an object space normal map)
+    surface.png  slope, 0.5 + 0.5 * curvature
+    bands.png    the band masks
+
+The Blender material reads the same textures (blender.Resources), and
+the preview can be rendered from the layers (render_preview).
+
+Usage (no Blender needed):
+    python layers.py <seed> <output dir> [--map-size 2048] [--heightmap heightmap.npy]
+"""
+
+from typing import *
+
+import os
+import math
+import argparse
+
+import numpy as np
+
+from procedural import displacement_scale_value_from_seed
+from heightmap import heightmap_from_seed
+from mesh import PLANE_SIZE
+from preview import ELEVATION_BANDS, ROWS_PER_BAND, palette, band_edges, lighting, write_png
+
+
+# the Laplacian times the cell size (how much the slope changes from one
+# cell to the next, which is about the same at any map size) times this
+CURVATURE_SCALE = 0.5
+BAND_BLEND = 0.0  # fraction of a band the masks fade in over, 0 for hard edges
+TEXTURE_COMPRESSION_LEVEL = 1  # 16 bit textures hardly compress, so don't try hard
+
+# channels, in order
+NORMAL = slice(0, 3)
+SLOPE = 3
+CURVATURE = 4
+BANDS = slice(5, None)
+
+# texture -> file name
+TEXTURES = {
+    "normals": "normals.png",
+    "surface": "surface.png",
+    "bands": "bands.png"
+}
+
+
+def channels(
+        bands: int = ELEVATION_BANDS
+) -> Tuple[str, ...]:
+    """Names of the channels of the layers"""
+    return ("normal_x", "normal_y", "normal_z", "slope", "curvature") + tuple(
+        f"band_{i}" for i in range(1, bands)
+    )
+
+
+def _pad(
+        block: np.ndarray,
+        before: Optional[np.ndarray],
+        after: Optional[np.ndarray]
+) -> np.ndarray:
+    """A block of rows with a border of one cell
+
+    The border is the neighbouring rows where there are any, otherwise
+    carried on in a straight line, so a central difference at the edge
+    is the one sided one (like np.gradient) and the Laplacian is 0.
+    """
+    rows, columns = block.shape
+    padded = np.empty((rows + 2, columns + 2), np.float32)
+    padded[1:-1, 1:-1] = block
+    if before is not None:
+        padded[0, 1:-1] = before
+    if after is not None:
+        padded[-1, 1:-1] = after
+    # the row after the first (or before the last) can be the neighbouring one, for a band of one row
+    if before is None:
+        padded[0, 1:-1] = 2 * block[0] - (padded[2, 1:-1] if rows > 1 or after is not None else block[0])
+    if after is None:
+        padded[-1, 1:-1] = 2 * block[-1] - (padded[-3, 1:-1] if rows > 1 or before is not None else block[-1])
+    padded[:, 0] = 2 * padded[:, 1] - padded[:, min(2, columns)]
+    padded[:, -1] = 2 * padded[:, -2] - padded[:, max(columns - 1, 1)]
+    return padded
+
+
+def _derive_block(
+        padded: np.ndarray,
+        edges: np.ndarray,
+        spacing: float,
+        scale: float,
+        blend: float,
+        out: np.ndarray
+) -> None:
+    """Every layer of a padded block of heights, into out (rows, columns, channels)"""
+    centre = padded[1:-1, 1:-1]
+    left, right = padded[1:-1, :-2], padded[1:-1, 2:]
+    down, up = padded[:-2, 1:-1], padded[2:, 1:-1]
+
+    # slopes in blender units, and the change in slope between cells
+    dz_dx = (right - left) * np.float32(0.5 * scale / spacing)
+    dz_dy = (up - down) * np.float32(0.5 * scale / spacing)
+    laplacian = (left + right + down + up - 4 * centre) * np.float32(scale / spacing)
+
+    # the normal is (-dz/dx, -dz/dy, 1) made unit length, its z is the cosine of the slope
+    normal_z = 1 / np.sqrt(dz_dx * dz_dx + dz_dy * dz_dy + 1)
+    out[..., 0] = -dz_dx * normal_z
+    out[..., 1] = -dz_dy * normal_z
+    out[..., 2] = normal_z
+    out[..., SLOPE] = np.arccos(np.minimum(normal_z, 1)) * np.float32(2 / math.pi)
+    out[..., CURVATURE] = np.tanh(laplacian * np.float32(CURVATURE_SCALE))
+
+    # bands, the same as searchsorted(edges, heights) for hard edges
+    if blend > 0:
+        width = blend * (edges[1] - edges[0] if len(edges) > 1 else 1)
+        for i, edge in enumerate(edges):
+            out[..., BANDS.start + i] = np.clip((centre - edge) / width + 0.5, 0, 1)
+    else:
+        for i, edge in enumerate(edges):
+            out[..., BANDS.start + i] = centre > edge
+
+
+def derive(
+        heights: np.ndarray,
+        seed: str,
+        scale: Optional[float] = None,
+        size: float = PLANE_SIZE,
+        blend: float = BAND_BLEND,
+        out: Optional[np.ndarray] = None,
+        rows_per_band: int = ROWS_PER_BAND
+) -> np.ndarray:
+    """Every layer of a heightmap, float16 (rows, columns, channels)
+
+    heights can be memory-mapped, and so can out (e.g. with
+    np.lib.format.open_memmap), only a band of rows is worked on at once.
+    scale is the displacement strength (the seed's, if not given) and
+    size how wide the heightmap is in blender units.
+    """
+    if scale is None:
+        scale = displacement_scale_value_from_seed(seed)
+    edges = band_edges(heights)
+    shape = heights.shape + (len(channels()),)
+    if out is None:
+        out = np.empty(shape, np.float16)
+    spacing = size / heights.shape[1]
+
+    rows = heights.shape[0]
+    work = np.empty((min(rows_per_band, rows),) + shape[1:], np.float32)
+    for start in range(0, rows, rows_per_band):
+        stop = min(start + rows_per_band, rows)
+        padded = _pad(
+            np.asarray(heights[start:stop], np.float32),
+            heights[start - 1] if start > 0 else None,
+            heights[stop] if stop < rows else None
+        )
+        _derive_block(padded, edges, spacing, scale, blend, work[:stop - start])
+        out[start:stop] = work[:stop - start]
+    return out
+
+
+def encode(
+        block: np.ndarray,
+        names: Iterable[str] = TEXTURES
+) -> Dict[str, np.ndarray]:
+    """Some textures of a block of layers, float32 RGBA (rows, columns, 4) from 0 to 1"""
+    block = np.asarray(block, np.float32)
+    masks = block[..., BANDS]
+    if masks.shape[-1] > 4:
+        raise ValueError(f"{masks.shape[-1] + 1} elevation bands don't fit in one texture, 5 at most")
+
+    textures = {x: np.zeros(block.shape[:-1] + (4,), np.float32) for x in names}
+    if "normals" in textures:
+        textures["normals"][..., :3] = 0.5 + 0.5 * block[..., NORMAL]
+        textures["normals"][..., 3] = 1
+    if "surface" in textures:
+        textures["surface"][..., 0] = block[..., SLOPE]
+        textures["surface"][..., 1] = 0.5 + 0.5 * block[..., CURVATURE]
+        textures["surface"][..., 3] = 1
+    if "bands" in textures:
+        textures["bands"][..., :masks.shape[-1]] = masks
+    return textures
+
+
+def write_textures(
+        directory: str,
+        layers: np.ndarray,
+        rows_per_band: int = ROWS_PER_BAND
+) -> List[str]:
+    """Save the layers as 16 bit png textures, returns their paths"""
+    paths = []
+    rows = layers.shape[0]
+    for name, filename in TEXTURES.items():
+        def bands():
+            # top of the image is the last row, like Blender's images
+            for stop in range(rows, 0, -rows_per_band):
+                texture = encode(layers[max(stop - rows_per_band, 0):stop], [name])[name][::-1]
+                yield np.rint(np.clip(texture, 0, 1) * 65535).astype(np.uint16)
+
+        paths.append(os.path.join(directory, filename))
+        write_png(paths[-1], bands(), layers.shape[:2], TEXTURE_COMPRESSION_LEVEL, channels=4, bit_depth=16)
+    return paths
+
+
+def iter_preview_rows(
+        layers: np.ndarray,
+        seed: str,
+        rows_per_band: int = ROWS_PER_BAND
+) -> Iterator[np.ndarray]:
+    """Yield the top-down preview from the layers, like preview.iter_rows"""
+    colors = palette(seed)
+    rows = layers.shape[0]
+    for stop in range(rows, 0, -rows_per_band):
+        block = np.asarray(layers[max(stop - rows_per_band, 0):stop], np.float32)
+
+        # the colour of each band, mixed in by its mask
+        image = np.broadcast_to(colors[0], block.shape[:-1] + (3,)).copy()
+        for i in range(1, len(colors)):
+            image += block[..., BANDS.start + i - 1, None] * (colors[i] - colors[i - 1])
+        image *= lighting(block[..., NORMAL])[..., None]
+        yield np.clip(np.rint(image[::-1]), 0, 255).astype(np.uint8)
+
+
+def render_preview(
+        filepath: str,
+        layers: np.ndarray,
+        seed: str
+) -> None:
+    """Render the top-down preview png from the layers"""
+    write_png(filepath, iter_preview_rows(layers, seed), layers.shape[:2])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work out the derived layers and save them as textures")
+    parser.add_argument("seed")
+    parser.add_argument("output_dir")
+    parser.add_argument("--heightmap", help="use this .npy displacement map instead of generating one")
+    parser.add_argument("--map-size", type=int, default=2048, help="size of the generated displacement map")
+    args = parser.parse_args()
+
+    if args.heightmap is None:
+        heights = heightmap_from_seed(args.seed, (args.map_size, args.map_size))
+    else:
+        heights = np.load(args.heightmap, mmap_mode="r")
+    os.makedirs(args.output_dir, exist_ok=True)
+    layers = np.lib.format.open_memmap(
+        os.path.join(args.output_dir, "layers.npy"), "w+", np.float16, heights.shape + (len(channels()),)
+    )
+    derive(heights, args.seed, out=layers)
+    for path in write_textures(args.output_dir, layers):
+        print(path)
+    render_preview(os.path.join(args.output_dir, "render-3.png"), layers, args.seed)
@@ -37,17 +37,46 @@ Render 3 is the top-down orthographic render
 Any errors?
 Check that you have Blender 3.0
 Check that you have Python 3.8
-Check that you have created the C://tmp directory (sorry Linux users, you will need to change the code) 
+Check that you can write to the output directory: your temp directory
+(like /tmp, see tempfile.gettempdir) unless you pass --output-dir
+
+Usage:
+    run this file in Blender's scripting tab (uses SEED, NUMBER and the
+    constants below), or from a shell:
+    blender --background --python main.py -- test2 --number 0 --output-dir /tmp/landscapes [--level 10]
+
+    Several seeds can be given, numbered from --number. They all run in
+    the same Blender, which reuses its material and bake image.
+
+    Without Blender, the same command makes everything that doesn't need
+    it (stl model, top-down preview) with pipeline.py:
+    python main.py test2 --number 0 --output-dir /tmp/landscapes [--map-size 4096] [--level 10]
+
+Importing this file doesn't need Blender either: bpy is only imported
+(by blender.py) when a Blender run starts.
 
 """
 
 from typing import *
 
 import os
-import hashlib
-import colorsys
+import sys
+import argparse
+import tempfile
+import importlib.util
 
-import bpy
+# let blender find the modules that sit next to this file
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from procedural import (
+    gen_data_from_hash,
+    gen_color_from_seed,
+    gen_noise_value_from_seed,
+    displacement_scale_value_from_seed,
+    adjacent_color,
+    adjacent_colors
+)
+import profiling
 
 
 # CONSTANTS FOR PROCEDURAL GENERATION
@@ -60,462 +89,129 @@ NUMBER_PADDED = str(NUMBER).rjust(2, '0')
 DISPLACEMENT_MAP_DIMENSIONS = 4096, 4096  # You could change this, but it really wont do much
 MODEL_SUBDIVISION_QUALITY = 10  # choose 10 for okay quality, and up to 12
 MODEL_DECIMATE_RATIO = 0.25  # can go up to 1, but recommend 0.25
+MODEL_MAX_ERROR = None  # or a height (in model units) to simplify to instead of the ratio
 
 
 # CHANGE THESE FOR SAVE DESTINATIONS
-STL_EXPORT_FILEPATH = f"C:\\tmp\\{NUMBER_PADDED}-model.stl"
-RENDER_1_EXPORT_FILEPATH = f"C:\\tmp\\{NUMBER_PADDED}-render-1.png"
-RENDER_2_EXPORT_FILEPATH = f"C:\\tmp\\{NUMBER_PADDED}-render-2.png"
-RENDER_3_EXPORT_FILEPATH = f"C:\\tmp\\{NUMBER_PADDED}-render-3.png"
-
-
-def gen_data_from_hash(
-        key: str,
-        num_values: int = 16
-) -> List[float]:
-    """Get data (list of float between 0 and 1) from a key"""
-    hashed = hashlib.sha256(key.encode("utf-8")).digest()
-    as_bytes = [hashed[i:i + 2] for i in range(0, len(hashed), 2)]
-    data = [int.from_bytes(x, "big") for x in as_bytes]
-    data = [x / 65536 for x in data][:num_values]
-    return data
-
-
-def gen_color_from_seed(
-        seed: str
-) -> Tuple[float, float, float]:
-    """Generate color from seed"""
-    hue, sat = gen_data_from_hash(seed)[:2]
-    return colorsys.hsv_to_rgb(hue, sat, 255)
-
-
-def gen_noise_value_from_seed(
-        seed: str
-) -> float:
-    """Generate x and y coordinates for noise from seed"""
-    x = gen_data_from_hash(seed)[2]
-    return x * 1000
-
-
-def displacement_scale_value_from_seed(
-        seed: str
-) -> float:
-    """Generate displacement value from seed"""
-    x = gen_data_from_hash(seed)[3]
-    return 50 + (x * 25)
-
-
-def adjacent_color(
-        rgb_value: Tuple[float, float, float],
+OUTPUT_DIRECTORY = tempfile.gettempdir()
+STL_EXPORT_FILENAME = "{number}-model.stl"
+RENDER_1_EXPORT_FILENAME = "{number}-render-1.png"
+RENDER_2_EXPORT_FILENAME = "{number}-render-2.png"
+RENDER_3_EXPORT_FILENAME = "{number}-render-3.png"
+HEIGHTMAP_CACHE_DIRECTORY = os.path.join(OUTPUT_DIRECTORY, "heightmap-cache")  # or None to always bake
+HEIGHTMAP_CACHE_MAX_BYTES = 8 * 1024 ** 3
+PROFILE_TRACE_FILENAME = "{number}-trace.json"  # open in ui.perfetto.dev, or None
+PROFILE_LOG_FILENAME = "{number}-profile.jsonl"  # or None
+
+
+def in_blender() -> bool:
+    """Whether bpy can be imported, i.e. this is running inside Blender"""
+    return importlib.util.find_spec("bpy") is not None
+
+
+def output_path(
+        output_dir: str,
+        filename: Optional[str],
+        number: int
+) -> Optional[str]:
+    """Where a file for a landscape goes, None if it shouldn't be saved"""
+    if filename is None:
+        return None
+    return os.path.join(output_dir, filename.format(number=str(number).rjust(2, "0")))
+
+
+def run_blender(
         seed: str,
-        factor: float
-) -> Tuple[float, float, float]:
-    """Get adjacent color"""
-
-    def constrain(x, y, z):
-        """Constrain y between x and z"""
-        return min(max(y, x), z)
-
-    # Assumption: r, g, b in [0, 255]
-    hue, sat, val = colorsys.rgb_to_hsv(*rgb_value)
-    hue_change, sat_change, val_change = [
-        x - 0.5 for x in gen_data_from_hash(seed, 3)]
-    hue_change = hue_change * 0.1 * factor
-    sat_change = sat_change * 0.1 * factor
-    val_change = val_change * 32 * factor
-    hue = hue + hue_change
-    sat = sat + sat_change
-    val = val + val_change
-    hue = hue % 1
-    sat = constrain(0, sat, 1)
-    val = constrain(0, val, 255)
-    return colorsys.hsv_to_rgb(hue, sat, val)
-
-
-def adjacent_colors(
-        rgb_value: Tuple[float, float, float],
+        number: int,
+        output_dir: str,
+        settings: "pipeline.Settings",
+        stl: bool = False
+) -> None:
+    """Make the landscape in Blender: terrain and camera, and the stl if asked"""
+    import blender  # binds bpy
+
+    profiler = profiling.Profiler(
+        output_path(output_dir, PROFILE_TRACE_FILENAME, number),
+        output_path(output_dir, PROFILE_LOG_FILENAME, number),
+        seed=seed,
+        number=number
+    )
+    with profiler.stage("setup"):
+        blender.setup()
+    if stl:
+        with profiler.stage("generate_stl"):
+            blender.generate_stl(seed, output_path(output_dir, STL_EXPORT_FILENAME, number), settings, profiler)
+    with profiler.stage("generate_terrain"):
+        blender.generate_terrain(seed, settings, profiler)
+    with profiler.stage("add_camera"):
+        blender.add_camera(seed, settings, profiler)
+    profiler.close()
+    print(profiler.summary())
+
+
+def run_numpy(
         seed: str,
         number: int,
-        factor: float = 2
-) -> List[Tuple[float, float, float]]:
-    """Get adjacent colours"""
-    colors = []
-    for i in range(number):
-        seed = str(gen_data_from_hash(str(seed), 4))
-        colors.append(
-            adjacent_color(rgb_value, seed, factor)
-        )
-    return colors
-
-
-# ---------------------------------------
-#                Main code
-# ---------------------------------------
-
-
-def setup():
-    """Delete objects and set rendering settings"""
-    # delete objects
-    for obj in bpy.context.scene.objects:
-        obj.select_set(True)
-    bpy.ops.object.delete()
-
-    # delete materials
-    for material in bpy.data.materials:
-        material.user_clear()
-        bpy.data.materials.remove(material)
-
-    # setup rendering stuff
-    bpy.context.scene.render.engine = "CYCLES"
-    bpy.context.scene.cycles.feature_set = "EXPERIMENTAL"
-
-    # set the device type
-    bpy.context.scene.cycles.device = "GPU"
-
-    # set cuda rendering (you can change this to opengl)
-    bpy.context.preferences.addons[
-        "cycles"
-    ].preferences.compute_device_type = "CUDA"
-
-
-#  ------------------------------
-#  |      Procedural stuff      |
-#  ------------------------------
-
-
-def generate_stl(
-        seed: str
+        output_dir: str,
+        settings: "pipeline.Settings"
 ) -> None:
-    """Generate just the stl file for the terrain"""
-    # noise coordinates
-    noise_value = gen_noise_value_from_seed(seed)
-    displacement_scale_value = displacement_scale_value_from_seed(seed)
-
-    # add the plane in
-    bpy.ops.mesh.primitive_plane_add(location=[0, 0, 0], size=50)
-    bpy.context.selected_objects[0].name = "terrain"
-
-    # don't subdivide when baking displacement
-    # bpy.ops.object.modifier_add(type="SUBSURF")
-    # bpy.context.selected_objects[0].modifiers[0].levels = 6
-    # bpy.context.selected_objects[0].modifiers[0].subdivision_type = "SIMPLE"
-    # bpy.context.selected_objects[0].cycles.use_adaptive_subdivision = True
-
-    # make material
-    terrain_material = bpy.data.materials.new(name="TerrainMaterial")
-    bpy.data.materials["TerrainMaterial"].use_nodes = True
-    bpy.data.materials["TerrainMaterial"].cycles.displacement_method = "BOTH"
-
-    nodes = terrain_material.node_tree.nodes
-    node_tree = terrain_material.node_tree
-    links = node_tree.links
-
-    # terrain nodes
-    bsdf_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeBsdfPrincipled)][0]
-    output_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeOutputMaterial)][0]
-    bsdf_node.location = 2000, 1000
-    output_node.location = 2400, 0
-
-    texture_coordinate_node = node_tree.nodes.new("ShaderNodeTexCoord")
-    texture_coordinate_node.location = 200, 0
-
-    shader_mapping_node = node_tree.nodes.new("ShaderNodeMapping")
-    shader_mapping_node.location = 600, 0
-    value_node_set_1_0 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_0.location = 400, -400
-    value_node_set_1_0.outputs["Value"].default_value = noise_value
-
-    musgrave_1_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
-    musgrave_1_node.location = 800, 0
-    musgrave_1_node.musgrave_dimensions = "4D"
-    musgrave_1_node.musgrave_type = "FBM"
-    value_node_set_1_1 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_1.location = 600, -600
-    value_node_set_1_1.outputs["Value"].default_value = 0.15
-    value_node_set_1_2 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_2.location = 600, -800
-    value_node_set_1_2.outputs["Value"].default_value = 16
-    value_node_set_1_3 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_3.location = 600, -1000
-    value_node_set_1_3.outputs["Value"].default_value = 0.95
-
-    voronoi_1_node = node_tree.nodes.new("ShaderNodeTexVoronoi")
-    voronoi_1_node.location = 1000, 0
-    voronoi_1_node.feature = "SMOOTH_F1"
-    value_node_set_1_4 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_4.location = 800, -400
-    value_node_set_1_4.outputs["Value"].default_value = 0.3
-
-    musgrave_2_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
-    musgrave_2_node.location = 1200, 0
-    musgrave_2_node.musgrave_dimensions = "3D"
-    musgrave_2_node.musgrave_type = "FBM"
-    value_node_set_1_5 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_5.location = 1100, -600
-    value_node_set_1_5.outputs["Value"].default_value = 9
-    value_node_set_1_6 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_6.location = 1100, -800
-    value_node_set_1_6.outputs["Value"].default_value = 14
-    value_node_set_1_7 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_7.location = 1100, -1000
-    value_node_set_1_7.outputs["Value"].default_value = 1.05
-
-    # displacement_node = node_tree.nodes.new("ShaderNodeDisplacement")
-    # displacement_node.location = 2200, 0
-    # --!! IMPORTANT: REPLACE DISPLACEMENT WITH EMIT FOR BAKING !!--
-    emission_node = node_tree.nodes.new("ShaderNodeEmission")
-    emission_node.location = 2200, 0
-
-    math_multiply_node_1 = node_tree.nodes.new("ShaderNodeMath")
-    math_multiply_node_1.operation = "ADD"
-    math_multiply_node_1.location = 1600, 0
-    value_node_set_1_8 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_8.outputs["Value"].default_value = 0.75
-    value_node_set_1_8.location = 1600, -400
-
-    # not needed for making stl
-    # value_node_set_1_9 = node_tree.nodes.new("ShaderNodeValue")
-    # value_node_set_1_9.outputs["Value"].default_value = displacement_scale_value
-    # value_node_set_1_9.location = 1800, -400
-
-    links.new(texture_coordinate_node.outputs[0], shader_mapping_node.inputs[0])
-    links.new(shader_mapping_node.outputs[0], musgrave_1_node.inputs[0])
-    links.new(value_node_set_1_0.outputs[0], musgrave_1_node.inputs[1])
-    links.new(value_node_set_1_1.outputs[0], musgrave_1_node.inputs[2])
-    links.new(value_node_set_1_2.outputs[0], musgrave_1_node.inputs[3])
-    links.new(value_node_set_1_3.outputs[0], musgrave_1_node.inputs[4])
-    links.new(musgrave_1_node.outputs[0], voronoi_1_node.inputs[0])
-    links.new(value_node_set_1_4.outputs[0], voronoi_1_node.inputs[2])
-    links.new(voronoi_1_node.outputs[1], musgrave_2_node.inputs[0])
-    links.new(value_node_set_1_5.outputs[0], musgrave_2_node.inputs[2])
-    links.new(value_node_set_1_6.outputs[0], musgrave_2_node.inputs[3])
-    links.new(value_node_set_1_7.outputs[0], musgrave_2_node.inputs[4])
-    links.new(musgrave_2_node.outputs[0], math_multiply_node_1.inputs[0])
-    links.new(value_node_set_1_8.outputs[0], math_multiply_node_1.inputs[1])
-    # links.new(math_multiply_node_1.outputs[0], displacement_node.inputs[0])
-    links.new(math_multiply_node_1.outputs[0], emission_node.inputs[0])
-    # links.new(value_node_set_1_9.outputs[0], displacement_node.inputs[2])
-    # links.new(value_node_set_1_9.outputs[0], emission_node.inputs[2])
-    # links.new(displacement_node.outputs[0], output_node.inputs[2])
-    links.new(emission_node.outputs[0], output_node.inputs[0])
-
-    # assign material to terrain
-    bpy.context.active_object.data.materials.append(terrain_material)
-
-    # setup things for baking displacement
-    bpy.context.scene.cycles.samples = 1
-
-    image_node = node_tree.nodes.new("ShaderNodeTexImage")
-    image_node.location = 2000, -400
-    baked_image = bpy.data.images.new(
-        "BakedDisplacement",
-        width=DISPLACEMENT_MAP_DIMENSIONS[0],
-        height=DISPLACEMENT_MAP_DIMENSIONS[1],
-        float_buffer=True,
-        alpha=True
+    """Make the parts of the landscape that don't need Blender"""
+    import pipeline
+
+    profiler = profiling.Profiler(
+        output_path(output_dir, PROFILE_TRACE_FILENAME, number),
+        output_path(output_dir, PROFILE_LOG_FILENAME, number),
+        seed=seed,
+        number=number
     )
-    image_node.image = bpy.data.images[baked_image.name]
-    nodes.active = image_node
-
-    # bake displacement
-    bpy.ops.object.bake(type="EMIT")
-
-    # time to make the final 3d model
-    # yeet everything out
-    for x in bpy.context.scene.objects:
-        x.select_set(True)
-    bpy.ops.object.delete()
-
-    # add a plane (sound familiar?)
-    bpy.ops.mesh.primitive_plane_add(location=[0, 0, 0], size=50)
-    bpy.context.selected_objects[0].name = "terrain"
-
-    # subdivide it
-    bpy.ops.object.modifier_add(type="SUBSURF")
-    bpy.context.selected_objects[0].modifiers[0].name = "SUBSURF"
-    bpy.context.selected_objects[0].modifiers[0].levels = MODEL_SUBDIVISION_QUALITY
-    bpy.context.selected_objects[0].modifiers[0].subdivision_type = "SIMPLE"
-    bpy.ops.object.modifier_apply(modifier="SUBSURF")
-
-    # add texture
-    texture = bpy.data.textures.new(name="DisplacementMap", type="IMAGE")
-    texture.image = bpy.data.images[baked_image.name]
-
-    # add displacement modifier
-    bpy.ops.object.modifier_add(type="DISPLACE")
-    bpy.context.selected_objects[0].modifiers[0].name = "DISPLACE"
-    bpy.context.selected_objects[0].modifiers[0].strength = displacement_scale_value
-    bpy.context.selected_objects[0].modifiers[0].mid_level = 0
-    bpy.context.selected_objects[0].modifiers[0].texture_coords = "UV"
-    bpy.context.selected_objects[0].modifiers[0].texture = texture
-    bpy.ops.object.modifier_apply(modifier="DISPLACE")
-
-    # get rid of outermost vertices (they make a weird rim)
-    # make an object to use with boolean modifier
-    terrain_obj = bpy.context.object
-    bpy.ops.mesh.primitive_cube_add(location=[0, 0, 0], size=49.8)
-    bpy.context.selected_objects[-1].name = "boolean_mask"
-    boolean_mask = bpy.context.selected_objects[-1]
-    bpy.ops.transform.resize(value=[1, 1, 10])
-    bpy.context.view_layer.objects.active = terrain_obj
-    for obj in bpy.context.scene.objects:
-        if obj.name == "terrain":
-            obj.select_set(True)
-        else:
-            obj.select_set(False)
-
-    # add boolean modifier
-    bpy.ops.object.modifier_add(type="BOOLEAN")
-    bpy.context.selected_objects[0].modifiers[0].name = "BOOLEAN"
-    bpy.context.selected_objects[0].modifiers[0].object = boolean_mask
-    bpy.context.selected_objects[0].modifiers[0].operation = "INTERSECT"
-    bpy.ops.object.modifier_apply(modifier="BOOLEAN")
-
-    # delete boolean mask
-    for obj in bpy.context.scene.objects:
-        if obj.name == "boolean_mask":
-            obj.select_set(True)
-        else:
-            obj.select_set(False)
-    bpy.ops.object.delete()
-    for obj in bpy.context.scene.objects:
-        obj.select_set(True)
-
-    # add decimate modifier
-    bpy.ops.object.modifier_add(type="DECIMATE")
-    bpy.context.selected_objects[0].modifiers[0].name = "DECIMATE"
-    bpy.context.selected_objects[0].modifiers[0].decimate_type = "COLLAPSE"
-    bpy.context.selected_objects[0].modifiers[0].ratio = MODEL_DECIMATE_RATIO
-    bpy.ops.object.modifier_apply(modifier="DECIMATE")
-
-    # export to stl file
-    for x in bpy.context.scene.objects:
-        x.select_set(True)
-    if os.path.exists(STL_EXPORT_FILEPATH):
-        os.remove(STL_EXPORT_FILEPATH)
-    open(STL_EXPORT_FILEPATH, "x")
-
-    bpy.ops.export_mesh.stl(
-        filepath=STL_EXPORT_FILEPATH,
-        use_selection=True
+    pipeline.print_report(pipeline.run(seed, os.path.join(output_dir, str(number).rjust(2, "0")), settings,
+                                       profiler=profiler))
+    profiler.close()
+
+
+def parse_args(
+        argv: Sequence[str]
+) -> argparse.Namespace:
+    """Read the command line, inside Blender only what comes after --"""
+    parser = argparse.ArgumentParser(description="Make a landscape")
+    parser.add_argument("seeds", nargs="*", default=[SEED])
+    parser.add_argument("--number", type=int, default=NUMBER, help="number used in the file names")
+    parser.add_argument("--output-dir", default=OUTPUT_DIRECTORY)
+    parser.add_argument("--map-size", type=int, default=DISPLACEMENT_MAP_DIMENSIONS[0])
+    parser.add_argument("--level", type=int, default=MODEL_SUBDIVISION_QUALITY)
+    parser.add_argument("--decimate-ratio", type=float, default=MODEL_DECIMATE_RATIO)
+    parser.add_argument("--max-error", type=float, default=MODEL_MAX_ERROR)
+    parser.add_argument("--cache-dir", default=HEIGHTMAP_CACHE_DIRECTORY,
+                        help="keep displacement maps here and reuse them")
+    parser.add_argument("--no-cache", action="store_const", const=None, dest="cache_dir",
+                        help="always make the displacement map, don't keep it")
+    parser.add_argument("--stl", action="store_true", help="in Blender, also bake and save the stl model")
+    parser.add_argument("--backend", choices=("auto", "blender", "numpy"), default="auto",
+                        help="blender needs to run inside Blender, auto uses it if it can")
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1:]
+    elif in_blender():
+        argv = []  # blender's own arguments
+    else:
+        argv = argv[1:]
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    import pipeline
+
+    args = parse_args(sys.argv)
+    settings = pipeline.Settings(
+        map_size=args.map_size,
+        subdivision_level=args.level,
+        decimate_ratio=args.decimate_ratio,
+        max_error=args.max_error,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=HEIGHTMAP_CACHE_MAX_BYTES
     )
-
-
-def generate_terrain(
-        seed: str
-) -> None:
-    """Generate just the stl file for the terrain"""
-    # noise coordinates
-    noise_value = gen_noise_value_from_seed(seed)
-    displacement_scale_value = displacement_scale_value_from_seed(seed)
-
-    # add the plane in
-    bpy.ops.mesh.primitive_plane_add(location=[0, 0, 0], size=50)
-    bpy.context.selected_objects[0].name = "terrain"
-
-    # subdivide it
-    bpy.ops.object.modifier_add(type="SUBSURF")
-    bpy.context.selected_objects[0].modifiers[0].name = "SUBSURF"
-    bpy.context.selected_objects[0].modifiers[0].levels = 8
-    bpy.context.selected_objects[0].modifiers[0].subdivision_type = "SIMPLE"
-
-    # other stuff
-    bpy.context.selected_objects[0].cycles.use_adaptive_subdivision = True
-
-    # make material
-    terrain_material = bpy.data.materials.new(name="TerrainMaterial")
-    bpy.data.materials["TerrainMaterial"].use_nodes = True
-    bpy.data.materials["TerrainMaterial"].cycles.displacement_method = "BOTH"
-
-    nodes = terrain_material.node_tree.nodes
-    node_tree = terrain_material.node_tree
-    links = node_tree.links
-
-    # terrain nodes
-    bsdf_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeBsdfPrincipled)][0]
-    output_node = [x for x in nodes if isinstance(x, bpy.types.ShaderNodeOutputMaterial)][0]
-    bsdf_node.location = 2000, 1000
-    output_node.location = 2400, 0
-
-    texture_coordinate_node = node_tree.nodes.new("ShaderNodeTexCoord")
-    texture_coordinate_node.location = 200, 0
-
-    shader_mapping_node = node_tree.nodes.new("ShaderNodeMapping")
-    shader_mapping_node.location = 600, 0
-    value_node_set_1_0 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_0.location = 400, -400
-    value_node_set_1_0.outputs["Value"].default_value = noise_value
-
-    musgrave_1_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
-    musgrave_1_node.location = 800, 0
-    musgrave_1_node.musgrave_dimensions = "4D"
-    musgrave_1_node.musgrave_type = "FBM"
-    value_node_set_1_1 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_1.location = 600, -600
-    value_node_set_1_1.outputs["Value"].default_value = 0.15
-    value_node_set_1_2 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_2.location = 600, -800
-    value_node_set_1_2.outputs["Value"].default_value = 16
-    value_node_set_1_3 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_3.location = 600, -1000
-    value_node_set_1_3.outputs["Value"].default_value = 0.95
-
-    voronoi_1_node = node_tree.nodes.new("ShaderNodeTexVoronoi")
-    voronoi_1_node.location = 1000, 0
-    voronoi_1_node.feature = "SMOOTH_F1"
-    value_node_set_1_4 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_4.location = 800, -400
-    value_node_set_1_4.outputs["Value"].default_value = 0.3
-
-    musgrave_2_node = node_tree.nodes.new("ShaderNodeTexMusgrave")
-    musgrave_2_node.location = 1200, 0
-    musgrave_2_node.musgrave_dimensions = "3D"
-    musgrave_2_node.musgrave_type = "FBM"
-    value_node_set_1_5 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_5.location = 1100, -600
-    value_node_set_1_5.outputs["Value"].default_value = 9
-    value_node_set_1_6 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_6.location = 1100, -800
-    value_node_set_1_6.outputs["Value"].default_value = 14
-    value_node_set_1_7 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_7.location = 1100, -1000
-    value_node_set_1_7.outputs["Value"].default_value = 1.05
-
-    displacement_node = node_tree.nodes.new("ShaderNodeDisplacement")
-    displacement_node.location = 2200, 0
-
-    math_multiply_node_1 = node_tree.nodes.new("ShaderNodeMath")
-    math_multiply_node_1.operation = "ADD"
-    math_multiply_node_1.location = 1600, 0
-    value_node_set_1_8 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_8.outputs["Value"].default_value = 0.75
-    value_node_set_1_8.location = 1600, -400
-
-    value_node_set_1_9 = node_tree.nodes.new("ShaderNodeValue")
-    value_node_set_1_9.outputs["Value"].default_value = displacement_scale_value
-    value_node_set_1_9.location = 1800, -400
-
-    links.new(texture_coordinate_node.outputs[0], shader_mapping_node.inputs[0])
-    links.new(shader_mapping_node.outputs[0], musgrave_1_node.inputs[0])
-    links.new(value_node_set_1_0.outputs[0], musgrave_1_node.inputs[1])
-    links.new(value_node_set_1_1.outputs[0], musgrave_1_node.inputs[2])
-    links.new(value_node_set_1_2.outputs[0], musgrave_1_node.inputs[3])
-    links.new(value_node_set_1_3.outputs[0], musgrave_1_node.inputs[4])
-    links.new(musgrave_1_node.outputs[0], voronoi_1_node.inputs[0])
-    links.new(value_node_set_1_4.outputs[0], voronoi_1_node.inputs[2])
-    links.new(voronoi_1_node.outputs[1], musgrave_2_node.inputs[0])
-    links.new(value_node_set_1_5.outputs[0], musgrave_2_node.inputs[2])
-    links.new(value_node_set_1_6.outputs[0], musgrave_2_node.inputs[3])
-    links.new(value_node_set_1_7.outputs[0], musgrave_2_node.inputs[4])
-    links.new(musgrave_2_node.outputs[0], math_multiply_node_1.inputs[0])
-    links.new(value_node_set_1_8.outputs[0], math_multiply_node_1.inputs[1])
-    links.new(math_multiply_node_1.outputs[0], displacement_node.inputs[0])
-    links.new(value_node_set_1_9.outputs[0], displacement_node.inputs[2])
-    links.new(displacement_node.outputs[0], output_node.inputs[2])
-
-    # assign material to terrain
-    bpy.context.active_object.data.materials.append(terrain_material)
-
-
-setup()
-generate_terrain(SEED)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for number, seed in enumerate(args.seeds, args.number):
+        if args.backend == "blender" or args.backend == "auto" and in_blender():
+            run_blender(seed, number, args.output_dir, settings, args.stl)
+        else:
+            run_numpy(seed, number, args.output_dir, settings)
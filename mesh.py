@@ -0,0 +1,463 @@
+"""
+Heightmap to STL, without Blender
+
+generate_stl used to subdivide a plane, displace it, cut off the rim
+with a boolean and export it, rebuilding the whole mesh at each step.
+Here the heights are a grid already, so the rim is cut off by index and
+the triangles are written straight to a binary STL a strip at a time.
+Memory use depends on the strip size, not on the size of the model.
+
+Usage (no Blender needed):
+    python mesh.py <seed> <output.stl> [--level 10]
+        [--max-error 0.05 | --triangle-budget 500000]
+    python mesh.py <seed> <output.stl> [--workers 12] [--tiles 2 2]
+
+Full quality models can be meshed over several processes (the heights
+are shared with them, not copied) into exactly the same file, or split
+into tiles with one stl file each, for printing big models in pieces.
+"""
+
+from typing import *
+
+import os
+import argparse
+import contextlib
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from procedural import gen_noise_value_from_seed, displacement_scale_value_from_seed
+from heightmap import vertex_coordinates, vertex_heights, iter_bands, MAX_MEMORY
+import rtin
+
+
+# SIZES FROM generate_stl
+PLANE_SIZE = 50  # primitive_plane_add(size=50)
+TRIM_SIZE = 49.8  # the boolean mask cube
+
+# grid rows / triangles meshed at once when writing
+ROWS_PER_STRIP = 32
+ROWS_PER_TASK = 256  # for each worker of write_heightmap_stl_parallel
+TRIANGLES_PER_CHUNK = 1 << 18
+
+# layout of one triangle in a binary stl file
+STL_TRIANGLE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attribute", "<u2")
+])
+STL_HEADER = b"landscapes-thing binary stl".ljust(80, b" ")
+
+
+def grid_positions(
+        samples: int,
+        size: float = PLANE_SIZE
+) -> np.ndarray:
+    """Positions of grid samples across a plane, first and last on the edges"""
+    return np.linspace(-size / 2, size / 2, samples, dtype=np.float32)
+
+
+def rim_width(
+        samples: int,
+        size: float = PLANE_SIZE,
+        trim_size: float = TRIM_SIZE
+) -> int:
+    """Number of samples on each side that the boolean mask would cut off"""
+    return int(np.count_nonzero(grid_positions(samples, size) < -trim_size / 2))
+
+
+def resample(
+        heightmap: np.ndarray,
+        shape: Tuple[int, int],
+        footprint: float = 1.0
+) -> np.ndarray:
+    """Bilinearly sample an image (pixel centred) at the vertices of a grid
+
+    Use this to turn a baked displacement map into vertex heights, the
+    same way the DISPLACE modifier reads the image at each vertex's UV.
+    footprint shrinks the grid around the middle of the image, e.g.
+    TRIM_SIZE / PLANE_SIZE to only cover what the boolean mask keeps.
+    """
+    def weights(samples, pixels):
+        """Pixel before each sample, and how far past it the sample is"""
+        uv = np.linspace(0.5 - footprint / 2, 0.5 + footprint / 2, samples)
+        position = np.clip(uv * pixels - 0.5, 0, pixels - 1)
+        before = np.minimum(position.astype(np.int64), pixels - 2)
+        return before, (position - before).astype(np.float32)
+
+    row, row_weight = weights(shape[0], heightmap.shape[0])
+    col, col_weight = weights(shape[1], heightmap.shape[1])
+    row_weight = row_weight[:, None]
+    top = heightmap[row] * (1 - row_weight) + heightmap[row + 1] * row_weight
+    return top[:, col] * (1 - col_weight) + top[:, col + 1] * col_weight
+
+
+def _write_header(
+        file: BinaryIO,
+        count: int
+) -> None:
+    """Write the header and triangle count of a binary stl file"""
+    file.write(STL_HEADER)
+    file.write(np.uint32(count).tobytes())
+
+
+def _fill_normals(
+        triangles: np.ndarray
+) -> None:
+    """Work out the facet normals of stl triangles from their vertices"""
+    vertices = triangles["vertices"]
+    normal = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 2] - vertices[:, 0])
+    length = np.sqrt(np.einsum("ij,ij->i", normal, normal))[:, None]
+    triangles["normal"] = normal / np.where(length > 0, length, 1)
+
+
+def _fill_grid_triangles(
+        triangles: np.ndarray,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray
+) -> None:
+    """Fill stl triangles with two triangles per grid square, anticlockwise"""
+    points = np.empty(z.shape + (3,), np.float32)
+    points[..., 0] = x[None, :]
+    points[..., 1] = y[:, None]
+    points[..., 2] = z
+
+    vertices = triangles["vertices"].reshape(z.shape[0] - 1, z.shape[1] - 1, 2, 3, 3)
+    vertices[:, :, 0, 0] = points[:-1, :-1]
+    vertices[:, :, 0, 1] = points[:-1, 1:]
+    vertices[:, :, 0, 2] = points[1:, 1:]
+    vertices[:, :, 1, 0] = points[:-1, :-1]
+    vertices[:, :, 1, 1] = points[1:, 1:]
+    vertices[:, :, 1, 2] = points[1:, :-1]
+    _fill_normals(triangles)
+
+
+def _write_grid_triangles(
+        file: BinaryIO,
+        x: np.ndarray,
+        y: np.ndarray,
+        blocks: Iterable[np.ndarray],
+        scale: float
+) -> None:
+    """Write the triangles of a grid, given its heights in blocks of rows"""
+    buffer = np.zeros(2 * ROWS_PER_STRIP * (len(x) - 1), STL_TRIANGLE)
+    row = 0
+    previous = None
+    for block in blocks:
+        # squares between blocks need the last row of the block before
+        if previous is not None:
+            block = np.concatenate([previous, block])
+        for start in range(0, len(block) - 1, ROWS_PER_STRIP):
+            stop = min(start + ROWS_PER_STRIP, len(block) - 1) + 1
+            strip = buffer[:2 * (stop - start - 1) * (len(x) - 1)]
+            z = block[start:stop].astype(np.float32) * np.float32(scale)
+            _fill_grid_triangles(strip, x, y[row + start:row + stop], z)
+            strip.tofile(file)
+        row += len(block) - 1
+        previous = block[-1:]
+
+
+def _write_grid_stl(
+        filepath: str,
+        x: np.ndarray,
+        y: np.ndarray,
+        blocks: Iterable[np.ndarray],
+        scale: float
+) -> int:
+    """Write a grid to a binary stl file, given its heights in blocks of rows"""
+    count = 2 * (len(y) - 1) * (len(x) - 1)
+    with open(filepath, "wb") as file:
+        _write_header(file, count)
+        _write_grid_triangles(file, x, y, blocks, scale)
+    return count
+
+
+def _row_blocks(
+        heights: np.ndarray
+) -> Iterator[np.ndarray]:
+    """A grid in blocks of ROWS_PER_STRIP rows"""
+    return (heights[start:start + ROWS_PER_STRIP] for start in range(0, len(heights), ROWS_PER_STRIP))
+
+
+def _trim(
+        shape: Tuple[int, int],
+        size: float,
+        trim_size: float
+) -> Tuple[slice, slice, np.ndarray, np.ndarray]:
+    """Rows and columns of a grid that are kept, and their x and y positions"""
+    rows, cols = shape
+    rim_y = rim_width(rows, size, trim_size)
+    rim_x = rim_width(cols, size, trim_size)
+    y = grid_positions(rows, size)[rim_y:rows - rim_y]
+    x = grid_positions(cols, size)[rim_x:cols - rim_x]
+    return slice(rim_y, rows - rim_y), slice(rim_x, cols - rim_x), x, y
+
+
+def write_heightmap_stl(
+        filepath: str,
+        heights: np.ndarray,
+        scale: float,
+        size: float = PLANE_SIZE,
+        trim_size: float = TRIM_SIZE
+) -> int:
+    """Write a grid of vertex heights to a binary stl file
+
+    heights are the vertices of the plane, edge to edge, row 0 at -Y.
+    They get multiplied by scale (the displacement strength) and the rim
+    outside trim_size is left out. Returns the number of triangles.
+    heights can be a memory-mapped array, only a few rows are read at once.
+    """
+    keep_rows, keep_cols, x, y = _trim(heights.shape, size, trim_size)
+    return _write_grid_stl(filepath, x, y, _row_blocks(heights[keep_rows, keep_cols]), scale)
+
+
+def write_heightmap_stl_stream(
+        filepath: str,
+        bands: Iterable[Tuple[int, np.ndarray]],
+        shape: Tuple[int, int],
+        scale: float,
+        size: float = PLANE_SIZE,
+        trim_size: float = TRIM_SIZE
+) -> int:
+    """write_heightmap_stl, for heights that come in bands of rows
+
+    bands yields (first row, band) in order, like heightmap.iter_bands,
+    and shape is the shape of the whole grid. Only one band is held in
+    memory at a time.
+    """
+    keep_rows, keep_cols, x, y = _trim(shape, size, trim_size)
+
+    def trimmed():
+        """The bands, without the rim"""
+        for first, band in bands:
+            band = band[max(keep_rows.start - first, 0):max(keep_rows.stop - first, 0), keep_cols]
+            if len(band):
+                yield band
+
+    return _write_grid_stl(filepath, x, y, trimmed(), scale)
+
+
+class SharedGrid(NamedTuple):
+    """A grid of float32 heights in shared memory, for worker processes"""
+    name: str
+    shape: Tuple[int, int]
+
+
+@contextlib.contextmanager
+def shared_grid(
+        heights: np.ndarray
+) -> Iterator[SharedGrid]:
+    """Copy heights into shared memory for as long as the with block runs
+
+    Workers attach to it by name, so the heights are only copied once
+    however many workers use them. heights can be a memory-mapped array.
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(heights.size * 4, 1))
+    try:
+        shared = np.ndarray(heights.shape, np.float32, buffer=memory.buf)
+        for start in range(0, len(heights), ROWS_PER_STRIP):
+            shared[start:start + ROWS_PER_STRIP] = heights[start:start + ROWS_PER_STRIP]
+        del shared
+        yield SharedGrid(memory.name, heights.shape)
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def _split(
+        length: int,
+        parts: int
+) -> List[Tuple[int, int]]:
+    """Split range(length) into `parts` (start, stop) ranges, as even as possible"""
+    edges = np.linspace(0, length, parts + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def _write_rows_task(
+        grid: SharedGrid,
+        filepath: str,
+        rows: Tuple[int, int],
+        cols: Tuple[int, int],
+        scale: float,
+        size: float,
+        trim_size: float,
+        offset: Optional[int] = None
+) -> None:
+    """Worker: mesh some squares of the trimmed grid
+
+    rows and cols are (start, stop) of the squares. With offset, the
+    triangles go at that byte offset in an existing file, otherwise they
+    make their own stl file.
+    """
+    memory = shared_memory.SharedMemory(name=grid.name)
+    try:
+        heights = np.ndarray(grid.shape, np.float32, buffer=memory.buf)
+        keep_rows, keep_cols, x, y = _trim(grid.shape, size, trim_size)
+        x, y = x[cols[0]:cols[1] + 1], y[rows[0]:rows[1] + 1]
+        tile = heights[keep_rows, keep_cols][rows[0]:rows[1] + 1, cols[0]:cols[1] + 1]
+        if offset is None:
+            _write_grid_stl(filepath, x, y, _row_blocks(tile), scale)
+        else:
+            with open(filepath, "r+b") as file:
+                file.seek(offset)
+                _write_grid_triangles(file, x, y, _row_blocks(tile), scale)
+        del heights, tile
+    finally:
+        memory.close()
+
+
+def write_heightmap_stl_parallel(
+        filepath: str,
+        heights: np.ndarray,
+        scale: float,
+        size: float = PLANE_SIZE,
+        trim_size: float = TRIM_SIZE,
+        workers: Optional[int] = None
+) -> int:
+    """write_heightmap_stl, with strips of rows meshed by a process pool
+
+    The heights go in shared memory once, and each worker writes its
+    strip straight into its place in the file, so the file is exactly
+    the same as write_heightmap_stl's. Returns the number of triangles.
+    """
+    keep_rows, keep_cols, x, y = _trim(heights.shape, size, trim_size)
+    squares = len(y) - 1, len(x) - 1
+    count = 2 * squares[0] * squares[1]
+    with open(filepath, "wb") as file:
+        _write_header(file, count)
+        file.truncate(file.tell() + count * STL_TRIANGLE.itemsize)
+
+    strips = _split(squares[0], max(squares[0] // ROWS_PER_TASK, 1))
+    with shared_grid(heights) as grid, concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _write_rows_task, grid, filepath, rows, (0, squares[1]), scale, size, trim_size,
+                len(STL_HEADER) + 4 + rows[0] * 2 * squares[1] * STL_TRIANGLE.itemsize
+            )
+            for rows in strips
+        ]
+        for future in futures:
+            future.result()
+    return count
+
+
+def write_heightmap_tiles(
+        filepath: str,
+        heights: np.ndarray,
+        scale: float,
+        tiles: Tuple[int, int],
+        size: float = PLANE_SIZE,
+        trim_size: float = TRIM_SIZE,
+        workers: Optional[int] = None
+) -> List[str]:
+    """Write the model as (rows, columns) tiles, one stl file each
+
+    For printing big models in pieces: tile files are named like
+    model-<row>-<column>.stl for filepath model.stl, row 0 at -Y, and
+    neighbouring tiles share their edge vertices so they line up.
+    Every triangle is the same as in write_heightmap_stl's file.
+    Returns the tile filenames.
+    """
+    keep_rows, keep_cols, x, y = _trim(heights.shape, size, trim_size)
+    stem, extension = os.path.splitext(filepath)
+    jobs = [
+        (f"{stem}-{i}-{j}{extension or '.stl'}", rows, cols)
+        for i, rows in enumerate(_split(len(y) - 1, tiles[0]))
+        for j, cols in enumerate(_split(len(x) - 1, tiles[1]))
+    ]
+    with shared_grid(heights) as grid, concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_rows_task, grid, path, rows, cols, scale, size, trim_size)
+            for path, rows, cols in jobs
+        ]
+        for future in futures:
+            future.result()
+    return [path for path, _, _ in jobs]
+
+
+def write_adaptive_stl(
+        filepath: str,
+        heights: np.ndarray,
+        scale: float,
+        max_error: Optional[float] = None,
+        triangle_budget: Optional[int] = None,
+        size: float = TRIM_SIZE,
+        errors: Optional[np.ndarray] = None
+) -> int:
+    """Write a simplified mesh of a grid of vertex heights to a binary stl file
+
+    heights must be a square 2^k + 1 grid covering a square of `size`, so
+    already trimmed (see the footprint of resample and vertex_heights).
+    Triangles are only split where a grid point would otherwise be more
+    than max_error (in model units) above or below the mesh, so none is.
+    If triangle_budget is given instead,
+    the smallest error that fits in that many triangles is used. With
+    neither, only exactly flat areas get merged. errors are the
+    rtin.midpoint_errors of heights * scale, if they're already known.
+    Returns the number of triangles.
+    """
+    z = heights.astype(np.float32) * np.float32(scale)
+    if errors is None:
+        errors = rtin.midpoint_errors(z)
+    if max_error is None:
+        max_error = 0.0 if triangle_budget is None else rtin.max_error_for_budget(errors, triangle_budget)
+    count = rtin.triangle_count(errors, max_error)
+    positions = grid_positions(len(z), size)
+
+    buffer = np.zeros(TRIANGLES_PER_CHUNK, STL_TRIANGLE)
+    with open(filepath, "wb") as file:
+        _write_header(file, count)
+        for corners in rtin.triangles(errors, max_error):
+            for start in range(0, len(corners), TRIANGLES_PER_CHUNK):
+                chunk = corners[start:start + TRIANGLES_PER_CHUNK]
+                rows, cols = chunk[..., 0], chunk[..., 1]
+                triangles = buffer[:len(chunk)]
+                vertices = triangles["vertices"]
+                vertices[..., 0] = positions[cols]
+                vertices[..., 1] = positions[rows]
+                vertices[..., 2] = z[rows, cols]
+                _fill_normals(triangles)
+                triangles.tofile(file)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the stl model without Blender")
+    parser.add_argument("seed")
+    parser.add_argument("output", help="where to save the model (.stl)")
+    parser.add_argument("--level", type=int, default=10, help="subdivision level, like MODEL_SUBDIVISION_QUALITY")
+    parser.add_argument("--max-error", type=float, help="simplify, keeping the vertical error under this")
+    parser.add_argument("--triangle-budget", type=int, help="simplify down to this many triangles")
+    parser.add_argument("--max-memory", type=int, default=MAX_MEMORY // 1024 ** 2,
+                        help="in MB, for the heights of full quality models")
+    parser.add_argument("--workers", type=int, help="mesh full quality models over this many processes")
+    parser.add_argument("--tiles", nargs=2, type=int, metavar=("ROWS", "COLUMNS"),
+                        help="write a full quality model as this many separate stl files")
+    args = parser.parse_args()
+
+    noise_value = gen_noise_value_from_seed(args.seed)
+    scale = displacement_scale_value_from_seed(args.seed)
+    if args.tiles is not None:
+        write_heightmap_tiles(args.output, vertex_heights(noise_value, args.level), scale, args.tiles,
+                              workers=args.workers)
+    elif args.workers is not None:
+        write_heightmap_stl_parallel(args.output, vertex_heights(noise_value, args.level), scale,
+                                     workers=args.workers)
+    elif args.max_error is None and args.triangle_budget is None:
+        coordinates = vertex_coordinates(args.level)
+        write_heightmap_stl_stream(
+            args.output,
+            iter_bands(noise_value, coordinates, coordinates, args.max_memory * 1024 ** 2),
+            (len(coordinates), len(coordinates)),
+            scale
+        )
+    else:
+        write_adaptive_stl(
+            args.output,
+            vertex_heights(noise_value, args.level, TRIM_SIZE / PLANE_SIZE),
+            scale,
+            max_error=args.max_error,
+            triangle_budget=args.triangle_budget
+        )
@@ -0,0 +1,140 @@
+"""
+Procedural values for many seeds at once
+
+The functions in procedural.py hash the seed again for every value, and
+adjacent_colors hashes each link of its chain twice. For screening and
+batches this works out the same values for lots of seeds in one go:
+every string is hashed once, and the colour maths (HSV <-> RGB, the
+adjacent colour changes and clamping) is done with NumPy over all the
+seeds together. The results are exactly what the scalar functions give.
+
+Only the hashing is still a loop, as every palette colour's key is the
+text of the previous hash (it has to be made by Python to match).
+"""
+
+from typing import *
+
+import struct
+import hashlib
+
+import numpy as np
+
+
+# repr of every value gen_data_from_hash can give, made when first needed
+_value_reprs = None
+
+
+def params_dtype(
+        palette_size: int
+) -> np.dtype:
+    """Layout of the values for one seed"""
+    return np.dtype([
+        ("hue", "f8"),
+        ("sat", "f8"),
+        ("noise_value", "f8"),  # gen_noise_value_from_seed
+        ("displacement_scale", "f8"),  # displacement_scale_value_from_seed
+        ("color", "f8", (3,)),  # gen_color_from_seed
+        ("palette", "f8", (palette_size, 3))  # adjacent_colors(color, seed, palette_size)
+    ])
+
+
+def _hash_data(
+        digests: Sequence[bytes]
+) -> np.ndarray:
+    """gen_data_from_hash of digests, shape (digests, 16)"""
+    return np.frombuffer(b"".join(digests), ">u2").reshape(len(digests), 16) / 65536
+
+
+def _sha256(
+        key: str
+) -> bytes:
+    """Digest of a key, like gen_data_from_hash"""
+    return hashlib.sha256(key.encode("utf-8")).digest()
+
+
+def _next_key(
+        digest: bytes
+) -> str:
+    """The key adjacent_colors makes from a digest, str(gen_data_from_hash(..., 4))
+
+    Formatting floats is most of the time taken, so the text of each of
+    the 65536 possible values is only made once.
+    """
+    global _value_reprs
+    if _value_reprs is None:
+        _value_reprs = [repr(x / 65536) for x in range(65536)]
+    return "[" + ", ".join([_value_reprs[x] for x in struct.unpack(">4H", digest[:8])]) + "]"
+
+
+def hsv_to_rgb(
+        hue: np.ndarray,
+        sat: np.ndarray,
+        val: np.ndarray
+) -> np.ndarray:
+    """colorsys.hsv_to_rgb of arrays, shape (..., 3)"""
+    hue, sat, val = np.broadcast_arrays(*[np.asarray(x, np.float64) for x in (hue, sat, val)])
+    i = np.trunc(hue * 6.0)
+    f = hue * 6.0 - i
+    p = val * (1.0 - sat)
+    q = val * (1.0 - sat * f)
+    t = val * (1.0 - sat * (1.0 - f))
+    i = i.astype(np.int64) % 6
+
+    choices = [
+        np.stack(x, axis=-1)
+        for x in ((val, t, p), (q, val, p), (p, val, t), (p, q, val), (t, p, val), (val, p, q))
+    ]
+    rgb = np.choose(i[..., None], choices)
+    return np.where((sat == 0.0)[..., None], np.stack([val, val, val], axis=-1), rgb)
+
+
+def rgb_to_hsv(
+        rgb: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """colorsys.rgb_to_hsv of an array of shape (..., 3)"""
+    r, g, b = np.moveaxis(np.asarray(rgb, np.float64), -1, 0)
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    grey = minc == maxc
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sat = rangec / maxc
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    hue = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    hue = np.mod(hue / 6.0, 1.0)
+    return np.where(grey, 0.0, hue), np.where(grey, 0.0, sat), maxc
+
+
+def seed_params(
+        seeds: Sequence[str],
+        palette_size: int = 4,
+        factor: float = 2
+) -> np.ndarray:
+    """Every procedural value of some seeds, one record per seed (params_dtype)"""
+    digests = [_sha256(x) for x in seeds]
+    data = _hash_data(digests)
+
+    # the adjacent colour chain, one hash per colour
+    chain = np.empty((len(seeds), palette_size, 3))
+    keys = [_next_key(x) for x in digests]
+    for i in range(palette_size):
+        digests = [_sha256(x) for x in keys]
+        chain[:, i] = _hash_data(digests)[:, :3] - 0.5
+        if i < palette_size - 1:
+            keys = [_next_key(x) for x in digests]
+
+    result = np.empty(len(seeds), params_dtype(palette_size))
+    result["hue"], result["sat"] = data[:, 0], data[:, 1]
+    result["noise_value"] = data[:, 2] * 1000
+    result["displacement_scale"] = 50 + (data[:, 3] * 25)
+    result["color"] = hsv_to_rgb(data[:, 0], data[:, 1], 255)
+
+    # adjacent_color, for every colour of every seed
+    hue, sat, val = [x[:, None] for x in rgb_to_hsv(result["color"])]
+    hue = np.mod(hue + chain[..., 0] * 0.1 * factor, 1)
+    sat = np.clip(sat + chain[..., 1] * 0.1 * factor, 0, 1)
+    val = np.clip(val + chain[..., 2] * 32 * factor, 0, 255)
+    result["palette"] = hsv_to_rgb(hue, sat, val)
+    return result
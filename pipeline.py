@@ -0,0 +1,555 @@
+"""
+The Blender-free pipeline as stages, only redoing what changed
+
+Making a landscape is a chain of stages:
+
+    params      seed -> colours, noise value, displacement scale
+    heightmap   seed, map size, node graph -> displacement map
+    erosion     heightmap -> eroded heightmap (if asked for), used
+                instead of the heightmap by the stages after it
+    vertices    heightmap, subdivision level -> heights at the vertices
+                of the trimmed model
+    errors      vertices -> RTIN errors (the adaptive mesh)
+    model       vertices, errors, max error / decimate ratio -> stl
+    ply, glb    the same model as PLY / quantized glTF (if asked for)
+    compact     vertices -> 16 bit heightmap to remake the model from
+                (if asked for)
+    layers      heightmap -> normals, slope, curvature and band masks
+                (float16) and the textures made from them (if asked
+                for, they are big: about 300 MB of layers and 190 MB of
+                textures for a 4096 map)
+    preview     heightmap (or layers), palette -> top-down render and
+                thumbnail
+
+Every stage has a fingerprint, a hash of its settings and the
+fingerprints of the stages it reads from. The fingerprints of the last
+run are kept in the output directory (pipeline.json), and a stage is
+only run again if its fingerprint changed or its output is missing. So
+changing the decimate ratio only remakes the model, and changing the
+map size remakes everything but the params.
+
+Usage (no Blender needed):
+    python pipeline.py <seed> <output dir> [--map-size 4096] [--level 10]
+        [--decimate-ratio 0.25 | --max-error 0.05] [--exports ply glb compact] [--erode] [--layers]
+"""
+
+from typing import *
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+
+from procedural import (
+    gen_color_from_seed,
+    gen_noise_value_from_seed,
+    displacement_scale_value_from_seed,
+    adjacent_colors
+)
+from heightmap import write_heightmap_tiled
+import mesh
+import rtin
+import cache
+import preview
+import formats
+import layers
+from erosion import Erosion, erode
+import profiling
+
+
+MANIFEST_FILENAME = "pipeline.json"
+
+# bump this if a stage changes in a way that changes its output
+PIPELINE_VERSION = 3
+
+# every constant in preview.py that changes the image
+PREVIEW_CONSTANTS = (
+    "ELEVATION_BANDS",
+    "LIGHT_AZIMUTH",
+    "LIGHT_ALTITUDE",
+    "AMBIENT",
+    "SLOPE_DARKEN"
+)
+
+# every constant in layers.py that changes the layers
+LAYERS_CONSTANTS = (
+    "CURVATURE_SCALE",
+    "BAND_BLEND",
+    "ELEVATION_BANDS"
+)
+
+# stages that save the model in other formats, run if named in Settings.exports
+EXPORT_STAGES = ("ply", "glb", "compact")
+
+
+class Settings(NamedTuple):
+    """Quality settings for making a landscape"""
+    map_size: int = 4096  # like DISPLACEMENT_MAP_DIMENSIONS
+    subdivision_level: int = 10  # like MODEL_SUBDIVISION_QUALITY
+    decimate_ratio: float = 0.25  # like MODEL_DECIMATE_RATIO
+    max_error: Optional[float] = None  # like MODEL_MAX_ERROR
+    palette_size: int = 4
+    thumbnail_size: int = 256
+    cache_dir: Optional[str] = None  # reuse displacement maps from here
+    cache_max_bytes: int = cache.DEFAULT_MAX_BYTES
+    exports: Tuple[str, ...] = ()  # other model formats to make, names of export stages
+    erosion: Optional[Erosion] = None  # erode the heightmap like this, or not at all
+    layers: bool = False  # make the derived layers and their textures
+
+
+class Stage(NamedTuple):
+    """One step of the pipeline"""
+    name: str
+    outputs: Tuple[str, ...]  # filenames, in the output directory
+    inputs: Tuple[str, ...]  # stages it reads the outputs of
+    config: Callable[[str, Settings], Dict[str, Any]]  # settings its output depends on
+    run: Callable[[str, Settings, Dict[str, Tuple[str, ...]], Tuple[str, ...]], Dict[str, Any]]
+    when: Optional[Callable[[Settings], bool]] = None  # only run if this says so, e.g. if asked for
+
+
+class StageReport(NamedTuple):
+    """What happened to a stage in a run"""
+    name: str
+    fingerprint: str
+    hit: bool  # output reused from an earlier run
+    time: float
+    info: Dict[str, Any]
+
+
+#  ------------------------------
+#  |           Stages           |
+#  ------------------------------
+
+
+def _params(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Procedural values"""
+    color = gen_color_from_seed(seed)
+    params = {
+        "seed": seed,
+        "color": color,
+        "palette": adjacent_colors(color, seed, settings.palette_size),
+        "noise_value": gen_noise_value_from_seed(seed),
+        "displacement_scale": displacement_scale_value_from_seed(seed)
+    }
+    with open(outputs[0], "w") as file:
+        json.dump(params, file, indent=2)
+    return {}
+
+
+def _heightmap(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Displacement map, made in tiles (or linked from the cache) so it never has to fit in memory"""
+    dimensions = settings.map_size, settings.map_size
+    # the old output may be a link to a cached map, which mustn't be written over
+    if os.path.exists(outputs[0]):
+        os.remove(outputs[0])
+    if settings.cache_dir is None:
+        write_heightmap_tiled(gen_noise_value_from_seed(seed), dimensions, outputs[0])
+    else:
+        heights = cache.cached_heightmap(settings.cache_dir, seed, dimensions, settings.cache_max_bytes)
+        try:
+            os.link(heights.filename, outputs[0])
+        except OSError:
+            shutil.copyfile(heights.filename, outputs[0])  # another drive, or links aren't supported
+    return {}
+
+
+def _erosion(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Eroded displacement map"""
+    heights = np.load(inputs["heightmap"][0], mmap_mode="r")
+    eroded = erode(heights, seed, settings.erosion, workers=None)
+    np.save(outputs[0], eroded)
+    return {"mean_change": float(np.mean(np.abs(eroded - heights)))}
+
+
+def _terrain(
+        inputs: Dict[str, Tuple[str, ...]]
+) -> np.ndarray:
+    """The eroded heightmap if there is one, otherwise the heightmap"""
+    return np.load(inputs["erosion" if "erosion" in inputs else "heightmap"][0], mmap_mode="r")
+
+
+def _vertices(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Heights at the vertices of the subdivided plane, rim cut off"""
+    samples = 2 ** settings.subdivision_level + 1
+    heights = _terrain(inputs)
+    np.save(outputs[0], mesh.resample(heights, (samples, samples), mesh.TRIM_SIZE / mesh.PLANE_SIZE))
+    return {}
+
+
+def _errors(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """RTIN errors of the model heights"""
+    z = np.load(inputs["vertices"][0]).astype(np.float32) * np.float32(displacement_scale_value_from_seed(seed))
+    np.save(outputs[0], rtin.midpoint_errors(z))
+    return {}
+
+
+def _triangle_budget(
+        settings: Settings
+) -> int:
+    """Triangles in the model for the decimate ratio"""
+    samples = 2 ** settings.subdivision_level + 1
+    return int(2 * (samples - 1) ** 2 * settings.decimate_ratio)
+
+
+def _model(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Simplified stl model"""
+    triangles = mesh.write_adaptive_stl(
+        outputs[0],
+        np.load(inputs["vertices"][0]),
+        displacement_scale_value_from_seed(seed),
+        max_error=settings.max_error,
+        triangle_budget=_triangle_budget(settings),
+        errors=np.load(inputs["errors"][0])
+    )
+    return {"triangles": triangles}
+
+
+def _indexed_model(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]]
+) -> formats.IndexedMesh:
+    """The simplified model, as vertices and indices"""
+    return formats.adaptive_mesh(
+        np.load(inputs["vertices"][0]),
+        displacement_scale_value_from_seed(seed),
+        max_error=settings.max_error,
+        triangle_budget=_triangle_budget(settings),
+        errors=np.load(inputs["errors"][0])
+    )
+
+
+def _ply(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Simplified model as PLY"""
+    indexed = _indexed_model(seed, settings, inputs)
+    formats.write_ply(outputs[0], indexed)
+    return {"vertices": len(indexed.grid), "triangles": len(indexed.faces)}
+
+
+def _glb(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Simplified model as glTF, with int16 positions"""
+    indexed = _indexed_model(seed, settings, inputs)
+    formats.write_glb(outputs[0], indexed)
+    return {"vertices": len(indexed.grid), "triangles": len(indexed.faces)}
+
+
+def _compact(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Model heights as a 16 bit heightmap"""
+    formats.save_heightmap16(outputs[0], np.load(inputs["vertices"][0]), displacement_scale_value_from_seed(seed))
+    return {}
+
+
+def _layers(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Derived layers and their textures"""
+    heights = _terrain(inputs)
+    derived = np.lib.format.open_memmap(
+        outputs[0], "w+", np.float16, heights.shape + (len(layers.channels()),)
+    )
+    layers.derive(heights, seed, out=derived)
+    layers.write_textures(os.path.dirname(outputs[1]), derived)
+    derived.flush()
+    return {}
+
+
+def _preview(
+        seed: str,
+        settings: Settings,
+        inputs: Dict[str, Tuple[str, ...]],
+        outputs: Tuple[str, ...]
+) -> Dict[str, Any]:
+    """Top-down render (like render 3) and a thumbnail of it"""
+    heights = _terrain(inputs)
+    if "layers" in inputs:
+        layers.render_preview(outputs[0], np.load(inputs["layers"][0], mmap_mode="r"), seed)
+    else:
+        preview.render_preview(outputs[0], heights, seed)
+    preview.render_preview(outputs[1], heights, seed, settings.thumbnail_size)
+    return {}
+
+
+# in order, every stage comes after the ones it reads from
+STAGES = (
+    Stage(
+        "params", ("params.json",), (),
+        lambda seed, s: {"seed": seed, "palette_size": s.palette_size},
+        _params
+    ),
+    Stage(
+        "heightmap", ("heightmap.npy",), (),
+        lambda seed, s: {"key": cache.heightmap_key(seed, (s.map_size, s.map_size))},
+        _heightmap
+    ),
+    Stage(
+        "erosion", ("eroded.npy",), ("heightmap",),
+        lambda seed, s: {"erosion": s.erosion._asdict()},
+        _erosion,
+        when=lambda s: s.erosion is not None
+    ),
+    Stage(
+        "vertices", ("vertices.npy",), ("heightmap", "erosion"),
+        lambda seed, s: {"level": s.subdivision_level, "footprint": mesh.TRIM_SIZE / mesh.PLANE_SIZE},
+        _vertices
+    ),
+    Stage(
+        "errors", ("errors.npy",), ("vertices",),
+        lambda seed, s: {"scale": displacement_scale_value_from_seed(seed)},
+        _errors
+    ),
+    Stage(
+        "model", ("model.stl",), ("vertices", "errors"),
+        lambda seed, s: {
+            "max_error": s.max_error,
+            "decimate_ratio": None if s.max_error is not None else s.decimate_ratio,
+            "size": mesh.TRIM_SIZE
+        },
+        _model
+    ),
+    Stage(
+        "ply", ("model.ply",), ("vertices", "errors"),
+        lambda seed, s: {
+            "max_error": s.max_error,
+            "decimate_ratio": None if s.max_error is not None else s.decimate_ratio,
+            "size": mesh.TRIM_SIZE
+        },
+        _ply,
+        when=lambda s: "ply" in s.exports
+    ),
+    Stage(
+        "glb", ("model.glb",), ("vertices", "errors"),
+        lambda seed, s: {
+            "max_error": s.max_error,
+            "decimate_ratio": None if s.max_error is not None else s.decimate_ratio,
+            "size": mesh.TRIM_SIZE
+        },
+        _glb,
+        when=lambda s: "glb" in s.exports
+    ),
+    Stage(
+        "compact", ("model.npz",), ("vertices",),
+        lambda seed, s: {"scale": displacement_scale_value_from_seed(seed), "size": mesh.TRIM_SIZE},
+        _compact,
+        when=lambda s: "compact" in s.exports
+    ),
+    Stage(
+        "layers", ("layers.npy",) + tuple(layers.TEXTURES.values()), ("heightmap", "erosion"),
+        lambda seed, s: {
+            "scale": displacement_scale_value_from_seed(seed),
+            "size": mesh.PLANE_SIZE,
+            "constants": {name: getattr(layers, name) for name in LAYERS_CONSTANTS}
+        },
+        _layers,
+        when=lambda s: s.layers
+    ),
+    Stage(
+        "preview", ("render-3.png", "thumbnail.png"), ("heightmap", "erosion", "layers"),
+        lambda seed, s: {
+            "seed": seed,
+            "thumbnail_size": s.thumbnail_size,
+            "constants": {name: getattr(preview, name) for name in PREVIEW_CONSTANTS}
+        },
+        _preview
+    )
+)
+
+
+#  ------------------------------
+#  |          Running           |
+#  ------------------------------
+
+
+def fingerprint(
+        stage: Stage,
+        seed: str,
+        settings: Settings,
+        input_fingerprints: Sequence[str]
+) -> str:
+    """Hash of everything the output of a stage depends on"""
+    description = json.dumps({
+        "version": PIPELINE_VERSION,
+        "stage": stage.name,
+        "config": stage.config(seed, settings),
+        "inputs": list(input_fingerprints)
+    }, sort_keys=True)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+def _load_manifest(
+        output_dir: str
+) -> Dict[str, Dict[str, Any]]:
+    """Fingerprints (and info) of the stages of the last run"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_manifest(
+        output_dir: str,
+        manifest: Dict[str, Dict[str, Any]]
+) -> None:
+    """Save the manifest, replacing the old one in one go"""
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    with open(path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _stage(
+        stages: Sequence[Stage],
+        name: str
+) -> Stage:
+    """Find a stage by name"""
+    return next(x for x in stages if x.name == name)
+
+
+def run(
+        seed: str,
+        output_dir: str,
+        settings: Settings = Settings(),
+        stages: Sequence[Stage] = STAGES,
+        profiler: Optional[profiling.Profiler] = None
+) -> List[StageReport]:
+    """Make everything for a seed in output_dir, reusing what's still valid
+
+    Returns a report for every stage, saying whether it was a cache hit.
+    Stages that run are also recorded by the profiler, if one is given.
+    """
+    if profiler is None:
+        profiler = profiling.Profiler()
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = _load_manifest(output_dir)
+    fingerprints = {}
+    reports = []
+
+    for stage in stages:
+        if stage.when is not None and not stage.when(settings):
+            fingerprints[stage.name] = None  # skipped, the stages after it read from what it would have
+            continue
+        stage_fingerprint = fingerprint(stage, seed, settings, [fingerprints[x] for x in stage.inputs])
+        fingerprints[stage.name] = stage_fingerprint
+        outputs = tuple(os.path.join(output_dir, x) for x in stage.outputs)
+        previous = manifest.get(stage.name, {})
+
+        if previous.get("fingerprint") == stage_fingerprint and all(os.path.exists(x) for x in outputs):
+            reports.append(StageReport(stage.name, stage_fingerprint, True, 0.0, previous.get("info", {})))
+            continue
+
+        # forget the old output first, so a stage that fails halfway
+        # through never looks finished
+        manifest.pop(stage.name, None)
+        _save_manifest(output_dir, manifest)
+
+        start = time.perf_counter()
+        inputs = {
+            x: tuple(os.path.join(output_dir, y) for y in _stage(stages, x).outputs)
+            for x in stage.inputs if fingerprints[x] is not None
+        }
+        with profiler.stage(stage.name, fingerprint=stage_fingerprint[:12]) as counters:
+            info = stage.run(seed, settings, inputs, outputs)
+            counters.update(info)
+        reports.append(StageReport(stage.name, stage_fingerprint, False, time.perf_counter() - start, info))
+
+        manifest[stage.name] = {"fingerprint": stage_fingerprint, "info": info}
+        _save_manifest(output_dir, manifest)
+
+    return reports
+
+
+def print_report(
+        reports: Sequence[StageReport]
+) -> None:
+    """Print which stages were cache hits and how long the rest took"""
+    for report in reports:
+        status = "cached" if report.hit else f"{report.time:.2f}s"
+        print(f"{report.name:<10}  {report.fingerprint[:12]}  {status}")
+    print(f"{sum(x.hit for x in reports)} of {len(reports)} stages cached, "
+          f"{sum(x.time for x in reports):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make a landscape, only redoing what changed")
+    parser.add_argument("seed")
+    parser.add_argument("output_dir")
+    defaults = Settings()
+    parser.add_argument("--map-size", type=int, default=defaults.map_size)
+    parser.add_argument("--level", type=int, default=defaults.subdivision_level)
+    parser.add_argument("--decimate-ratio", type=float, default=defaults.decimate_ratio)
+    parser.add_argument("--max-error", type=float)
+    parser.add_argument("--thumbnail-size", type=int, default=defaults.thumbnail_size)
+    parser.add_argument("--exports", nargs="+", default=[], choices=EXPORT_STAGES,
+                        help="also save the model in these formats")
+    parser.add_argument("--erode", action="store_true", help="erode the heightmap (see erosion.py)")
+    parser.add_argument("--layers", action="store_true", help="also make the derived layers and textures")
+    parser.add_argument("--erosion-budget", type=int, help="most cell updates the erosion can do")
+    parser.add_argument("--cache-dir", help="keep displacement maps here and reuse them")
+    parser.add_argument("--trace", help="save a trace of the stages that ran here (.json, for ui.perfetto.dev)")
+    args = parser.parse_args()
+
+    profiler = profiling.Profiler(args.trace, seed=args.seed)
+    print_report(run(args.seed, args.output_dir, Settings(
+        map_size=args.map_size,
+        subdivision_level=args.level,
+        decimate_ratio=args.decimate_ratio,
+        max_error=args.max_error,
+        thumbnail_size=args.thumbnail_size,
+        cache_dir=args.cache_dir,
+        exports=tuple(args.exports),
+        erosion=Erosion(budget=args.erosion_budget) if args.erode else None,
+        layers=args.layers
+    ), profiler=profiler))
+    profiler.close()
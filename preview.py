@@ -0,0 +1,205 @@
+"""
+Top-down preview renders without Blender
+
+Render 3 (the top-down orthographic render) is more or less a shaded
+heightmap, so this makes it straight from the displacement map instead
+of with Cycles. Every pixel is coloured from the seed palette
+(gen_color_from_seed and adjacent_colors) by which elevation band it is
+in, then shaded by a hillshade and darkened on steep slopes.
+
+The image is worked out a band of rows at a time and written as a PNG
+with streaming zlib compression, so full resolution (and bigger) maps
+never need the whole image in memory. With --size it makes a small
+thumbnail instead.
+
+Usage (no Blender needed):
+    python preview.py <seed> <output.png> [--map-size 4096] [--size 256]
+    python preview.py <seed> <output.png> --heightmap heightmap.npy
+"""
+
+from typing import *
+
+import math
+import zlib
+import struct
+import argparse
+
+import numpy as np
+
+from procedural import gen_color_from_seed, displacement_scale_value_from_seed, adjacent_colors
+from heightmap import heightmap_from_seed
+from mesh import resample, PLANE_SIZE
+
+
+# palette
+ELEVATION_BANDS = 5  # the seed colour and 4 adjacent colours, lowest first
+
+# lighting, from the top left like most hillshades
+LIGHT_AZIMUTH = 315  # degrees clockwise from +Y (up in the image)
+LIGHT_ALTITUDE = 45  # degrees above the horizon
+AMBIENT = 0.35  # how bright a fully shadowed slope still is
+SLOPE_DARKEN = 0.4  # how much darker a vertical slope is than a flat one
+
+# png
+ROWS_PER_BAND = 256
+COMPRESSION_LEVEL = 6
+
+
+def palette(
+        seed: str,
+        bands: int = ELEVATION_BANDS
+) -> np.ndarray:
+    """Colour of each elevation band, shape (bands, 3), 0 to 255"""
+    color = gen_color_from_seed(seed)
+    return np.array([color] + adjacent_colors(color, seed, bands - 1), np.float32)
+
+
+def band_edges(
+        heights: np.ndarray,
+        bands: int = ELEVATION_BANDS
+) -> np.ndarray:
+    """Heights between the elevation bands, evenly spaced from lowest to highest"""
+    low, high = float(np.min(heights)), float(np.max(heights))
+    return np.linspace(low, high, bands + 1)[1:-1].astype(np.float32)
+
+
+def _light() -> np.ndarray:
+    """Unit vector pointing at the light"""
+    azimuth, altitude = math.radians(LIGHT_AZIMUTH), math.radians(LIGHT_ALTITUDE)
+    return np.array([
+        math.sin(azimuth) * math.cos(altitude),
+        math.cos(azimuth) * math.cos(altitude),
+        math.sin(altitude)
+    ], np.float32)
+
+
+def lighting(
+        normals: np.ndarray
+) -> np.ndarray:
+    """Brightness of unit surface normals, shape (..., 3) -> (...)"""
+    normals = np.asarray(normals, np.float32)
+    hillshade = np.maximum(normals @ _light(), 0)
+
+    # the z of the normal is the cosine of the slope, so steep bits are darker
+    return (AMBIENT + (1 - AMBIENT) * hillshade) * (1 - SLOPE_DARKEN * (1 - normals[..., 2]))
+
+
+def shade(
+        heights: np.ndarray,
+        colors: np.ndarray,
+        edges: np.ndarray,
+        spacing: float,
+        scale: float
+) -> np.ndarray:
+    """Colour a block of the heightmap, returns (rows, columns, 3) floats
+
+    spacing is the distance between pixels and scale the displacement
+    strength, both in blender units, so slopes are the real ones.
+    """
+    heights = np.asarray(heights, np.float32)
+    dz_dy, dz_dx = np.gradient(heights * np.float32(scale / spacing))
+
+    # the surface normal is (-dz/dx, -dz/dy, 1), made unit length
+    normals = np.stack([-dz_dx, -dz_dy, np.ones_like(dz_dx)], axis=-1)
+    normals /= np.sqrt(dz_dx * dz_dx + dz_dy * dz_dy + 1)[..., None]
+    return colors[np.searchsorted(edges, heights)] * lighting(normals)[..., None]
+
+
+def iter_rows(
+        heights: np.ndarray,
+        seed: str,
+        scale: Optional[float] = None,
+        size: float = PLANE_SIZE,
+        rows_per_band: int = ROWS_PER_BAND
+) -> Iterator[np.ndarray]:
+    """Yield the preview image as bands of uint8 (rows, columns, 3), top first
+
+    The top of the image is +Y, like blender's top view, so this goes
+    through the heightmap from the last row to the first. Every band is
+    shaded with one row of its neighbours, so it comes out the same as
+    shading the whole map at once.
+    """
+    if scale is None:
+        scale = displacement_scale_value_from_seed(seed)
+    colors = palette(seed)
+    edges = band_edges(heights)
+    spacing = size / heights.shape[1]
+
+    rows = heights.shape[0]
+    for stop in range(rows, 0, -rows_per_band):
+        start = max(stop - rows_per_band, 0)
+        first, last = max(start - 1, 0), min(stop + 1, rows)
+        image = shade(heights[first:last], colors, edges, spacing, scale)[start - first:stop - first]
+        yield np.clip(np.rint(image[::-1]), 0, 255).astype(np.uint8)
+
+
+def _chunk(
+        kind: bytes,
+        data: bytes
+) -> bytes:
+    """A png chunk"""
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png(
+        filepath: str,
+        bands: Iterable[np.ndarray],
+        shape: Tuple[int, int],
+        level: int = COMPRESSION_LEVEL,
+        channels: int = 3,
+        bit_depth: int = 8
+) -> None:
+    """Write a png from bands of rows, compressing as it goes
+
+    shape is (height, width) of the whole image. Bands are (rows,
+    columns, channels) of uint8, or uint16 for a bit depth of 16, and
+    1 to 4 channels are grey, grey and alpha, RGB and RGBA.
+    """
+    height, width = shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    row_bytes = width * channels * bit_depth // 8
+    compressor = zlib.compressobj(level)
+    with open(filepath, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)))
+        for band in bands:
+            # every row starts with its filter type (0, none), samples are big endian
+            rows = np.zeros((len(band), row_bytes + 1), np.uint8)
+            rows[:, 1:] = band.astype(">u2" if bit_depth == 16 else np.uint8).reshape(len(band), -1).view(np.uint8)
+            data = compressor.compress(rows.tobytes())
+            if data:
+                file.write(_chunk(b"IDAT", data))
+        file.write(_chunk(b"IDAT", compressor.flush()))
+        file.write(_chunk(b"IEND", b""))
+
+
+def render_preview(
+        filepath: str,
+        heights: np.ndarray,
+        seed: str,
+        size: Optional[int] = None
+) -> None:
+    """Render the top-down preview of a heightmap to a png
+
+    heights can be a memory-mapped array. With `size` the map is
+    resampled first, for a size x size thumbnail.
+    """
+    if size is not None:
+        heights = resample(heights, (size, size)).astype(np.float32)
+    write_png(filepath, iter_rows(heights, seed), heights.shape[:2])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the top-down preview without Blender")
+    parser.add_argument("seed")
+    parser.add_argument("output", help="where to save the image (.png)")
+    parser.add_argument("--heightmap", help="use this .npy displacement map instead of generating one")
+    parser.add_argument("--map-size", type=int, default=4096, help="size of the generated displacement map")
+    parser.add_argument("--size", type=int, help="make a size x size thumbnail")
+    args = parser.parse_args()
+
+    if args.heightmap is None:
+        heights = heightmap_from_seed(args.seed, (args.map_size, args.map_size))
+    else:
+        heights = np.load(args.heightmap, mmap_mode="r")
+    render_preview(args.output, heights, args.seed, args.size)
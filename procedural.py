@@ -0,0 +1,91 @@
+"""
+Seed-derived procedural values
+
+These are the pure functions that turn a seed string into the values
+used by the rest of the code (colours, noise coordinates, displacement
+scale). They don't need Blender, so they can be used from anywhere.
+"""
+
+from typing import *
+
+import hashlib
+import colorsys
+
+
+def gen_data_from_hash(
+        key: str,
+        num_values: int = 16
+) -> List[float]:
+    """Get data (list of float between 0 and 1) from a key"""
+    hashed = hashlib.sha256(key.encode("utf-8")).digest()
+    as_bytes = [hashed[i:i + 2] for i in range(0, len(hashed), 2)]
+    data = [int.from_bytes(x, "big") for x in as_bytes]
+    data = [x / 65536 for x in data][:num_values]
+    return data
+
+
+def gen_color_from_seed(
+        seed: str
+) -> Tuple[float, float, float]:
+    """Generate color from seed"""
+    hue, sat = gen_data_from_hash(seed)[:2]
+    return colorsys.hsv_to_rgb(hue, sat, 255)
+
+
+def gen_noise_value_from_seed(
+        seed: str
+) -> float:
+    """Generate x and y coordinates for noise from seed"""
+    x = gen_data_from_hash(seed)[2]
+    return x * 1000
+
+
+def displacement_scale_value_from_seed(
+        seed: str
+) -> float:
+    """Generate displacement value from seed"""
+    x = gen_data_from_hash(seed)[3]
+    return 50 + (x * 25)
+
+
+def adjacent_color(
+        rgb_value: Tuple[float, float, float],
+        seed: str,
+        factor: float
+) -> Tuple[float, float, float]:
+    """Get adjacent color"""
+
+    def constrain(x, y, z):
+        """Constrain y between x and z"""
+        return min(max(y, x), z)
+
+    # Assumption: r, g, b in [0, 255]
+    hue, sat, val = colorsys.rgb_to_hsv(*rgb_value)
+    hue_change, sat_change, val_change = [
+        x - 0.5 for x in gen_data_from_hash(seed, 3)]
+    hue_change = hue_change * 0.1 * factor
+    sat_change = sat_change * 0.1 * factor
+    val_change = val_change * 32 * factor
+    hue = hue + hue_change
+    sat = sat + sat_change
+    val = val + val_change
+    hue = hue % 1
+    sat = constrain(0, sat, 1)
+    val = constrain(0, val, 255)
+    return colorsys.hsv_to_rgb(hue, sat, val)
+
+
+def adjacent_colors(
+        rgb_value: Tuple[float, float, float],
+        seed: str,
+        number: int,
+        factor: float = 2
+) -> List[Tuple[float, float, float]]:
+    """Get adjacent colours"""
+    colors = []
+    for i in range(number):
+        seed = str(gen_data_from_hash(str(seed), 4))
+        colors.append(
+            adjacent_color(rgb_value, seed, factor)
+        )
+    return colors
@@ -0,0 +1,186 @@
+"""
+Timing, memory and mesh size of each stage of a run
+
+When a run is slow or Blender stops responding, there's no way to tell
+which step it was in. Stages wrapped with Profiler.stage are:
+
+* logged when they start and end, to the "landscapes" logger and as one
+  JSON object per line to a log file
+* written to a trace file in the Chrome trace event format, which can
+  be opened in Perfetto (ui.perfetto.dev) or chrome://tracing
+
+Both files are written and flushed as the run goes, so if it hangs or
+crashes they still show the stage it was stuck in (the trace viewers
+accept a trace that was never closed). Each stage records its wall
+time, resident memory before and after, and any counters passed in,
+e.g. the vertex and face counts before and after a modifier.
+"""
+
+from typing import *
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import contextlib
+
+
+logger = logging.getLogger("landscapes")
+
+
+def _status_bytes(
+        field: str
+) -> Optional[int]:
+    """A memory field of /proc/self/status (like VmRSS) in bytes, None if not linux"""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024  # always in kB
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def rss() -> Optional[int]:
+    """Resident memory of this process in bytes, None if it can't be found
+
+    On linux this and peak_rss both come from /proc/self/status, so the
+    peak is never less than the current value.
+    """
+    current = _status_bytes("VmRSS")
+    if current is not None:
+        return current
+    try:
+        import psutil
+    except ImportError:
+        return None  # not linux, and no psutil
+    return psutil.Process().memory_info().rss
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of this process in bytes, None if unknown"""
+    peak = _status_bytes("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return None  # windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    """Records stages to a log file and a trace file (both optional)"""
+
+    def __init__(
+            self,
+            trace_path: Optional[str] = None,
+            log_path: Optional[str] = None,
+            listener: Optional[Callable[[Dict[str, Any]], None]] = None,
+            **metadata: Any
+    ) -> None:
+        self.metadata = metadata  # added to every log line, e.g. the seed
+        self.listener = listener  # also given every log line, e.g. to report progress
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+        self.stages = []  # (name, duration, counters) of finished stages
+        self._trace = None
+        self._trace_separator = "[\n"
+        self._log = None
+        for path in (trace_path, log_path):
+            if path is not None:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if trace_path is not None:
+            self._trace = open(trace_path, "w")
+            self._trace_event("process_name", "M", args={"name": "landscapes"})
+        if log_path is not None:
+            self._log = open(log_path, "a")
+
+    def _timestamp(self) -> float:
+        """Microseconds since the profiler was made"""
+        return (time.perf_counter() - self.start) * 1e6
+
+    def _trace_event(
+            self,
+            name: str,
+            phase: str,
+            **fields: Any
+    ) -> None:
+        """Write one trace event, straight to the file"""
+        if self._trace is None:
+            return
+        event = {"name": name, "ph": phase, "ts": self._timestamp(), "pid": self.pid,
+                 "tid": threading.get_ident(), **fields}
+        self._trace.write(self._trace_separator + json.dumps(event))
+        self._trace_separator = ",\n"
+        self._trace.flush()
+
+    def _log_event(
+            self,
+            event: str,
+            name: str,
+            **fields: Any
+    ) -> None:
+        """Write one structured log line, and tell the logger"""
+        record = {"time": time.time(), "event": event, "stage": name, **self.metadata, **fields}
+        if self._log is not None:
+            self._log.write(json.dumps(record) + "\n")
+            self._log.flush()
+        if self.listener is not None:
+            self.listener(record)
+        logger.info("%s %s %s", event, name, json.dumps(fields))
+
+    @contextlib.contextmanager
+    def stage(
+            self,
+            name: str,
+            **counters: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """Time a stage, yields a dict to add counters to as it goes
+
+            with profiler.stage("subsurf", vertices_before=4) as counters:
+                ...
+                counters["vertices_after"] = 66049
+        """
+        counters = dict(counters)
+        memory_before = rss()
+        self._log_event("begin", name, rss=memory_before, **counters)
+        self._trace_event(name, "B", args=counters)
+        self._trace_event("memory", "C", args={"rss": memory_before or 0})
+        start = time.perf_counter()
+        failed = None
+        try:
+            yield counters
+        except BaseException as error:
+            failed = repr(error)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            memory_after = rss()
+            if failed is not None:
+                counters["error"] = failed
+            self.stages.append((name, duration, counters))
+            self._trace_event(name, "E", args=counters)
+            self._trace_event("memory", "C", args={"rss": memory_after or 0})
+            self._log_event("end", name, duration=duration, rss=memory_after, peak_rss=peak_rss(), **counters)
+
+    def close(self) -> None:
+        """Finish the trace and log files"""
+        if self._trace is not None:
+            self._trace.write("\n]\n")
+            self._trace.close()
+            self._trace = None
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def summary(self) -> str:
+        """The stages so far and how long they took, one per line"""
+        return "\n".join(
+            f"{name:<24}  {duration:8.3f}s  " + "  ".join(f"{k}={v}" for k, v in counters.items())
+            for name, duration, counters in self.stages
+        )
@@ -0,0 +1,272 @@
+"""
+Right-triangulated irregular network (RTIN) for heightmaps
+
+A square grid of (2^k + 1) x (2^k + 1) heights is split into right
+triangles, and each triangle is only split further where that would
+make a vertical error bigger than some limit. This gives a simplified
+mesh without building the dense mesh first.
+
+This is the same algorithm as mapbox's "martini", with the error and
+triangle passes done a whole level at a time with NumPy. The one
+difference is the error: martini only measures the midpoint against the
+hypotenuse, which doesn't bound anything (a bump inside a triangle that
+misses the midpoint is never seen). Here the error of a triangle is the
+biggest distance of any grid point it covers from its own plane, so no
+grid point is further than max_error from the mesh. Measuring that
+looks at every grid point once per level, so the errors take
+O(n log n) for n grid points instead of O(n).
+"""
+
+from typing import *
+
+import numpy as np
+
+
+# triangles with at most this many grid points inside are measured a
+# point at a time, bigger ones a block of points at a time
+SMALL_TRIANGLE_POINTS = 32
+
+
+def _check_grid(
+        heights: np.ndarray
+) -> int:
+    """Return the grid size, or raise if it can't be used"""
+    size = heights.shape[0]
+    if heights.shape[1] != size or size < 3 or (size - 1) & (size - 2):
+        raise ValueError(f"RTIN needs a square 2^k + 1 grid, got {heights.shape}")
+    return size
+
+
+def _plane_errors(
+        blocks: np.ndarray,
+        corners: Sequence[Tuple[int, int]]
+) -> np.ndarray:
+    """Biggest distance of the grid points in a triangle from its plane
+
+    blocks are the (cell + 1) x (cell + 1) grid points of every cell,
+    and the triangle has the same corners (row, column offsets) in each,
+    so this gives one error per cell. Only the rectangle around the
+    triangle is looked at.
+    """
+    (ay, ax), (by, bx), (cy, cx) = corners
+    top, bottom = min(ay, by, cy), max(ay, by, cy)
+    left, right = min(ax, bx, cx), max(ax, bx, cx)
+    ys = np.arange(top, bottom + 1)[:, None]
+    xs = np.arange(left, right + 1)[None, :]
+
+    # grid points on the inside of (or on) all three edges
+    inside = np.ones((len(ys), xs.shape[1]), bool)
+    for (py, px), (qy, qx), (ry, rx) in ((corners[i], corners[i - 1], corners[i - 2]) for i in range(3)):
+        side = (qx - px) * (ys - py) - (qy - py) * (xs - px)
+        inside &= side * ((qx - px) * (ry - py) - (qy - py) * (rx - px)) >= 0
+
+    # the plane is z[0] + gy * y + gx * x from the first corner
+    z = [blocks[:, :, y, x] for y, x in corners]
+    (uy, ux), (vy, vx) = (by - ay, bx - ax), (cy - ay, cx - ax)
+    determinant = np.float32(uy * vx - ux * vy)
+    du, dv = z[1] - z[0], z[2] - z[0]
+    gy = (du * vx - dv * ux) / determinant
+    gx = (dv * uy - du * vy) / determinant
+
+    # small triangles have few points, which are quicker one at a time
+    # over every cell than with the (mostly tiny) blocks
+    if inside.sum() - 3 <= SMALL_TRIANGLE_POINTS:
+        error = np.zeros(z[0].shape, np.float32)
+        for y, x in np.argwhere(inside) + (top, left):
+            if (y, x) in corners:
+                continue
+            np.maximum(error, np.abs(blocks[:, :, y, x] - (z[0] + gy * (y - ay) + gx * (x - ax))), out=error)
+        return error
+
+    plane = z[0][..., None, None] + gy[..., None, None] * (ys - ay) + gx[..., None, None] * (xs - ax)
+    error = np.abs(blocks[:, :, top:bottom + 1, left:right + 1] - plane)
+    error *= inside
+    return error.max(axis=(2, 3))
+
+
+def midpoint_errors(
+        heights: np.ndarray
+) -> np.ndarray:
+    """Error of every grid point as a triangle midpoint
+
+    The error at a point is the biggest distance of any grid point from
+    the plane of a triangle it is the hypotenuse midpoint of, or the
+    error of any point below it in the hierarchy if that's bigger. A
+    triangle needs splitting when its midpoint's error is over the limit,
+    so every triangle that is kept is within the limit everywhere.
+    """
+    size = _check_grid(heights)
+    last = size - 1
+    h = heights.astype(np.float32)
+
+    # padded so children off the edge of the grid just read as 0
+    pad = max(last // 4, 1)
+    padded = np.zeros((size + 2 * pad, size + 2 * pad), np.float32)
+
+    def at(array, y, x, step, shape, offset=0):
+        """View of every step-th point from (y, x), `shape` points"""
+        return array[
+            offset + y:offset + y + step * (shape[0] - 1) + 1:step,
+            offset + x:offset + x + step * (shape[1] - 1) + 1:step
+        ]
+
+    cell = 2
+    while cell <= last:
+        half, quarter = cell // 2, cell // 4
+        cells = last // cell
+        blocks = np.lib.stride_tricks.sliding_window_view(h, (cell + 1, cell + 1))[::cell, ::cell]
+
+        # the triangles on the four edges of every cell, apex in the
+        # middle, the edge is their hypotenuse
+        sides = {
+            name: _plane_errors(blocks, corners)
+            for name, corners in (
+                ("bottom", ((0, 0), (0, cell), (half, half))),
+                ("top", ((cell, 0), (cell, cell), (half, half))),
+                ("left", ((0, 0), (cell, 0), (half, half))),
+                ("right", ((0, cell), (cell, cell), (half, half)))
+            )
+        }
+
+        # edge midpoints, the hypotenuse is the edge shared by two cells
+        horizontal = np.zeros((cells + 1, cells), np.float32)
+        horizontal[:-1] = sides["bottom"]
+        np.maximum(horizontal[1:], sides["top"], out=horizontal[1:])
+        vertical = np.zeros((cells, cells + 1), np.float32)
+        vertical[:, :-1] = sides["left"]
+        np.maximum(vertical[:, 1:], sides["right"], out=vertical[:, 1:])
+
+        for (my, mx), error, shape in (
+                ((0, half), horizontal, (cells + 1, cells)),
+                ((half, 0), vertical, (cells, cells + 1))
+        ):
+            if quarter:
+                for cy, cx in ((-quarter, -quarter), (-quarter, quarter), (quarter, -quarter), (quarter, quarter)):
+                    np.maximum(error, at(padded, my + cy, mx + cx, cell, shape, pad), out=error)
+            at(padded, my, mx, cell, shape, pad)[...] = error
+
+        # cell centres, the hypotenuse is the diagonal, which alternates
+        # like a checkerboard, and splits the cell into two triangles
+        shape = (cells, cells)
+        error = np.zeros(shape, np.float32)
+        for (y, x), diagonal in (
+                ((0, 0), ((0, 0), (cell, cell))), ((1, 1), ((0, 0), (cell, cell))),
+                ((0, 1), ((0, cell), (cell, 0))), ((1, 0), ((0, cell), (cell, 0)))
+        ):
+            # the two halves of every other cell
+            error[y::2, x::2] = np.maximum(*[
+                _plane_errors(blocks[y::2, x::2], diagonal + (corner,))
+                for corner in ((0, 0), (0, cell), (cell, 0), (cell, cell)) if corner not in diagonal
+            ])
+        for cy, cx in ((-half, 0), (half, 0), (0, -half), (0, half)):
+            np.maximum(error, at(padded, half + cy, half + cx, cell, shape, pad), out=error)
+        at(padded, half, half, cell, shape, pad)[...] = error
+
+        cell *= 2
+
+    return padded[pad:pad + size, pad:pad + size].copy()
+
+
+def _root_triangles(
+        size: int
+) -> np.ndarray:
+    """The two triangles covering the grid, as rows of ax, ay, bx, by, cx, cy
+
+    a to b is the hypotenuse and c is the right angle.
+    """
+    last = size - 1
+    return np.array([
+        [0, 0, last, last, last, 0],
+        [last, last, 0, 0, 0, last]
+    ], np.int32)
+
+
+def _split(
+        triangles: np.ndarray,
+        errors: np.ndarray,
+        max_error: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Split one level of triangles, returns (kept, children)"""
+    ax, ay, bx, by, cx, cy = triangles.T
+    mx = (ax + bx) // 2
+    my = (ay + by) // 2
+    splits = (np.abs(ax - cx) + np.abs(ay - cy) > 1) & (errors[my, mx] > max_error)
+
+    ax, ay, bx, by, cx, cy, mx, my = [v[splits] for v in (ax, ay, bx, by, cx, cy, mx, my)]
+    children = np.concatenate([
+        np.stack([cx, cy, ax, ay, mx, my], axis=1),
+        np.stack([bx, by, cx, cy, mx, my], axis=1)
+    ])
+    return triangles[~splits], children
+
+
+def triangles(
+        errors: np.ndarray,
+        max_error: float
+) -> Iterator[np.ndarray]:
+    """Triangles no grid point is more than max_error above or below
+
+    Yields arrays of (n, 3, 2) grid indices (row, column) of the
+    corners, one level of the hierarchy at a time, anticlockwise when
+    looking down with row 0 at -Y.
+    """
+    level = _root_triangles(_check_grid(errors))
+    while len(level):
+        kept, level = _split(level, errors, max_error)
+        if len(kept):
+            ax, ay, bx, by, cx, cy = kept.T
+            corners = np.stack([
+                np.stack([ay, ax], axis=1),
+                np.stack([by, bx], axis=1),
+                np.stack([cy, cx], axis=1)
+            ], axis=1)
+
+            # make them all anticlockwise
+            clockwise = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) < 0
+            corners[clockwise] = corners[clockwise][:, ::-1]
+            yield corners
+
+
+def triangle_count(
+        errors: np.ndarray,
+        max_error: float
+) -> int:
+    """Number of triangles for a given max_error, without making them
+
+    Every grid point except the four corners is the midpoint of either
+    one triangle (on the edge) or two, and each split adds one triangle.
+    """
+    splits = _split_weights(errors.shape[0])
+    return 2 + int(splits[errors > max_error].sum())
+
+
+def _split_weights(
+        size: int
+) -> np.ndarray:
+    """How many triangles get split at each grid point"""
+    weights = np.full((size, size), 2, np.int64)
+    weights[0, :] = weights[-1, :] = weights[:, 0] = weights[:, -1] = 1
+    weights[0, 0] = weights[0, -1] = weights[-1, 0] = weights[-1, -1] = 0
+    return weights
+
+
+def max_error_for_budget(
+        errors: np.ndarray,
+        budget: int
+) -> float:
+    """Smallest max_error that gives at most `budget` triangles"""
+    weights = _split_weights(errors.shape[0]).ravel()
+    order = np.argsort(errors, axis=None)[::-1]
+    values = errors.ravel()[order]
+    counts = 2 + np.cumsum(weights[order])
+
+    # points with the same error always split together
+    last_of_value = np.append(values[1:] != values[:-1], True)
+    values, counts = values[last_of_value], counts[last_of_value]
+    fits = np.nonzero(counts <= budget)[0]
+    if len(fits) == 0:
+        return float(values[0])
+    index = fits[-1]
+    if index + 1 < len(values):
+        return float(values[index + 1])
+    return -1.0
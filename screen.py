@@ -0,0 +1,210 @@
+"""
+Quick screening of seeds, before making anything expensive
+
+Most seeds make horrific landscapes / colour combinations, and finding
+out with a full bake and render is slow. This evaluates the terrain of
+every seed at a tiny size (64 x 64 by default, with heightmap.py) and
+works out some cheap measures of how it will look:
+
+* height range - how much relief there is, in blender units
+* roughness - how much of the terrain is pixel-scale noise, relative to
+  the height range
+* flat fraction - how much of it is (nearly) flat
+* palette contrast - spread in brightness of the seed palette
+
+Seeds outside the limits below are rejected, the rest are ranked by a
+score, and the best go in a shortlist with one seed per line, ready for
+`python batch.py <output dir> --seed-file shortlist.txt`.
+
+Usage (no Blender needed):
+    python screen.py shortlist.txt --range 0 100000 [--prefix seed-] [--top 100]
+    python screen.py shortlist.txt --seed-file seeds.txt --report metrics.jsonl
+"""
+
+from typing import *
+
+import json
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+from heightmap import evaluate_grids, pixel_coordinates
+from mesh import PLANE_SIZE
+import params
+import preview
+
+
+SCREEN_SIZE = 64
+SEEDS_PER_TASK = 32  # evaluated together in one worker
+
+# a pixel is flat below this slope (degrees)
+FLAT_SLOPE = 5
+
+# limits, seeds outside any of these are rejected
+MIN_HEIGHT_RANGE = 5.0
+MAX_ROUGHNESS = 0.04
+MAX_FLAT_FRACTION = 0.3
+MIN_PALETTE_CONTRAST = 16.0
+
+# ranking, each measure counts up to its weight
+GOOD_HEIGHT_RANGE = 40.0
+GOOD_PALETTE_CONTRAST = 64.0
+RANGE_WEIGHT = 1.0
+CONTRAST_WEIGHT = 1.0
+ROUGHNESS_WEIGHT = 0.5
+FLAT_WEIGHT = 0.5
+
+
+class Metrics(NamedTuple):
+    """How a seed did in the screening"""
+    seed: str
+    height_range: float
+    roughness: float
+    flat_fraction: float
+    palette_contrast: float
+    passed: bool
+    score: float
+
+
+def terrain_metrics(
+        heights: np.ndarray,
+        scales: np.ndarray,
+        size: float = PLANE_SIZE
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Height range, roughness and flat fraction of a stack of heightmaps
+
+    heights has shape (seeds, rows, columns) and scales is the
+    displacement strength of each.
+    """
+    z = heights * np.asarray(scales, np.float32)[:, None, None]
+    height_range = z.max(axis=(1, 2)) - z.min(axis=(1, 2))
+
+    # roughness, what's left after a 3 x 3 box blur
+    inner = z[:, 1:-1, 1:-1]
+    blurred = sum(
+        z[:, 1 + dy:z.shape[1] - 1 + dy, 1 + dx:z.shape[2] - 1 + dx]
+        for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+    ) / 9
+    roughness = np.sqrt(np.mean((inner - blurred) ** 2, axis=(1, 2))) / np.maximum(height_range, 1e-6)
+
+    dz_dy, dz_dx = np.gradient(z, size / heights.shape[2], axis=(1, 2))
+    flat = np.hypot(dz_dx, dz_dy) < np.tan(np.radians(FLAT_SLOPE))
+    return height_range, roughness, flat.mean(axis=(1, 2))
+
+
+def palette_contrast(
+        palettes: np.ndarray
+) -> np.ndarray:
+    """Spread in brightness (0 to 255) of palettes like preview.palette,
+    shape (seeds, bands, 3)"""
+    brightness = palettes.astype(np.float32) @ np.array([0.299, 0.587, 0.114], np.float32)
+    return brightness.max(axis=1) - brightness.min(axis=1)
+
+
+def _score(
+        height_range: float,
+        roughness: float,
+        flat_fraction: float,
+        contrast: float
+) -> Tuple[bool, float]:
+    """Whether a seed passes, and its score for ranking"""
+    passed = (
+        height_range >= MIN_HEIGHT_RANGE
+        and roughness <= MAX_ROUGHNESS
+        and flat_fraction <= MAX_FLAT_FRACTION
+        and contrast >= MIN_PALETTE_CONTRAST
+    )
+    score = (
+        RANGE_WEIGHT * min(height_range / GOOD_HEIGHT_RANGE, 1)
+        + CONTRAST_WEIGHT * min(contrast / GOOD_PALETTE_CONTRAST, 1)
+        - ROUGHNESS_WEIGHT * roughness / MAX_ROUGHNESS
+        - FLAT_WEIGHT * flat_fraction / MAX_FLAT_FRACTION
+    )
+    return passed, score
+
+
+def screen_seeds(
+        seeds: Sequence[str],
+        map_size: int = SCREEN_SIZE
+) -> List[Metrics]:
+    """Screen some seeds in this process, all evaluated together"""
+    values = params.seed_params(seeds, preview.ELEVATION_BANDS - 1)
+    coordinates = pixel_coordinates(map_size)
+    heights = evaluate_grids(values["noise_value"].tolist(), coordinates, coordinates)
+    palettes = np.concatenate([values["color"][:, None], values["palette"]], axis=1)
+
+    results = []
+    for seed, *measures in zip(seeds, *terrain_metrics(heights, values["displacement_scale"]),
+                               palette_contrast(palettes)):
+        height_range, roughness, flat_fraction, contrast = [float(x) for x in measures]
+        passed, score = _score(height_range, roughness, flat_fraction, contrast)
+        results.append(Metrics(seed, height_range, roughness, flat_fraction, contrast, passed, score))
+    return results
+
+
+def screen(
+        seeds: Sequence[str],
+        map_size: int = SCREEN_SIZE,
+        workers: Optional[int] = None,
+        seeds_per_task: int = SEEDS_PER_TASK
+) -> List[Metrics]:
+    """Screen lots of seeds over a process pool, in the same order"""
+    chunks = [seeds[i:i + seeds_per_task] for i in range(0, len(seeds), seeds_per_task)]
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for done, chunk in enumerate(executor.map(screen_seeds, chunks, [map_size] * len(chunks)), 1):
+            results.extend(chunk)
+            if done % 100 == 0 or done == len(chunks):
+                print(f"screened {len(results)} of {len(seeds)} seeds")
+    return results
+
+
+def shortlist(
+        results: Iterable[Metrics],
+        count: Optional[int] = None
+) -> List[Metrics]:
+    """The seeds that passed, best first (ties keep their order)"""
+    passed = sorted((x for x in results if x.passed), key=lambda x: -x.score)
+    return passed[:count]
+
+
+def seeds_from_args(
+        args: argparse.Namespace
+) -> List[str]:
+    """Make the list of seeds from the command line"""
+    if args.seeds:
+        return args.seeds
+    if args.seed_file:
+        with open(args.seed_file) as file:
+            return [line.strip() for line in file if line.strip()]
+    return [f"{args.prefix}{i}" for i in range(*args.range)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen seeds quickly and shortlist the good ones")
+    parser.add_argument("output", help="where to save the shortlist (one seed per line)")
+    seeds = parser.add_mutually_exclusive_group(required=True)
+    seeds.add_argument("--seeds", nargs="+")
+    seeds.add_argument("--seed-file", help="file with one seed per line")
+    seeds.add_argument("--range", nargs=2, type=int, metavar=("START", "STOP"),
+                       help="seeds <prefix><n> for n in range(START, STOP)")
+    parser.add_argument("--prefix", default="", help="seed prefix for --range")
+    parser.add_argument("--size", type=int, default=SCREEN_SIZE, help="heightmap size to screen at (64 to 128)")
+    parser.add_argument("--top", type=int, help="only keep this many seeds")
+    parser.add_argument("--workers", type=int, help="processes to use (default: all cores)")
+    parser.add_argument("--report", help="also save the metrics of every seed here (.jsonl)")
+    args = parser.parse_args()
+
+    results = screen(seeds_from_args(args), args.size, args.workers)
+    best = shortlist(results, args.top)
+    with open(args.output, "w") as file:
+        file.writelines(f"{x.seed}\n" for x in best)
+    if args.report:
+        with open(args.report, "w") as file:
+            file.writelines(json.dumps(x._asdict()) + "\n" for x in results)
+
+    print(f"{sum(x.passed for x in results)} of {len(results)} seeds passed, {len(best)} shortlisted")
+    for x in best[:10]:
+        print(f"{x.score:6.2f}  {x.seed:<24}  range {x.height_range:5.1f}  roughness {x.roughness:.3f}  "
+              f"flat {x.flat_fraction:.2f}  contrast {x.palette_contrast:5.1f}")
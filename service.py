@@ -0,0 +1,384 @@
+"""
+A long running service that makes landscapes on demand
+
+Running main.py or pipeline.py for one seed pays for starting Python,
+importing NumPy and the rest before any real work. This keeps a pool of
+worker processes running with all of that done (and warmed up with a
+tiny heightmap), so a request only costs the work itself.
+
+Requests come in over a local socket (TCP on localhost, or a unix
+socket) as one JSON object per line:
+
+    {"seed": "test2", "settings": {"map_size": 1024, "exports": ["glb"]}}
+
+settings are any of REQUEST_SETTINGS, on top of the service's own
+("erosion" is an object with any of erosion.Erosion, {} for the
+defaults), and numbers have to be within the limits there. Where the
+cache goes and how big it gets are up to the service, not the requests.
+The service answers with JSON lines for the job as it goes:
+
+    {"job": 1, "event": "queued", "seed": "test2"}
+    {"job": 1, "event": "begin", "stage": "heightmap", ...}
+    {"job": 1, "event": "end", "stage": "heightmap", "duration": 2.1, ...}
+    {"job": 1, "event": "done", "artifacts": {"model": ["/out/.../model.stl"]}, ...}
+
+or an "error" event if it failed. A connection can send any number of
+requests, and events of different jobs can be interleaved. Every seed
+and settings pair gets its own directory in the output directory, made
+with pipeline.py, so asking for the same seed again with the same
+settings reuses what was made, and the files a job sent back are never
+overwritten by a job with other settings (with --cache-dir, they still
+share the displacement map).
+
+Usage (no Blender needed):
+    python service.py serve <output dir> [--port 8765 | --socket /tmp/landscapes.sock] [--workers 4]
+    python service.py submit test2 [--port 8765 | --socket /tmp/landscapes.sock] [--map-size 1024]
+"""
+
+from typing import *
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+import concurrent.futures
+
+from heightmap import generate_heightmap
+from pipeline import Settings, EXPORT_STAGES
+from batch import settings_fingerprint
+from erosion import Erosion
+import pipeline
+import profiling
+
+
+DEFAULT_PORT = 8765
+
+# settings a request can change -> lowest and highest value, for numbers
+REQUEST_SETTINGS = {
+    "map_size": (16, 8192),
+    "subdivision_level": (1, 12),
+    "decimate_ratio": (0.0, 1.0),
+    "max_error": (0.0, float("inf")),
+    "thumbnail_size": (16, 2048),
+    "exports": None,
+    "erosion": None,
+    "layers": None
+}
+MAX_EROSION_ITERATIONS = 1000
+
+# set in every worker by _start_worker
+_events = None
+
+
+def job_directory(
+        output_dir: str,
+        seed: str,
+        settings: Settings
+) -> str:
+    """Where the files for a seed and settings go (seeds can have any characters in them)"""
+    key = f"{seed}\0{settings_fingerprint(settings)}"
+    return os.path.join(output_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:16])
+
+
+def _check_number(
+        name: str,
+        value: Any,
+        lowest: Union[int, float],
+        highest: Union[int, float]
+) -> None:
+    """Raise if a setting isn't a number from lowest to highest (a whole one if lowest is)"""
+    kind = int if isinstance(lowest, int) else (int, float)
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise ValueError(f"{name} must be {'a whole number' if kind is int else 'a number'}")
+    if not lowest <= value <= highest:
+        raise ValueError(f"{name} must be from {lowest} to {highest}")
+
+
+def settings_from_request(
+        defaults: Settings,
+        overrides: Dict[str, Any]
+) -> Settings:
+    """The service settings with a request's changes, raises on ones it can't make"""
+    unknown = set(overrides) - set(REQUEST_SETTINGS)
+    if unknown:
+        raise ValueError(f"settings a request can't change: {', '.join(sorted(unknown))}")
+    overrides = dict(overrides)
+    for name, limits in REQUEST_SETTINGS.items():
+        if limits is not None and name in overrides and not (name == "max_error" and overrides[name] is None):
+            _check_number(name, overrides[name], *limits)
+
+    if "exports" in overrides:
+        if not isinstance(overrides["exports"], list) or not set(overrides["exports"]) <= set(EXPORT_STAGES):
+            raise ValueError(f"exports must be a list of {', '.join(EXPORT_STAGES)}")
+        overrides["exports"] = tuple(overrides["exports"])
+    if overrides.get("erosion") is not None:
+        if not isinstance(overrides["erosion"], dict):
+            raise ValueError("erosion must be an object or null")
+        overrides["erosion"] = Erosion(**overrides["erosion"])
+        for name in ("thermal_iterations", "hydraulic_iterations"):
+            _check_number(f"erosion.{name}", getattr(overrides["erosion"], name), 0, MAX_EROSION_ITERATIONS)
+    if "layers" in overrides and not isinstance(overrides["layers"], bool):
+        raise ValueError("layers must be true or false")
+    return defaults._replace(**overrides)
+
+
+#  ------------------------------
+#  |          Workers           |
+#  ------------------------------
+
+
+def _start_worker(
+        events: multiprocessing.Queue
+) -> None:
+    """Get a worker ready, so the first job doesn't pay for it"""
+    global _events
+    _events = events
+    generate_heightmap(0.5, (8, 8))
+
+
+def _ready() -> int:
+    """Nothing, for waiting until a worker is up"""
+    return os.getpid()
+
+
+def _run_job(
+        job: int,
+        seed: str,
+        output_dir: str,
+        settings: Settings
+) -> Dict[str, Any]:
+    """Make everything for a seed, sending the stages as they start and end
+
+    Sends None for the job last, so the service knows it has every event.
+    """
+    start = time.perf_counter()
+    profiler = profiling.Profiler(listener=lambda record: _events.put((job, record)))
+    try:
+        reports = pipeline.run(seed, output_dir, settings, profiler=profiler)
+    finally:
+        _events.put((job, None))
+    outputs = {x.name: x.outputs for x in pipeline.STAGES}
+    return {
+        "directory": output_dir,
+        "artifacts": {x.name: [os.path.join(output_dir, y) for y in outputs[x.name]] for x in reports},
+        "cached": [x.name for x in reports if x.hit],
+        "info": {x.name: x.info for x in reports if x.info},
+        "wall_time": time.perf_counter() - start
+    }
+
+
+#  ------------------------------
+#  |          Service           |
+#  ------------------------------
+
+
+class Service:
+    """Takes requests and runs them on a pool of warm workers"""
+
+    def __init__(
+            self,
+            output_dir: str,
+            settings: Settings = Settings(),
+            workers: Optional[int] = None
+    ) -> None:
+        self.output_dir = output_dir
+        self.settings = settings
+        self.workers = workers or os.cpu_count()
+        self.events = multiprocessing.get_context("spawn").Queue()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_start_worker,
+            initargs=(self.events,)
+        )
+        self.listeners = {}  # job -> callback for its events
+        self.finished = {}  # job -> set once all its events were passed on
+        self.locks = {}  # directory -> lock, so one seed and settings are only made once at a time
+        self.lock_users = {}  # directory -> jobs holding or waiting for its lock
+        self.next_job = 1
+
+    async def start(self) -> None:
+        """Start every worker, and the task passing their events on"""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _ready) for _ in range(self.workers)])
+        self._forwarding = asyncio.create_task(self._forward_events())
+
+    async def _forward_events(self) -> None:
+        """Pass events from the workers to whoever asked for the job"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.events.get)
+            if item is None:
+                return
+            job, record = item
+            if record is None:
+                if job in self.finished:
+                    self.finished[job].set()
+            elif job in self.listeners:
+                self.listeners[job]({"job": job, **record})
+
+    async def run(
+            self,
+            seed: str,
+            overrides: Dict[str, Any],
+            send: Callable[[Dict[str, Any]], None]
+    ) -> None:
+        """Run one request, sending its events"""
+        job = self.next_job
+        self.next_job += 1
+        try:
+            settings = settings_from_request(self.settings, overrides)
+        except (TypeError, ValueError) as error:
+            send({"job": job, "event": "error", "seed": seed, "error": str(error)})
+            return
+
+        directory = job_directory(self.output_dir, seed, settings)
+        send({"job": job, "event": "queued", "seed": seed})
+        self.listeners[job] = send
+        self.finished[job] = asyncio.Event()
+        lock = self.locks.setdefault(directory, asyncio.Lock())
+        self.lock_users[directory] = self.lock_users.get(directory, 0) + 1
+        try:
+            async with lock:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, _run_job, job, seed, directory, settings
+                )
+            await self.finished[job].wait()
+            send({"job": job, "event": "done", "seed": seed, **result})
+        except Exception as error:
+            send({"job": job, "event": "error", "seed": seed, "error": repr(error)})
+        finally:
+            del self.listeners[job], self.finished[job]
+            self.lock_users[directory] -= 1
+            if not self.lock_users[directory]:
+                del self.locks[directory], self.lock_users[directory]
+
+    async def handle(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve one connection, every line is a request"""
+        def send(event):
+            writer.write((json.dumps(event) + "\n").encode("utf-8"))
+
+        jobs = []
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                seed, overrides = str(request["seed"]), request.get("settings", {})
+            except (ValueError, KeyError, TypeError) as error:
+                send({"event": "error", "error": f"bad request: {error!r}"})
+                continue
+            jobs.append(asyncio.create_task(self.run(seed, overrides, send)))
+        await asyncio.gather(*jobs)
+        await writer.drain()
+        writer.close()
+
+    def close(self) -> None:
+        """Stop the workers"""
+        self.events.put(None)
+        self.executor.shutdown()
+
+
+async def serve(
+        service: Service,
+        port: int = DEFAULT_PORT,
+        socket_path: Optional[str] = None
+) -> None:
+    """Warm up and serve requests until stopped"""
+    await service.start()
+    if socket_path is not None:
+        server = await asyncio.start_unix_server(service.handle, socket_path)
+    else:
+        server = await asyncio.start_server(service.handle, "127.0.0.1", port)
+    print(f"{service.workers} workers ready, listening on {socket_path or f'127.0.0.1:{port}'}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+async def submit(
+        seed: str,
+        settings: Optional[Dict[str, Any]] = None,
+        port: int = DEFAULT_PORT,
+        socket_path: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Ask a running service for a seed, yields its events up to "done" or "error" """
+    if socket_path is not None:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((json.dumps({"seed": seed, "settings": settings or {}}) + "\n").encode("utf-8"))
+    writer.write_eof()
+    try:
+        while line := await reader.readline():
+            event = json.loads(line)
+            yield event
+            if event["event"] in ("done", "error"):
+                return
+    finally:
+        writer.close()
+
+
+async def _print_events(
+        args: argparse.Namespace
+) -> None:
+    """Submit a seed from the command line and print what happens"""
+    settings = {}
+    if args.map_size is not None:
+        settings["map_size"] = args.map_size
+    if args.level is not None:
+        settings["subdivision_level"] = args.level
+    if args.exports:
+        settings["exports"] = args.exports
+    start = time.perf_counter()
+    async for event in submit(args.seed, settings, args.port, args.socket):
+        if event["event"] == "end":
+            print(f"{event['stage']:<10}  {event['duration']:.2f}s")
+        elif event["event"] == "done":
+            for name, paths in event["artifacts"].items():
+                print(f"{name:<10}  {'cached' if name in event['cached'] else 'made'}  {', '.join(paths)}")
+            print(f"done in {time.perf_counter() - start:.2f}s")
+        elif event["event"] == "error":
+            print(f"failed: {event['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make landscapes on demand with warm workers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the service")
+    serve_parser.add_argument("output_dir")
+    serve_parser.add_argument("--workers", type=int, help="processes to use (default: all cores)")
+    serve_parser.add_argument("--map-size", type=int, default=Settings().map_size)
+    serve_parser.add_argument("--level", type=int, default=Settings().subdivision_level)
+    serve_parser.add_argument("--cache-dir", help="keep displacement maps here and reuse them")
+
+    submit_parser = commands.add_parser("submit", help="ask a running service for a seed")
+    submit_parser.add_argument("seed")
+    submit_parser.add_argument("--map-size", type=int)
+    submit_parser.add_argument("--level", type=int)
+    submit_parser.add_argument("--exports", nargs="+", help="also save the model in these formats")
+
+    for command in (serve_parser, submit_parser):
+        address = command.add_mutually_exclusive_group()
+        address.add_argument("--port", type=int, default=DEFAULT_PORT, help="localhost port")
+        address.add_argument("--socket", help="unix socket path, instead of a port")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        os.makedirs(args.output_dir, exist_ok=True)
+        settings = Settings(map_size=args.map_size, subdivision_level=args.level, cache_dir=args.cache_dir)
+        try:
+            asyncio.run(serve(Service(os.path.abspath(args.output_dir), settings, args.workers),
+                              args.port, args.socket))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(_print_events(args))
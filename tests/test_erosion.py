@@ -0,0 +1,16 @@
+"""
+Erosion a tile at a time against the whole map as one tile
+"""
+
+import numpy as np
+
+import heightmap
+from erosion import Erosion, erode
+
+
+def test_tiles_match_one_tile():
+    heights = heightmap.generate_heightmap(0.3712, (48, 40))
+    erosion = Erosion(thermal_iterations=12, hydraulic_iterations=12)
+    whole = erode(heights, "seed", erosion, tile_size=64)
+    assert np.array_equal(erode(heights, "seed", erosion, tile_size=16), whole)
+    assert np.array_equal(erode(heights, "seed", erosion, tile_size=16, workers=3), whole)
@@ -0,0 +1,109 @@
+"""
+The NumPy noise against a plain Python port of Cycles' perlin_4d, and
+the tiled and batched ways of evaluating it against the plain one
+"""
+
+import math
+
+import numpy as np
+
+import heightmap
+
+
+MASK = 0xFFFFFFFF
+
+
+def _rot(x, k):
+    return ((x << k) | (x >> (32 - k))) & MASK
+
+
+def _hash_uint4(kx, ky, kz, kw):
+    """Cycles hash_uint4 (Jenkins lookup3)"""
+    a = b = c = (0xDEADBEEF + (4 << 2) + 13) & MASK
+    c = (c + kz) & MASK
+    b = (b + ky) & MASK
+    a = (a + kx) & MASK
+
+    a = (a - c) & MASK; a ^= _rot(c, 4); c = (c + b) & MASK
+    b = (b - a) & MASK; b ^= _rot(a, 6); a = (a + c) & MASK
+    c = (c - b) & MASK; c ^= _rot(b, 8); b = (b + a) & MASK
+    a = (a - c) & MASK; a ^= _rot(c, 16); c = (c + b) & MASK
+    b = (b - a) & MASK; b ^= _rot(a, 19); a = (a + c) & MASK
+    c = (c - b) & MASK; c ^= _rot(b, 4); b = (b + a) & MASK
+
+    a = (a + kw) & MASK
+    c ^= b; c = (c - _rot(b, 14)) & MASK
+    a ^= c; a = (a - _rot(c, 11)) & MASK
+    b ^= a; b = (b - _rot(a, 25)) & MASK
+    c ^= b; c = (c - _rot(b, 16)) & MASK
+    a ^= c; a = (a - _rot(c, 4)) & MASK
+    b ^= a; b = (b - _rot(a, 14)) & MASK
+    c ^= b; c = (c - _rot(b, 24)) & MASK
+    return c
+
+
+def _grad4(h, x, y, z, w):
+    h &= 31
+    u = x if h < 24 else y
+    v = y if h < 16 else z
+    s = z if h < 8 else w
+    return (-u if h & 1 else u) + (-v if h & 2 else v) + (-s if h & 4 else s)
+
+
+def _fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def _mix(a, b, t):
+    return (1 - t) * a + t * b
+
+
+def perlin_4d(x, y, z, w):
+    """Cycles perlin_4d, one point at a time"""
+    cells = [math.floor(v) for v in (x, y, z, w)]
+    fx, fy, fz, fw = [v - cell for v, cell in zip((x, y, z, w), cells)]
+    X, Y, Z, W = [cell & MASK for cell in cells]
+
+    def corner(dx, dy, dz, dw):
+        h = _hash_uint4((X + dx) & MASK, (Y + dy) & MASK, (Z + dz) & MASK, (W + dw) & MASK)
+        return _grad4(h, fx - dx, fy - dy, fz - dz, fw - dw)
+
+    def bi_mix(dz, dw):
+        return _mix(
+            _mix(corner(0, 0, dz, dw), corner(1, 0, dz, dw), _fade(fx)),
+            _mix(corner(0, 1, dz, dw), corner(1, 1, dz, dw), _fade(fx)),
+            _fade(fy)
+        )
+
+    def tri_mix(dw):
+        return _mix(bi_mix(0, dw), bi_mix(1, dw), _fade(fz))
+
+    return _mix(tri_mix(0), tri_mix(1), _fade(fw))
+
+
+def test_perlin_4d_grid_matches_cycles():
+    x = np.array([-3.7, -0.2, 0.3, 1.55, 12.9], np.float32)
+    y = np.array([-1.4, 0.05, 0.45, 7.8], np.float32)
+    for z, w in [(0.5, 0.25), (0.15, 812.7), (-2.6, -0.85)]:
+        z, w = np.float32(z), np.float32(w)
+        grid = heightmap._perlin_4d_grid(x, y, z, w)
+        expected = [[perlin_4d(float(i), float(j), float(z), float(w)) for i in x] for j in y]
+        np.testing.assert_allclose(grid, expected, atol=1e-5)
+
+
+def test_tiled_heightmap_matches_whole(tmp_path):
+    noise_value = 0.3712
+    max_memory = 192 * 500
+    assert heightmap.tile_shape((80, 96), max_memory) < (80, 96)  # really more than one tile
+    heightmap.write_heightmap_tiled(noise_value, (96, 80), str(tmp_path / "tiled.npy"), max_memory)
+    tiled = np.load(tmp_path / "tiled.npy")
+    assert np.array_equal(tiled, heightmap.generate_heightmap(noise_value, (96, 80)))
+
+
+def test_evaluate_grids_matches_one_at_a_time():
+    noise_values = [0.05, 0.3712, 0.99]
+    u = heightmap.pixel_coordinates(40)
+    v = heightmap.pixel_coordinates(24)
+    together = heightmap.evaluate_grids(noise_values, u, v)
+    for noise_value, heights in zip(noise_values, together):
+        assert np.array_equal(heights, heightmap.evaluate_grid(noise_value, u, v))
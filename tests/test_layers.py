@@ -0,0 +1,15 @@
+"""
+The derived layers worked out a band of rows at a time against all at once
+"""
+
+import numpy as np
+
+import heightmap
+import layers
+
+
+def test_bands_match_one_pass():
+    heights = heightmap.generate_heightmap(0.3712, (48, 40))
+    whole = layers.derive(heights, "seed", rows_per_band=len(heights))
+    for rows_per_band in (1, 7, 16, 47):
+        assert np.array_equal(layers.derive(heights, "seed", rows_per_band=rows_per_band), whole)
@@ -0,0 +1,29 @@
+"""
+The streaming and parallel stl writers against the plain one
+"""
+
+import numpy as np
+
+import mesh
+
+
+def stl_bytes(
+        path
+) -> bytes:
+    """Everything in a file"""
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_stream_and_parallel_stl_match(tmp_path, monkeypatch):
+    heights = np.cumsum(np.random.default_rng(3).normal(0, 0.01, (65, 65)), axis=0).astype(np.float32)
+    mesh.write_heightmap_stl(str(tmp_path / "plain.stl"), heights, 3.5)
+    expected = stl_bytes(tmp_path / "plain.stl")
+
+    bands = ((start, heights[start:start + 7]) for start in range(0, len(heights), 7))
+    mesh.write_heightmap_stl_stream(str(tmp_path / "stream.stl"), bands, heights.shape, 3.5)
+    assert stl_bytes(tmp_path / "stream.stl") == expected
+
+    monkeypatch.setattr(mesh, "ROWS_PER_TASK", 8)  # several strips
+    mesh.write_heightmap_stl_parallel(str(tmp_path / "parallel.stl"), heights, 3.5, workers=2)
+    assert stl_bytes(tmp_path / "parallel.stl") == expected
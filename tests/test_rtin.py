@@ -0,0 +1,52 @@
+"""
+The simplified mesh against the grid it was made from
+"""
+
+import numpy as np
+import pytest
+
+import rtin
+
+
+def mesh_deviation(
+        heights: np.ndarray,
+        triangles: np.ndarray
+) -> float:
+    """Biggest vertical distance of any grid point from the mesh triangle it is in"""
+    size = heights.shape[0]
+    ys, xs = np.mgrid[0:size, 0:size]
+    worst = np.zeros(heights.shape)
+    covered = np.zeros(heights.shape, bool)
+    for corners in triangles:
+        (ay, ax), (by, bx), (cy, cx) = corners.astype(float)
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        u = ((bx - xs) * (cy - ys) - (by - ys) * (cx - xs)) / area
+        v = ((cx - xs) * (ay - ys) - (cy - ys) * (ax - xs)) / area
+        w = 1 - u - v
+        inside = (u >= -1e-9) & (v >= -1e-9) & (w >= -1e-9)
+        surface = u * heights[tuple(corners[0])] + v * heights[tuple(corners[1])] + w * heights[tuple(corners[2])]
+        worst = np.where(inside, np.maximum(worst, np.abs(heights - surface)), worst)
+        covered |= inside
+    assert covered.all()
+    return float(worst.max())
+
+
+@pytest.mark.parametrize("size, max_error, seed", [(17, 5.0, 5), (17, 50.0, 2), (33, 20.0, 0), (65, 20.0, 3)])
+def test_mesh_is_within_max_error(size, max_error, seed):
+    # rough terrain-like surfaces, noise summed along both axes, where
+    # bumps between the midpoints are common
+    noise = np.random.default_rng(seed).normal(0, 5, (size, size))
+    heights = np.cumsum(np.cumsum(noise, axis=0), axis=1).astype(np.float32)
+    errors = rtin.midpoint_errors(heights)
+    triangles = np.concatenate(list(rtin.triangles(errors, max_error)))
+    assert len(triangles) == rtin.triangle_count(errors, max_error)
+    assert mesh_deviation(heights, triangles) <= max_error + 1e-4
+
+
+def test_smooth_surface_simplifies():
+    ys, xs = np.mgrid[0:65, 0:65] / 64
+    heights = (np.sin(xs * 3) + ys * ys).astype(np.float32)
+    errors = rtin.midpoint_errors(heights)
+    triangles = np.concatenate(list(rtin.triangles(errors, 0.01)))
+    assert len(triangles) < 2 * 64 * 64 / 4
+    assert mesh_deviation(heights, triangles) <= 0.01 + 1e-6
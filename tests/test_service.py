@@ -0,0 +1,41 @@
+"""
+Requests to the service for the same seed with other settings
+"""
+
+import asyncio
+import hashlib
+
+from pipeline import Settings
+from service import Service
+
+
+def file_digests(
+        artifacts: dict
+) -> dict:
+    """sha256 of every file a job sent back"""
+    digests = {}
+    for paths in artifacts.values():
+        for path in paths:
+            with open(path, "rb") as file:
+                digests[path] = hashlib.sha256(file.read()).hexdigest()
+    return digests
+
+
+def test_other_settings_leave_earlier_files_alone(tmp_path):
+    async def requests():
+        service = Service(str(tmp_path), Settings(map_size=64, subdivision_level=4, thumbnail_size=16), workers=1)
+        await service.start()
+        try:
+            first, second = [], []
+            await service.run("same seed", {}, first.append)
+            before = file_digests(first[-1]["artifacts"])
+            await service.run("same seed", {"map_size": 128, "subdivision_level": 5, "exports": ["ply"]},
+                              second.append)
+            return first[-1], before, second[-1]
+        finally:
+            service.close()
+
+    first, before, second = asyncio.run(requests())
+    assert first["event"] == second["event"] == "done"
+    assert before and first["directory"] != second["directory"]
+    assert file_digests(first["artifacts"]) == before